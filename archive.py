@@ -0,0 +1,159 @@
+"""
+Cold storage for old rows: reviewed posts and answered feedback older than
+ARCHIVE_AFTER_DAYS move from the bot database to ARCHIVE_DATABASE_PATH,
+attached to the connection as `archive`.
+
+Rows move in batches of ARCHIVE_BATCH_SIZE with ARCHIVE_BATCH_PAUSE seconds
+between them, so handlers never wait long for the write lock. Every batch is
+first copied and committed to the archive, then deleted from the bot
+database: with WAL a transaction over two attached databases is not atomic,
+and this order can only leave a row in both (readers skip the archive copy,
+the next run deletes the hot one), never in neither.
+
+User counters (submitted/approved/rejected posts, reputation) are stored on
+users and do not change. Pending posts, unanswered feedback and posts still
+waiting in the publication queue are never archived. Moderation flags and
+image/text hashes stay in the bot database, so duplicates of archived posts
+are still detected.
+
+Command line:
+    python archive.py run [--days 90] [--vacuum]
+    python archive.py stats
+"""
+import argparse
+import logging
+import sqlite3
+import time
+from typing import Dict, List
+
+from config import (
+    ARCHIVE_DATABASE_PATH,
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_BATCH_PAUSE
+)
+from database import get_db_connection, sync_archive_schema, ARCHIVED_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Rows of each table ready for the archive, `?` is the age modifier ('-90 days')
+ELIGIBLE = {
+    'posts': """
+        status IN ('approved', 'rejected')
+        AND COALESCE(reviewed_at, created_at) < datetime('now', ?)
+        AND post_id NOT IN (
+            SELECT post_id FROM main.publication_queue WHERE status IN ('queued', 'sending')
+        )
+    """,
+    'feedback': """
+        admin_response IS NOT NULL
+        AND COALESCE(responded_at, created_at) < datetime('now', ?)
+    """,
+}
+
+
+def open_archive(conn: sqlite3.Connection):
+    """Attach the archive database, creating it on the first run"""
+    conn.execute("ATTACH DATABASE ? AS archive", (str(ARCHIVE_DATABASE_PATH),))
+    conn.execute("PRAGMA archive.journal_mode=WAL")
+    sync_archive_schema(conn)
+
+
+def move_batch(conn: sqlite3.Connection, table: str, age: str, batch_size: int) -> int:
+    """Move up to `batch_size` eligible rows of the table, returns how many were moved"""
+    id_column = ARCHIVED_TABLES[table]
+    condition = ELIGIBLE[table]
+    ids: List[int] = [
+        row[0] for row in conn.execute(
+            f"SELECT {id_column} FROM main.{table} WHERE {condition} LIMIT ?", (age, batch_size)
+        )
+    ]
+    if not ids:
+        return 0
+    placeholders = ", ".join("?" * len(ids))
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(
+        f"INSERT OR REPLACE INTO archive.{table} SELECT * FROM main.{table} WHERE {id_column} IN ({placeholders})",
+        ids
+    )
+    conn.commit()
+
+    # Rows changed since the copy (e.g. a feedback answered again) no longer match and stay
+    conn.execute("BEGIN IMMEDIATE")
+    cursor = conn.execute(
+        f"DELETE FROM main.{table} WHERE {id_column} IN ({placeholders}) AND {condition}",
+        ids + [age]
+    )
+    moved = cursor.rowcount
+    conn.commit()
+    return moved
+
+
+def archive_old_rows(days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                     pause: float = ARCHIVE_BATCH_PAUSE) -> Dict[str, int]:
+    """Move old rows to the archive (blocking, run in an executor), returns rows moved per table"""
+    age = f"-{days} days"
+    moved = {table: 0 for table in ARCHIVED_TABLES}
+    started = time.monotonic()
+    with get_db_connection() as conn:
+        open_archive(conn)
+        for table in ARCHIVED_TABLES:
+            while True:
+                count = move_batch(conn, table, age, batch_size)
+                moved[table] += count
+                if count < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+        free_pages = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA main.page_size").fetchone()[0]
+
+    # Freed pages are reused by new rows; the file only shrinks with `archive.py run --vacuum`
+    logger.info(
+        "Archived %s posts and %s feedback messages older than %s days in %.1f s, %.1f MB free in the database",
+        moved['posts'], moved['feedback'], days, time.monotonic() - started, free_pages * page_size / 1024 / 1024
+    )
+    return moved
+
+
+def archive_stats() -> Dict[str, tuple]:
+    """(rows in the bot database, rows in the archive) per table"""
+    stats = {}
+    with get_db_connection() as conn:
+        open_archive(conn)
+        for table in ARCHIVED_TABLES:
+            hot = conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]
+            cold = conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0]
+            stats[table] = (hot, cold)
+    return stats
+
+
+def vacuum():
+    """Shrink the bot database file (blocks all writers while it runs, stop the bot first)"""
+    with get_db_connection() as conn:
+        conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold storage of old posts and feedback")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="archive old rows now")
+    run_parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    run_parser.add_argument("--vacuum", action="store_true", help="shrink the database afterwards (bot stopped)")
+    commands.add_parser("stats", help="rows in the database and in the archive")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "run":
+        moved = archive_old_rows(days=args.days)
+        print(f"Archived {moved['posts']} posts, {moved['feedback']} feedback messages")
+        if args.vacuum:
+            vacuum()
+    else:
+        for table, (hot, cold) in archive_stats().items():
+            print(f"{table}: {hot} in the database, {cold} in the archive")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Online backups of the bot database with the SQLite backup API.
+
+The scheduled job copies BACKUP_PAGES_PER_STEP pages at a time and sleeps
+BACKUP_STEP_SLEEP seconds between steps. In WAL mode (set by init_db) the
+copy is made from a read transaction held for the whole backup: it is a
+consistent snapshot and writers are never blocked, only checkpoints wait for
+it. Snapshots are verified with PRAGMA integrity_check before they replace
+the oldest one (BACKUP_KEEP are kept in BACKUP_DIR).
+
+Command line (restore only with the bot stopped):
+    python backup.py create
+    python backup.py list
+    python backup.py restore backups/database-20240101-030000.db
+"""
+import argparse
+import logging
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from config import (
+    DATABASE_PATH,
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    BACKUP_PAGES_PER_STEP,
+    BACKUP_STEP_SLEEP
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATTERN = "database-*.db"
+
+
+class BackupResult:
+    __slots__ = ("path", "size", "pages", "duration", "restarts")
+
+    def __init__(self, path: Path, size: int, pages: int, duration: float, restarts: int):
+        self.path = path
+        self.size = size
+        self.pages = pages
+        self.duration = duration
+        self.restarts = restarts  # Times the copy started over because the source changed
+
+
+class BackupError(Exception):
+    """Snapshot failed verification"""
+
+
+def verify(path: Path):
+    """Raise BackupError if the database file is damaged"""
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    if rows != ["ok"]:
+        raise BackupError(f"integrity check of {path.name} failed: {'; '.join(rows[:5])}")
+
+
+def copy_database(source: Path, target: Path, pages: int = BACKUP_PAGES_PER_STEP,
+                  step_sleep: float = BACKUP_STEP_SLEEP) -> tuple:
+    """Copy `source` into `target` step by step, returns (pages copied, restarts)"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    state = {'total': 0, 'remaining': None, 'restarts': 0}
+
+    def progress(status, remaining, total):
+        # A source modified by another connection makes the copy start over
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+        state['remaining'] = remaining
+        state['total'] = total
+        if remaining and step_sleep:
+            time.sleep(step_sleep)
+
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            # Read transaction for the whole copy: one snapshot, no restarts
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=progress)
+    finally:
+        src.close()
+        dst.close()
+    return state['total'], state['restarts']
+
+
+def list_snapshots(directory: Path = BACKUP_DIR) -> List[Path]:
+    """Snapshots in the directory, oldest first (names sort by time)"""
+    return sorted(Path(directory).glob(SNAPSHOT_PATTERN))
+
+
+def rotate(directory: Path = BACKUP_DIR, keep: int = BACKUP_KEEP) -> List[Path]:
+    """Delete all but the `keep` newest snapshots"""
+    snapshots = list_snapshots(directory)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        path.unlink()
+    return removed
+
+
+def create_backup(source: Path = DATABASE_PATH, directory: Path = BACKUP_DIR,
+                  keep: int = BACKUP_KEEP) -> BackupResult:
+    """Write a verified snapshot of the database and rotate old ones (blocking, run in an executor)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"database-{datetime.now():%Y%m%d-%H%M%S}.db"
+    partial = path.with_name(path.name + ".partial")
+
+    started = time.monotonic()
+    try:
+        pages, restarts = copy_database(Path(source), partial)
+        verify(partial)
+    except Exception:
+        partial.unlink(missing_ok=True)
+        raise
+    partial.rename(path)
+    result = BackupResult(path, path.stat().st_size, pages, time.monotonic() - started, restarts)
+    removed = rotate(directory, keep)
+
+    metrics.backup_last_success.set(time.time())
+    metrics.backup_size.set(result.size)
+    metrics.backup_duration.set(result.duration)
+    logger.info(
+        "Backup %s: %.1f MB, %s pages in %.1f s (%s restarts), integrity ok, %s old snapshots removed",
+        path.name, result.size / 1024 / 1024, pages, result.duration, restarts, len(removed)
+    )
+    return result
+
+
+def restore(snapshot: Path, target: Path = DATABASE_PATH) -> Optional[Path]:
+    """
+    Replace the database with a snapshot; the bot must be stopped. The current
+    database is first saved next to it, that copy's path is returned.
+    """
+    snapshot, target = Path(snapshot), Path(target)
+    verify(snapshot)
+    saved = None
+    if target.exists():
+        saved = target.with_name(f"{target.name}.before-restore-{datetime.now():%Y%m%d-%H%M%S}")
+        copy_database(target, saved, pages=-1, step_sleep=0)
+    # Through the backup API, so the target's WAL is reset along with the pages
+    copy_database(snapshot, target, pages=-1, step_sleep=0)
+    verify(target)
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database backups")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="write a snapshot now")
+    commands.add_parser("list", help="show snapshots")
+    restore_parser = commands.add_parser("restore", help="replace the database with a snapshot (bot stopped)")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--target", default=str(DATABASE_PATH))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.command == "create":
+        result = create_backup()
+        print(f"{result.path} ({result.size / 1024 / 1024:.1f} MB, {result.duration:.1f} s)")
+    elif args.command == "list":
+        for path in list_snapshots():
+            print(f"{path}  {path.stat().st_size / 1024 / 1024:.1f} MB")
+    else:
+        try:
+            saved = restore(Path(args.snapshot), Path(args.target))
+        except (BackupError, sqlite3.Error) as e:
+            print(f"Restore failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Restored {args.target} from {args.snapshot}" + (f", previous database saved as {saved}" if saved else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the Aho-Corasick blocklist with naive per-pattern scanning.
+
+Usage: python benchmarks/bench_blocklist.py [--patterns 5000] [--texts 2000]
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from blocklist import Blocklist  # noqa: E402
+
+
+def random_word(rng: random.Random, min_len: int = 4, max_len: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_patterns(rng: random.Random, count: int):
+    patterns = []
+    for i in range(count):
+        kind = i % 10
+        if kind < 6:
+            patterns.append(random_word(rng))
+        elif kind < 9:
+            patterns.append(f"{random_word(rng)}.{rng.choice(['com', 'ru', 'io', 'xyz'])}")
+        else:
+            patterns.append(f"{random_word(rng)}*{random_word(rng)}")
+    return patterns
+
+
+def make_texts(rng: random.Random, patterns, count: int, hit_rate: float = 0.3):
+    texts = []
+    for _ in range(count):
+        words = [random_word(rng, 2, 9) for _ in range(rng.randint(20, 80))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(patterns).replace("*", " "))
+        texts.append(" ".join(words))
+    return texts
+
+
+def compile_naive(patterns):
+    """One precompiled regex per pattern, same matching rules as Blocklist"""
+    compiled = []
+    for pattern in patterns:
+        if "*" in pattern:
+            regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+        elif re.match(r"^\w+$", pattern):
+            regex = rf"(?<!\w){re.escape(pattern)}(?!\w)"
+        else:
+            regex = re.escape(pattern)
+        compiled.append((pattern, re.compile(regex)))
+    return compiled
+
+
+def naive_find(compiled, text: str):
+    lowered = text.lower()
+    for pattern, regex in compiled:
+        if regex.search(lowered):
+            return pattern
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patterns", type=int, default=5000)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    patterns = make_patterns(rng, args.patterns)
+    texts = make_texts(rng, patterns, args.texts)
+
+    started = time.perf_counter()
+    blocklist = Blocklist(path=Path("/nonexistent"))
+    blocklist.load(patterns)
+    build_time = time.perf_counter() - started
+    blocklist.checked_at = float("inf")  # no file reloads during the run
+
+    started = time.perf_counter()
+    automaton_hits = sum(1 for text in texts if blocklist.find(text))
+    automaton_time = time.perf_counter() - started
+
+    compiled = compile_naive(patterns)
+    started = time.perf_counter()
+    naive_hits = sum(1 for text in texts if naive_find(compiled, text))
+    naive_time = time.perf_counter() - started
+
+    print(f"patterns: {len(patterns)}, texts: {len(texts)}")
+    print(f"automaton build: {build_time * 1000:.1f} ms")
+    print(f"aho-corasick: {automaton_time / len(texts) * 1e6:9.1f} us/text, {automaton_hits} hits")
+    print(f"naive scan:   {naive_time / len(texts) * 1e6:9.1f} us/text, {naive_hits} hits")
+    print(f"speedup: {naive_time / automaton_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
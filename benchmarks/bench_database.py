@@ -0,0 +1,322 @@
+"""
+Database method micro-benchmarks on synthetic data at realistic scale.
+
+The generator fills users, posts and feedback with bulk inserts:
+- submitters follow a power law: a few heavy users own most of the posts,
+  most users have posted once or never;
+- post statuses are skewed: mostly approved, a third rejected, a small
+  pending queue; the newest posts are the pending ones;
+- history spans --years years with timestamps growing with ids;
+- a small share of feedback is still waiting for a response.
+User counters and reputation are then derived from the posts, as the bot
+keeps them. Generated databases are kept in --data-dir (keyed by scale and
+seed) and copied before every run, as the write benchmarks modify them.
+
+Each Database method is called with seeded random arguments for --time
+seconds (at least --min-calls times); results go to a JSON file that can be
+compared with the one from another commit via --compare.
+
+Usage:
+    python benchmarks/bench_database.py --scales 10k,1m [--output after.json] [--compare before.json]
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+BATCH_SIZE = 50000
+STATUS_WEIGHTS = (("approved", 0.68), ("rejected", 0.30))  # The rest (newest posts) is pending
+PENDING_SHARE = 0.02
+FEEDBACK_PENDING_SHARE = 0.05
+WORDS = (
+    "кот", "мем", "новость", "город", "погода", "вечер", "фото", "друзья", "музыка", "лето",
+    "работа", "выходные", "кофе", "дорога", "море", "книга", "сериал", "праздник", "утро", "снег"
+)
+
+
+def parse_scale(value: str) -> int:
+    """Number of posts: 10k, 1m, 10m or a plain number"""
+    multipliers = {"k": 1000, "m": 1000000}
+    value = value.strip().lower()
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def table_sizes(posts: int) -> dict:
+    return {'users': max(posts // 20, 100), 'posts': posts, 'feedback': max(posts // 10, 10)}
+
+
+def random_text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+
+
+def timestamps(count: int, years: float, rng: random.Random):
+    """Increasing timestamps over the history, with some jitter"""
+    start = datetime(2024, 1, 1) - timedelta(days=365 * years)
+    step = 365 * 86400 * years / max(count, 1)
+    for number in range(count):
+        yield (start + timedelta(seconds=number * step + rng.random() * step)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def batches(rows, size: int = BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(path: Path, posts: int, seed: int, years: float):
+    """Create a database with the bot's schema filled with synthetic data"""
+    import database
+    database.DATABASE_PATH = str(path)
+    database.init_db()
+
+    rng = random.Random(seed)
+    sizes = table_sizes(posts)
+    users = sizes['users']
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+
+    def user_rows():
+        for number, created_at in enumerate(timestamps(users, years, rng)):
+            telegram_id = 100000000 + number
+            yield telegram_id, f"user{telegram_id}", f"User {number}", created_at
+
+    def post_rows():
+        first_pending = int(posts * (1 - PENDING_SHARE))
+        for number, created_at in enumerate(timestamps(posts, years, rng)):
+            # Power law: user 1 submits the most, the long tail rarely
+            user_id = int(users * rng.random() ** 3) + 1
+            if number >= first_pending:
+                status, reviewed_at, reviewed_by = "pending", None, None
+            else:
+                status = "approved" if rng.random() < STATUS_WEIGHTS[0][1] / (1 - PENDING_SHARE) else "rejected"
+                reviewed_at, reviewed_by = created_at, 1
+            priority = 1 if status == "pending" and user_id <= users // 100 else 0
+            yield (
+                user_id, random_text(rng), f"file{number}", f"unique{number}", status, created_at,
+                reviewed_at, reviewed_by, priority, f"{100000000 + user_id - 1}:{number}"
+            )
+
+    def feedback_rows():
+        count = sizes['feedback']
+        first_pending = int(count * (1 - FEEDBACK_PENDING_SHARE))
+        for number, created_at in enumerate(timestamps(count, years, rng)):
+            user_id = int(users * rng.random() ** 2) + 1
+            responded = number < first_pending
+            yield (
+                user_id, random_text(rng), "Спасибо, учтём" if responded else None, 1 if responded else None,
+                created_at, created_at if responded else None, f"f{100000000 + user_id - 1}:{number}"
+            )
+
+    with conn:
+        for batch in batches(user_rows()):
+            conn.executemany(
+                "INSERT INTO users (telegram_id, username, full_name, created_at) VALUES (?, ?, ?, ?)", batch
+            )
+        for batch in batches(post_rows()):
+            conn.executemany(
+                """INSERT INTO posts (user_id, text_content, image_file_id, image_unique_id, status, created_at,
+                                      reviewed_at, reviewed_by, priority, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                batch
+            )
+        for batch in batches(feedback_rows()):
+            conn.executemany(
+                """INSERT INTO feedback (user_id, message, admin_response, responded_by, created_at,
+                                         responded_at, idempotency_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                batch
+            )
+        # Counters the bot maintains incrementally
+        conn.execute("""
+            UPDATE users SET
+                submitted_posts = s.submitted, approved_posts = s.approved, rejected_posts = s.rejected
+            FROM (
+                SELECT user_id, COUNT(*) AS submitted,
+                       SUM(status = 'approved') AS approved, SUM(status = 'rejected') AS rejected
+                FROM posts GROUP BY user_id
+            ) AS s
+            WHERE users.internal_id = s.user_id
+        """)
+        conn.execute(f"UPDATE users SET reputation = {database.REPUTATION_FORMULA}")
+        conn.execute("UPDATE users SET role = 'admin' WHERE internal_id = 1")
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def prepare(data_dir: Path, posts: int, seed: int, years: float) -> tuple:
+    """Path of the generated database (reused if present) and the generation time"""
+    path = data_dir / f"bench_{posts}_{seed}.db"
+    if path.exists():
+        return path, None
+    partial = path.with_suffix(".partial")
+    for leftover in data_dir.glob(partial.name + "*"):
+        leftover.unlink()
+    started = time.perf_counter()
+    generate(partial, posts, seed, years)
+    elapsed = time.perf_counter() - started
+    partial.rename(path)
+    return path, elapsed
+
+
+def make_cases(posts: int, seed: int) -> dict:
+    """Method name -> function of a seeded random generator making one call"""
+    from database import Database
+    users = table_sizes(posts)['users']
+    created = []
+
+    def get_user(rng):
+        Database.get_user(100000000 + rng.randrange(users))
+
+    def create_post(rng):
+        created.append(Database.create_post(
+            int(users * rng.random() ** 3) + 1, random_text(rng), "file", f"bench{rng.random()}"
+        ))
+
+    def update_post_status(rng):
+        # Posts created by the create_post case first, then random ones
+        post_id = created.pop() if created else rng.randrange(posts) + 1
+        Database.update_post_status(post_id, rng.choice(("approved", "rejected")), 1)
+
+    def get_posts_by_status(rng):
+        Database.get_posts_by_status("pending")
+
+    def get_user_posts(rng):
+        # Heavy submitters are picked as often as they post
+        Database.get_user_posts(int(users * rng.random() ** 3) + 1)
+
+    def get_top_users(rng):
+        Database.get_top_users(rng.choice(("approved_posts", "rejected_posts")))
+
+    def get_pending_feedback(rng):
+        Database.get_pending_feedback()
+
+    return {
+        'get_user': get_user,
+        'create_post': create_post,
+        'update_post_status': update_post_status,
+        'get_posts_by_status': get_posts_by_status,
+        'get_user_posts': get_user_posts,
+        'get_top_users': get_top_users,
+        'get_pending_feedback': get_pending_feedback,
+    }
+
+
+def measure(call, seed: int, duration: float, min_calls: int) -> dict:
+    rng = random.Random(seed)
+    timings = []
+    deadline = time.perf_counter() + duration
+    while len(timings) < min_calls or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        call(rng)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'mean_us': sum(timings) / len(timings) * 1e6,
+        'p50_us': timings[len(timings) // 2] * 1e6,
+        'p95_us': timings[min(int(len(timings) * 0.95), len(timings) - 1)] * 1e6,
+        'max_us': timings[-1] * 1e6,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def format_change(current: float, previous: float) -> str:
+    return f"{(current / previous - 1) * 100:+6.1f}%" if previous else ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", default="10k", help="posts per dataset, e.g. 10k,1m,10m")
+    parser.add_argument("--methods", help="comma separated subset of the benchmarked methods")
+    parser.add_argument("--time", type=float, default=2.0, help="seconds per method")
+    parser.add_argument("--min-calls", type=int, default=5)
+    parser.add_argument("--years", type=float, default=3.0, help="history length")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="where generated databases are kept (default: temporary)")
+    parser.add_argument("--output", default="bench_database.json")
+    parser.add_argument("--compare", help="results JSON of an earlier run")
+    args = parser.parse_args()
+
+    import config
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(args.data_dir) if args.data_dir else Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        config.DATABASE_PATH = str(Path(tmp) / "work.db")
+        import database
+
+        previous = {}
+        if args.compare:
+            with open(args.compare, encoding="utf-8") as f:
+                previous = json.load(f)['scales']
+
+        report = {
+            'commit': git_commit(),
+            'date': datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': args.seed,
+            'scales': {},
+        }
+        for scale in args.scales.split(","):
+            posts = parse_scale(scale)
+            source, generation_time = prepare(data_dir, posts, args.seed, args.years)
+            work = Path(tmp) / "work.db"
+            shutil.copy(source, work)
+            database.DATABASE_PATH = str(work)
+
+            cases = make_cases(posts, args.seed)
+            if args.methods:
+                cases = {name: cases[name] for name in args.methods.split(",")}
+            sizes = table_sizes(posts)
+            print(f"\n{scale}: {sizes['users']} users, {sizes['posts']} posts, {sizes['feedback']} feedback"
+                  + (f" (generated in {generation_time:.1f} s)" if generation_time is not None else ""))
+            print(f"{'method':<22} {'calls':>7} {'mean us':>10} {'p50 us':>10} {'p95 us':>10} {'max us':>10}")
+            results = {}
+            for name, call in cases.items():
+                result = results[name] = measure(call, args.seed, args.time, args.min_calls)
+                before = previous.get(str(posts), {}).get('results', {}).get(name)
+                change = format_change(result['p50_us'], before['p50_us']) if before else ""
+                print(
+                    f"{name:<22} {result['calls']:>7} {result['mean_us']:>10.1f} {result['p50_us']:>10.1f} "
+                    f"{result['p95_us']:>10.1f} {result['max_us']:>10.1f} {change}"
+                )
+            report['scales'][str(posts)] = {
+                'sizes': sizes,
+                'generation_seconds': generation_time,
+                'results': results,
+            }
+            work.unlink()
+
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}" + (f" (p50 change vs {args.compare})" if args.compare else ""))
+
+
+if __name__ == "__main__":
+    main()
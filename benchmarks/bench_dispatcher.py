@@ -0,0 +1,282 @@
+"""
+End-to-end throughput of the real Dispatcher (common, user and admin routers,
+production middlewares, SQLite FSM storage) fed with synthetic updates.
+
+Telegram API calls go to a stub session that answers after --latency seconds.
+Every scenario runs on a fresh copy of a temporary database with --users
+registered users and --posts pending posts; updates are generated from a
+fixed seed, so runs are reproducible. Virtual users send their updates one
+after another (dialogs depend on the previous step), up to --concurrency
+users at a time. Routers are module level objects that can be attached to
+one dispatcher only, so every run happens in a fresh process.
+
+Scenarios:
+    start       /start
+    post        "Предложить пост", post text, photo
+    moderation  admin approves pending posts (callback)
+    feedback    "Связь с администрацией", feedback text
+    statistics  "Статистика", top_approved callback
+
+Usage: python benchmarks/bench_dispatcher.py [--scenarios start,post] [--users 500] [--rounds 2]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ADMIN_ID = 1
+FIRST_USER_ID = 100000
+SCENARIOS = ["start", "post", "moderation", "feedback", "statistics"]
+
+
+def configure(db_path: str):
+    # Must run before the bot modules are imported: they read config at import
+    import config
+    config.DATABASE_PATH = db_path
+    config.ADMIN_IDS = [ADMIN_ID]
+    config.OUTBOUND_RATE_LIMIT_ENABLED = False  # Measure update handling, not Telegram limits
+    config.PHASH_ENABLED = False  # Needs real image downloads
+    config.WORKERS = 1
+
+
+def make_stub_session(latency: float):
+    from datetime import datetime
+
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+
+    class StubSession(BaseSession):
+        """Answers API calls locally after a fixed delay"""
+
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls += 1
+            if latency:
+                await asyncio.sleep(latency)
+            if type(method).__name__.startswith(("Send", "Copy", "Forward")):
+                return Message(
+                    message_id=self.calls,
+                    date=datetime.now(),
+                    chat=Chat(id=method.chat_id, type="private"),
+                    text=getattr(method, "text", None)
+                )
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+
+class UpdateFactory:
+    """Raw updates with increasing ids, from a seeded random generator"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.update_id = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str = None, photo: bool = False) -> dict:
+        self.update_id += 1
+        message = {
+            "message_id": self.update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+        }
+        if photo:
+            message["photo"] = [
+                {"file_id": f"small{self.update_id}", "file_unique_id": f"s{self.update_id}", "width": 90, "height": 90},
+                {"file_id": f"photo{self.update_id}", "file_unique_id": f"p{self.update_id}", "width": 1280, "height": 1280},
+            ]
+        else:
+            message["text"] = text
+        return {"update_id": self.update_id, "message": message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        self.update_id += 1
+        return {
+            "update_id": self.update_id,
+            "callback_query": {
+                "id": str(self.update_id),
+                "from": self._user(user_id),
+                "chat_instance": "bench",
+                "data": data,
+                "message": {
+                    "message_id": self.update_id,
+                    "date": 1700000000,
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "bench",
+                },
+            },
+        }
+
+    def text(self) -> str:
+        words = ["кот", "мем", "новость", "город", "погода", "вечер", "фото", "друзья", "музыка", "лето"]
+        return " ".join(self.rng.choice(words) for _ in range(self.rng.randint(3, 12))) + f" {self.rng.random():.6f}"
+
+
+def make_sessions(scenario: str, factory: UpdateFactory, users: list, post_ids: list) -> list:
+    """Update sequences, one per virtual user"""
+    sessions = []
+    if scenario == "start":
+        sessions = [[factory.message(user_id, "/start")] for user_id in users]
+    elif scenario == "post":
+        sessions = [[
+            factory.message(user_id, "📤 Предложить пост"),
+            factory.message(user_id, factory.text()),
+            factory.message(user_id, photo=True),
+        ] for user_id in users]
+    elif scenario == "moderation":
+        # One admin can only act sequentially: split posts into several admin "sessions"
+        chunks = [post_ids[i::10] for i in range(10)]
+        sessions = [[factory.callback(ADMIN_ID, f"approve_post:{post_id}") for post_id in chunk] for chunk in chunks]
+    elif scenario == "feedback":
+        sessions = [[
+            factory.message(user_id, "📨 Связь с администрацией"),
+            factory.message(user_id, factory.text()),
+        ] for user_id in users]
+    elif scenario == "statistics":
+        sessions = [[
+            factory.message(user_id, "📊 Статистика"),
+            factory.callback(user_id, "top_approved"),
+        ] for user_id in users]
+    return sessions
+
+
+def build_template(path: Path, users: int, posts: int, seed: int):
+    import database
+    database.init_db()
+    Database = database.Database
+    Database.add_user(ADMIN_ID, "admin", "Admin")
+    Database.update_user(telegram_id=ADMIN_ID, updates={"role": "admin"})
+    rng = random.Random(seed)
+    for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+        Database.add_user(user_id, f"user{user_id}", "User")
+    for number in range(posts):
+        author = Database.get_user(FIRST_USER_ID + rng.randrange(users))
+        Database.create_post(author['internal_id'], f"post {number}", f"file{number}", f"unique{number}")
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+async def run_scenario(scenario: str, db_path: Path, args) -> dict:
+    import database
+    from aiogram.types import Update
+    from bot_setup import create_bot, create_dispatcher, load_caches
+    from fsm_storage import SQLiteStorage
+    from outbound import wait_background
+    from scheduler import JobScheduler
+    from update_log import ProcessedUpdates
+
+    load_caches()
+    users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    post_ids = [post['post_id'] for post in database.Database.get_posts_by_status("pending")]
+    factory = UpdateFactory(args.seed)
+    sessions = make_sessions(scenario, factory, users, post_ids)
+    sessions = [[Update.model_validate(update) for update in session] for session in sessions]
+
+    bot = create_bot(session=make_stub_session(args.latency))
+    storage = SQLiteStorage(path=str(db_path))
+    storage.load()
+    processed_updates = ProcessedUpdates(path=str(db_path))
+    dp = create_dispatcher(storage=storage, processed_updates=processed_updates, scheduler=JobScheduler())
+
+    latencies = []
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def run_session(session):
+        async with slots:
+            for update in session:
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(session) for session in sessions))
+    await wait_background(60)  # Admin notifications sent with send_later()
+    elapsed = time.perf_counter() - started
+
+    await storage.close()
+    await processed_updates.close()
+    await bot.session.close()
+    latencies.sort()
+    return {
+        'updates': len(latencies),
+        'rate': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1],
+        'api_calls': bot.session.calls,
+    }
+
+
+def run_process(scenario: str, db_path: Path, args) -> dict:
+    configure(str(db_path))
+    return asyncio.run(run_scenario(scenario, db_path, args))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--posts", type=int, default=500, help="pending posts for the moderation scenario")
+    parser.add_argument("--concurrency", type=int, default=50, help="virtual users sending at the same time")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated API call latency, seconds")
+    parser.add_argument("--rounds", type=int, default=1, help="runs per scenario, the best one is reported")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        template = tmp_dir / "template.db"
+        configure(str(template))
+        build_template(template, args.users, args.posts, args.seed)
+
+        print(
+            f"users: {args.users}, posts: {args.posts}, concurrency: {args.concurrency}, "
+            f"api latency: {args.latency * 1000:.0f} ms"
+        )
+        print(f"{'scenario':<12} {'updates':>8} {'updates/s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'api calls':>10}")
+        for scenario in scenarios:
+            best = None
+            for round_number in range(args.rounds):
+                db_path = tmp_dir / f"{scenario}_{round_number}.db"
+                shutil.copy(template, db_path)
+                with multiprocessing.get_context("spawn").Pool(1) as pool:
+                    result = pool.apply(run_process, (scenario, db_path, args))
+                if best is None or result['rate'] > best['rate']:
+                    best = result
+            print(
+                f"{scenario:<12} {best['updates']:>8} {best['rate']:>10.0f} {best['p50'] * 1000:>8.2f} "
+                f"{best['p95'] * 1000:>8.2f} {best['p99'] * 1000:>8.2f} {best['max'] * 1000:>8.2f} "
+                f"{best['api_calls']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Logging overhead per update, before and after the queue pipeline (logging_setup.py).
+
+before: f-string messages, FileHandler on the root logger (formatting and the
+        write happen in the event loop thread)
+after:  lazy %-formatting, LogQueueHandler with update context and rate
+        limiting, JSON lines written by the background thread
+
+Per scenario one record is logged per simulated update:
+    handled    INFO record with two arguments
+    failure    ERROR record of a failed broadcast send (same message every time)
+    disabled   DEBUG record below the configured level
+
+"caller" is the CPU time of the logging thread (what the event loop pays;
+wall time would include the writer thread when both share a core), "total"
+is the CPU time of the whole process including writing out the queue.
+
+Usage: python benchmarks/bench_logging.py [--updates 20000]
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+logger = logging.getLogger("bench")
+
+
+class SendError(Exception):
+    pass
+
+
+ERROR = SendError("Telegram server says - Forbidden: bot was blocked by the user")
+
+
+def before_handled(number: int):
+    logger.info(f"Post {number} published as message {number + 1}")
+
+
+def before_failure(number: int):
+    logger.error(f"Failed to send mass notification: {ERROR}")
+
+
+def before_disabled(number: int):
+    logger.debug(f"Update {number} handled by {before_disabled.__name__}")
+
+
+def after_handled(number: int):
+    logger.info("Post %s published as message %s", number, number + 1)
+
+
+def after_failure(number: int):
+    logger.error("Failed to send mass notification: %s", ERROR)
+
+
+def after_disabled(number: int):
+    logger.debug("Update %s handled by %s", number, after_disabled.__name__)
+
+
+SCENARIOS = {
+    'handled': (before_handled, after_handled),
+    'failure': (before_failure, after_failure),
+    'disabled': (before_disabled, after_disabled),
+}
+
+
+def run(log, updates: int) -> float:
+    started = time.thread_time()
+    for number in range(updates):
+        log(number)
+    return time.thread_time() - started
+
+
+def measure_before(log, updates: int, path: Path):
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    started = time.process_time()
+    caller = run(log, updates)
+    total = time.process_time() - started
+    handler.close()
+    root.handlers[:] = []
+    return caller, total
+
+
+def measure_after(log, updates: int, path: Path):
+    import logging_setup
+    # Queue large enough to hold every record of a run, so none is dropped
+    logging_setup.setup_logging(level="INFO", path=str(path), queue_size=updates + 10)
+    # As inside a handler: records carry the update context
+    token = logging_setup._context.set(logging_setup.UpdateContext(1, 100000))
+    started = time.process_time()
+    caller = run(log, updates)
+    logging_setup._context.reset(token)
+    logging_setup.stop_logging()
+    total = time.process_time() - started
+    logging.getLogger().handlers[0].close()
+    logging.getLogger().handlers[:] = []
+    return caller, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"updates: {args.updates}, us per update")
+        print(f"{'scenario':<10} {'before caller':>14} {'before total':>13} {'after caller':>13} {'after total':>12} "
+              f"{'lines before/after':>20}")
+        for name, (before, after) in SCENARIOS.items():
+            before_path = Path(tmp) / f"{name}_before.log"
+            after_path = Path(tmp) / f"{name}_after.log"
+            before_caller, before_total = measure_before(before, args.updates, before_path)
+            after_caller, after_total = measure_after(after, args.updates, after_path)
+            lines = (
+                sum(1 for _ in open(before_path, encoding="utf-8")),
+                sum(1 for _ in open(after_path, encoding="utf-8"))
+            )
+            print(
+                f"{name:<10} {before_caller / args.updates * 1e6:>14.2f} {before_total / args.updates * 1e6:>13.2f} "
+                f"{after_caller / args.updates * 1e6:>13.2f} {after_total / args.updates * 1e6:>12.2f} "
+                f"{f'{lines[0]}/{lines[1]}':>20}"
+            )
+
+
+if __name__ == "__main__":
+    main()
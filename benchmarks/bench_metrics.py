@@ -0,0 +1,106 @@
+"""
+Hot path overhead of the metrics subsystem.
+
+Measures a histogram observation, the handler timing middleware, a SQL
+statement through TimedConnection and a full Database method call with and
+without instrumentation, and the time to render a scrape. Uses a temporary
+database.
+
+Usage: python benchmarks/bench_metrics.py [--iterations 20000] [--users 1000]
+"""
+import argparse
+import asyncio
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def per_call(func, iterations: int) -> float:
+    """Microseconds per call, best of 3 runs"""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1e6
+
+
+def per_call_async(func, iterations: int) -> float:
+    async def loop():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        return time.perf_counter() - started
+
+    best = min(asyncio.run(loop()) for _ in range(3))
+    return best / iterations * 1e6
+
+
+def report(name: str, plain: float, timed: float):
+    print(f"{name:<28} {plain:8.2f} us  {timed:8.2f} us  +{timed - plain:6.2f} us ({(timed / plain - 1) * 100:5.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import config
+        config.DATABASE_PATH = str(Path(tmp) / "bench.db")
+        import database
+        import metrics
+        database.init_db()
+        for user_id in range(args.users):
+            database.Database.add_user(user_id, f"user{user_id}", "User")
+
+        print(f"iterations: {n}")
+        print(f"{'':<28} {'plain':>11}  {'with metrics':>11}")
+
+        histogram = metrics.Histogram("bench_seconds", "Benchmark", ("label",))
+        print(f"{'histogram observe':<28} {per_call(lambda: histogram.observe(0.003, 'x'), n):8.2f} us")
+
+        async def handler(event, data):
+            return None
+        middleware = metrics.HandlerMetricsMiddleware()
+        data = {"handler": SimpleNamespace(callback=handler)}
+        report(
+            "handler middleware",
+            per_call_async(lambda: handler(None, data), n),
+            per_call_async(lambda: middleware(handler, None, data), n)
+        )
+
+        query = "SELECT * FROM users WHERE telegram_id = ?"
+        plain_conn = sqlite3.connect(config.DATABASE_PATH)
+        timed_conn = sqlite3.connect(config.DATABASE_PATH, factory=metrics.TimedConnection)
+        report(
+            "SQL statement",
+            per_call(lambda: plain_conn.execute(query, (n % args.users,)).fetchall(), n),
+            per_call(lambda: timed_conn.execute(query, (n % args.users,)).fetchall(), n)
+        )
+        plain_conn.close()
+        timed_conn.close()
+
+        # Connection per call, as every Database method does
+        get_user = database.Database.get_user
+        database.TimedConnection = sqlite3.Connection
+        plain = per_call(lambda: get_user.__wrapped__(n % args.users), n // 4)
+        database.TimedConnection = metrics.TimedConnection
+        timed = per_call(lambda: get_user(n % args.users), n // 4)
+        report("Database.get_user", plain, timed)
+
+        started = time.perf_counter()
+        text = metrics.render()
+        print(f"{'render scrape':<28} {(time.perf_counter() - started) * 1000:8.2f} ms  ({len(text)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Update throughput of the multi-process mode for different worker counts.
+
+Updates are routed through WorkerPool exactly as in production; Telegram API
+calls go to a stub session that answers after --latency seconds. Every run
+uses a fresh temporary database.
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--updates 5000] [--users 500]
+"""
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+COMMANDS = ["/start", "/help", "/id"]
+
+
+def use_database(path: str):
+    # Must run before the bot modules are imported: they read DATABASE_PATH at import
+    import config
+    config.DATABASE_PATH = path
+
+
+def make_stub_session(latency: float):
+    import asyncio
+    from datetime import datetime
+
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage
+    from aiogram.types import Chat, Message
+
+    class StubSession(BaseSession):
+        """Answers API calls locally after a fixed delay"""
+
+        async def make_request(self, bot, method, timeout=None):
+            await asyncio.sleep(latency)
+            if isinstance(method, SendMessage):
+                return Message(
+                    message_id=1,
+                    date=datetime.now(),
+                    chat=Chat(id=method.chat_id, type="private"),
+                    text=method.text
+                )
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return StubSession()
+
+
+def bench_worker(number, queue, ready, db_path, latency):
+    use_database(db_path)
+    import config
+    config.OUTBOUND_RATE_LIMIT_ENABLED = False  # Measure update handling, not Telegram limits
+    from workers import run_worker
+    run_worker(number, queue, ready, lambda: make_stub_session(latency))
+
+
+def make_updates(count: int, users: int, seed: int):
+    rng = random.Random(seed)
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 100000 + rng.randrange(users)
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1700000000,
+                "chat": {"id": user_id, "type": "private", "first_name": "User"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "User", "username": f"user{user_id}"},
+                "text": rng.choice(COMMANDS)
+            }
+        })
+    return updates
+
+
+def run(workers: int, updates, template_db: Path, tmp_dir: Path, latency: float) -> float:
+    from workers import WorkerPool
+
+    db_path = tmp_dir / f"bench_{workers}.db"
+    shutil.copy(template_db, db_path)
+    pool = WorkerPool(workers, target=bench_worker, args=(str(db_path), latency))
+    pool.start()
+    if not pool.wait_ready(120):
+        raise RuntimeError("workers did not start")
+
+    started = time.perf_counter()
+    for update in updates:
+        pool.route(update)
+    pool.stop(timeout=600)  # returns when every queued update is handled
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated API call latency, seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        template_db = tmp_dir / "template.db"
+        use_database(str(template_db))
+        from database import init_db
+        init_db()
+
+        updates = make_updates(args.updates, args.users, args.seed)
+        print(f"updates: {len(updates)}, users: {args.users}, api latency: {args.latency * 1000:.0f} ms")
+        baseline = None
+        for workers in [int(value) for value in args.workers.split(",")]:
+            elapsed = run(workers, updates, template_db, tmp_dir, args.latency)
+            rate = len(updates) / elapsed
+            baseline = baseline or rate
+            print(f"workers: {workers}  {rate:8.0f} updates/s  ({elapsed:.2f} s, {rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config import BLOCKLIST_PATH, BLOCKLIST_RELOAD_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+WORD_CHARS = re.compile(r"^\w+$")
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton: finds all patterns in one pass over the text"""
+
+    def __init__(self, patterns: List[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+        self.patterns = patterns
+
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(pattern_id)
+
+        # Breadth-first construction of failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(char, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def iter_matches(self, text: str):
+        """Yield (end_index, pattern_id) for every occurrence"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern_id in output[node]:
+                yield index, pattern_id
+
+
+class Blocklist:
+    """
+    Blocklist loaded from a text file, one entry per line:
+    - word or phrase: `казино` (single words match whole words only)
+    - domain or any substring: `spam.example.com`
+    - wildcard pattern: `free*bitcoin` (`*` matches anything within one line)
+    Lines starting with `#` are comments. The file is re-read when it changes.
+    """
+
+    def __init__(self, path=BLOCKLIST_PATH):
+        self.path = path
+        self.mtime = None
+        self.checked_at = 0.0
+        self.automaton = AhoCorasick([])
+        # Per literal: list of (entry, whole_word, wildcard regex or None)
+        self.entries: List[List[Tuple[str, bool, Optional[re.Pattern]]]] = []
+
+    def load(self, lines: List[str]):
+        """Compile entries into the automaton"""
+        literals: Dict[str, int] = {}
+        entries = []
+        for line in lines:
+            entry = line.strip().lower()
+            if not entry or entry.startswith("#"):
+                continue
+            if "*" in entry:
+                parts = [part for part in entry.split("*") if part]
+                if not parts:
+                    continue
+                # The longest literal part is the anchor searched by the automaton
+                anchor = max(parts, key=len)
+                regex = re.compile(".*".join(re.escape(part) for part in entry.split("*")))
+                item = (entry, False, regex)
+            else:
+                anchor = entry
+                item = (entry, bool(WORD_CHARS.match(entry)), None)
+            if anchor not in literals:
+                literals[anchor] = len(entries)
+                entries.append([])
+            entries[literals[anchor]].append(item)
+
+        self.automaton = AhoCorasick(list(literals))
+        self.entries = entries
+        logger.info("Blocklist loaded: %s entries", sum(len(items) for items in entries))
+
+    def reload_if_changed(self):
+        """Re-read blocklist file if it was modified (checked at most every few seconds)"""
+        now = time.monotonic()
+        if now - self.checked_at < BLOCKLIST_RELOAD_INTERVAL:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            if self.mtime is not None:
+                self.load([])
+                self.mtime = None
+            return
+        if mtime != self.mtime:
+            with open(self.path, encoding="utf-8") as f:
+                self.load(f.readlines())
+            self.mtime = mtime
+
+    def find(self, text: str) -> Optional[str]:
+        """Return the first blocked entry found in text, or None"""
+        if not text:
+            return None
+        self.reload_if_changed()
+        lowered = text.lower()
+        for end, literal_id in self.automaton.iter_matches(lowered):
+            literal = self.automaton.patterns[literal_id]
+            start = end - len(literal) + 1
+            for entry, whole_word, regex in self.entries[literal_id]:
+                if regex is not None:
+                    # Verify the wildcard pattern only around the anchor hit
+                    line_start = lowered.rfind("\n", 0, start) + 1
+                    line_end = lowered.find("\n", end)
+                    if regex.search(lowered, line_start, len(lowered) if line_end < 0 else line_end):
+                        return entry
+                elif whole_word:
+                    before = lowered[start - 1] if start > 0 else " "
+                    after = lowered[end + 1] if end + 1 < len(lowered) else " "
+                    if not (before.isalnum() or before == "_" or after.isalnum() or after == "_"):
+                        return entry
+                else:
+                    return entry
+        return None
+
+
+blocklist = Blocklist()
@@ -0,0 +1,140 @@
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.types import BotCommand, BotCommandScopeChat
+
+from config import BOT_TOKEN, ADMIN_IDS, WORKERS, OUTBOUND_GLOBAL_RATE, METRICS_ENABLED, TELEGRAM_API_URL
+from fsm_storage import SQLiteStorage
+from handlers import common, user, admin
+from handlers.user import notify_admins
+from middlewares import OrderedConcurrencyMiddleware, LoadSheddingMiddleware, DeduplicationMiddleware
+from load_manager import load, LOAD_NORMAL, LOAD_ELEVATED, LOAD_OVERLOADED
+from logging_setup import install_log_context
+import metrics
+from outbound import OutboundScheduler, get_outbound_scheduler
+from update_log import ProcessedUpdates
+import image_hash
+import text_hash
+
+logger = logging.getLogger(__name__)
+
+
+def create_bot(**kwargs) -> Bot:
+    """Bot with the project's default properties, all sends go through OutboundScheduler"""
+    if TELEGRAM_API_URL and "session" not in kwargs:
+        kwargs["session"] = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    bot = Bot(
+        token=BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        **kwargs
+    )
+    # In multi-process mode the front process and every worker send on their own
+    processes = WORKERS + 1 if WORKERS > 1 else 1
+    bot.session.middleware(OutboundScheduler(rate=OUTBOUND_GLOBAL_RATE / processes))
+    if METRICS_ENABLED:
+        bot.session.middleware(metrics.ApiMetricsMiddleware())
+    return bot
+
+
+def create_dispatcher(storage: BaseStorage = None, processed_updates: ProcessedUpdates = None,
+                      **workflow_data) -> Dispatcher:
+    """Dispatcher with all routers included"""
+    concurrency = OrderedConcurrencyMiddleware()
+    dp = Dispatcher(storage=storage, concurrency=concurrency, **workflow_data)
+    # aiogram closes the storage on shutdown, before the handlers still running are
+    # drained; the storage is closed by whoever created it, after drain()
+    dp.shutdown.handlers = [handler for handler in dp.shutdown.handlers if handler.callback != dp.fsm.close]
+    # aiogram reads the FSM state in its own outer middleware, registered first; it is
+    # moved behind the per-user lock, so an update sees the state the previous update
+    # of the same user has set (aiogram's default isolation does not lock at all)
+    dp.update.outer_middleware.unregister(dp.fsm)
+    install_log_context(dp)
+    # Registered after aiogram's own outer middlewares, so the chat and user are known;
+    # duplicates and shed updates are dropped before they wait in the queues
+    if processed_updates is not None:
+        dp.update.outer_middleware(DeduplicationMiddleware(processed_updates))
+    dp.update.outer_middleware(LoadSheddingMiddleware(load))
+    dp.update.outer_middleware(concurrency)
+    dp.update.outer_middleware(dp.fsm)
+    dp.include_router(common.router)
+    dp.include_router(user.router)
+    dp.include_router(admin.router)
+    if METRICS_ENABLED:
+        metrics.install_handler_metrics(dp)
+    return dp
+
+
+def register_metrics(bot: Bot, dp: Dispatcher = None, storage: SQLiteStorage = None):
+    """Report load, queue and FSM gauges of this process on every metrics scrape"""
+    levels = {LOAD_NORMAL: 0, LOAD_ELEVATED: 1, LOAD_OVERLOADED: 2}
+    outbound = get_outbound_scheduler(bot)
+    concurrency = dp["concurrency"] if dp else None
+
+    def collect_runtime():
+        metrics.event_loop_lag.set(load.lag)
+        metrics.updates_pending.set(load.pending)
+        metrics.load_level.set(levels[load.level])
+        for kind, count in load.shed.items():
+            metrics.updates_shed.set_total(count, kind)
+        for kind, count in load.deferred.items():
+            metrics.work_deferred.set_total(count, kind)
+        if outbound:
+            for priority, stats in outbound.stats().items():
+                metrics.outbound_queued.set(stats['queued'], priority)
+                metrics.outbound_sent.set_total(stats['sent'], priority)
+                metrics.outbound_retries.set_total(stats['retries'], priority)
+        if concurrency:
+            stats = concurrency.stats()
+            metrics.concurrency_active.set(stats['active'])
+            metrics.concurrency_queued.set(stats['queued'])
+        if storage:
+            stats = storage.stats()
+            metrics.fsm_states.set(stats['states'])
+            metrics.fsm_records.set(stats['records'])
+
+    metrics.register_collector(collect_runtime)
+
+
+def load_caches():
+    """Load in-memory duplicate indexes from the database"""
+    image_hash.load_index()
+    text_hash.load_indexes()
+
+
+DEFAULT_COMMANDS = [
+    BotCommand(command="start", description="Начать работу с ботом"),
+    BotCommand(command="help", description="Помощь и инструкции"),
+]
+# Shown to admins only (menu per admin chat)
+ADMIN_COMMANDS = [
+    BotCommand(command="admin", description="Команды администратора"),
+    BotCommand(command="queue", description="Очередь публикации"),
+    BotCommand(command="jobs", description="Фоновые задачи"),
+    BotCommand(command="load", description="Нагрузка и очереди"),
+    BotCommand(command="profile", description="Профилирование бота"),
+]
+
+
+async def set_default_commands(bot: Bot):
+    """Set the command menu for users and the extended one for admins"""
+    await bot.set_my_commands(DEFAULT_COMMANDS)
+    for admin_id in ADMIN_IDS:
+        try:
+            await bot.set_my_commands(DEFAULT_COMMANDS + ADMIN_COMMANDS, scope=BotCommandScopeChat(chat_id=admin_id))
+        except Exception as e:
+            # Fails until the admin has started a chat with the bot
+            logger.warning("Failed to set admin commands for %s: %s", admin_id, e)
+
+
+async def announce_startup(bot: Bot):
+    """Register bot commands and notify admins; once per start, before updates are received"""
+    try:
+        await set_default_commands(bot)
+    except Exception as e:
+        logger.error("Failed to set bot commands: %s", e)
+    await notify_admins("🤖 Бот успешно запущен!", bot)
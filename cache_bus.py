@@ -0,0 +1,64 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, List
+
+from config import WORKERS, CACHE_EVENT_POLL_INTERVAL
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Events are only needed when several worker processes keep their own caches
+enabled = WORKERS > 1
+
+_subscribers: Dict[str, List[Callable[[dict], None]]] = {}
+_last_event_id = None
+
+
+def subscribe(channel: str, callback: Callable[[dict], None]):
+    """Call `callback(payload)` for events published by other processes"""
+    _subscribers.setdefault(channel, []).append(callback)
+
+
+def publish(channel: str, payload: dict):
+    """Notify other processes that a cached item changed"""
+    if not enabled:
+        return
+    try:
+        Database.add_cache_event(channel, json.dumps(payload), os.getpid())
+    except Exception as e:
+        logger.error("Failed to publish cache event %s: %s", channel, e)
+
+
+def poll() -> int:
+    """Apply events published by other processes since the last poll"""
+    global _last_event_id
+    if _last_event_id is None:
+        # Start from now: the caches were just loaded from the database
+        _last_event_id = Database.get_last_cache_event_id()
+        return 0
+
+    events = Database.get_cache_events(_last_event_id)
+    own_pid = os.getpid()
+    for event in events:
+        _last_event_id = event['event_id']
+        if event['origin'] == own_pid:
+            continue
+        payload = json.loads(event['payload'])
+        for callback in _subscribers.get(event['channel'], []):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error("Cache event handler for %s failed: %s", event['channel'], e)
+    return len(events)
+
+
+async def listen(interval: float = CACHE_EVENT_POLL_INTERVAL):
+    """Apply events from other processes until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            poll()
+        except Exception as e:
+            logger.error("Failed to poll cache events: %s", e)
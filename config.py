@@ -18,3 +18,182 @@ POST_STATUS_REJECTED = "rejected"
 # User statuses
 USER_STATUS_ACTIVE = "active"
 USER_STATUS_BLOCKED = "blocked"
+
+# How the bot receives updates
+RUN_MODE_POLLING = "polling"
+RUN_MODE_WEBHOOK = "webhook"
+RUN_MODE = RUN_MODE_POLLING
+
+# Webhook mode: Telegram sends updates to WEBHOOK_BASE_URL + WEBHOOK_PATH,
+# the aiohttp server listens on WEBAPP_HOST:WEBAPP_PORT (usually behind a proxy/load balancer)
+WEBHOOK_BASE_URL = None  # e.g. "https://bot.example.com", None skips setWebhook (local testing)
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = "change-me"  # Checked against X-Telegram-Bot-Api-Secret-Token header
+WEBAPP_HOST = "0.0.0.0"
+WEBAPP_PORT = 8080
+
+# Bot API server, None for api.telegram.org. For load tests point it at the
+# local emulator: python telegram_emulator.py, then "http://127.0.0.1:8081"
+TELEGRAM_API_URL = None
+
+# Multi-process mode: with WORKERS > 1 the main process only receives updates
+# (polling or webhook) and hands them to WORKERS processes, sharded by user id.
+# Keep 1 unless the host has a core per worker: on a single core more workers are
+# slower (benchmarks/bench_workers.py: 1 worker 802 updates/s, 2 workers 712/s, 4 workers 437/s)
+WORKERS = 1
+CACHE_EVENT_POLL_INTERVAL = 1.0  # Seconds between checks for cache updates from other workers
+CACHE_EVENT_KEEP = 60 * 60  # Seconds cache events are kept before cleanup
+
+# Duplicate image handling (checked by Telegram file_unique_id on submission):
+# - reject: refuse the submission
+# - link: reuse the decision of the already reviewed post
+# - flag: send to moderation marked as duplicate
+DUPLICATE_ACTION_REJECT = "reject"
+DUPLICATE_ACTION_LINK = "link"
+DUPLICATE_ACTION_FLAG = "flag"
+DUPLICATE_IMAGE_ACTION = DUPLICATE_ACTION_FLAG
+
+# Near-duplicate image search by perceptual hash (requires Pillow)
+PHASH_ENABLED = False
+PHASH_MAX_DISTANCE = 6  # Max differing bits out of 64 to treat images as similar
+PHASH_WORKERS = 2  # Processes used for hashing
+
+# Near-duplicate text search (SimHash over word shingles)
+TEXT_SHINGLE_SIZE = 2  # Words per shingle
+TEXT_SIMHASH_MAX_DISTANCE = 10  # Max differing bits out of 64 to treat texts as similar
+TEXT_MIN_LENGTH = 20  # Shorter texts are not checked
+
+# Keyword/domain blocklist checked on submission (hot-reloaded when the file changes)
+BLOCKLIST_PATH = BASE_DIR / "blocklist.txt"
+BLOCKLIST_RELOAD_INTERVAL = 5  # Seconds between file modification checks
+BLOCKLIST_ACTION_REJECT = "reject"
+BLOCKLIST_ACTION_FLAG = "flag"
+BLOCKLIST_ACTION = BLOCKLIST_ACTION_REJECT
+
+# Reputation fast path for trusted submitters (counters and reputation only count
+# posts reviewed by admins, auto-approved ones do not keep a user trusted)
+# - auto_approve: posts of trusted users are approved without moderation
+# - sample: the same, but REPUTATION_SAMPLE_RATE of posts still go to moderators
+# - prioritize: posts are moderated but shown first in the pending queue
+REPUTATION_ACTION_AUTO_APPROVE = "auto_approve"
+REPUTATION_ACTION_SAMPLE = "sample"
+REPUTATION_ACTION_PRIORITIZE = "prioritize"
+REPUTATION_TRUSTED_ACTION = REPUTATION_ACTION_PRIORITIZE
+REPUTATION_TRUSTED_MIN_APPROVED = 50  # Approved posts needed to become trusted
+REPUTATION_TRUSTED_MIN_SCORE = 0.95  # Smoothed approval rate needed to become trusted
+REPUTATION_SAMPLE_RATE = 0.1
+
+# Publishing of approved posts to a channel (None disables publishing)
+PUBLISH_CHANNEL_ID = None  # e.g. -1001234567890 or "@channel_name"
+PUBLISH_TIME_SLOTS = [("09:00", "23:00")]  # Local time windows, empty list means any time
+PUBLISH_MIN_INTERVAL = 30 * 60  # Seconds between two publications
+PUBLISH_CHECK_INTERVAL = 30  # Seconds between queue checks
+PUBLISH_MAX_ATTEMPTS = 5
+
+# Update processing: updates of one user/chat are handled strictly in order,
+# different users in parallel up to MAX_CONCURRENT_UPDATES handlers at a time
+MAX_CONCURRENT_UPDATES = 50
+MAX_PENDING_UPDATES = 1000  # Received but unfinished updates before polling pauses
+PROCESSED_UPDATES_KEEP = 10000  # Handled update ids remembered to skip redelivered updates
+PROCESSED_UPDATES_FLUSH_INTERVAL = 0.5  # Seconds between batched writes of handled update ids
+
+# Shutdown: running handlers and queued sends get SHUTDOWN_TIMEOUT seconds to finish,
+# sends still queued after that are saved to the outbox table and sent after restart
+SHUTDOWN_TIMEOUT = 20
+SHUTDOWN_GRACE = 5  # Seconds for background tasks to stop once sends are being saved
+
+# Outgoing messages (see outbound.OutboundScheduler). Telegram allows about 30
+# messages per second overall, 1 per second in a private chat and 20 per minute
+# in a group/channel. With WORKERS > 1 every process gets an equal share of the rate.
+OUTBOUND_RATE_LIMIT_ENABLED = True
+OUTBOUND_GLOBAL_RATE = 25  # Messages per second
+OUTBOUND_BURST = 25
+OUTBOUND_CHAT_INTERVAL = 1.0  # Seconds per message in a private chat
+OUTBOUND_GROUP_INTERVAL = 3.0  # Seconds per message in a group or channel
+OUTBOUND_CHAT_BURST = 3  # Messages to one chat that can go out back to back
+OUTBOUND_MAX_RETRIES = 3  # Retries after flood control (retry_after) errors
+
+# Load shedding. Load is "elevated" when event loop lag (seconds) or the number of
+# updates in processing reaches the first pair of thresholds: background work
+# (reports, channel publishing, image hashing) is deferred. At "overloaded" users
+# also get a short "busy" reply to low-priority actions (statistics, history, help).
+# Admins are never shed and skip the MAX_CONCURRENT_UPDATES queue.
+LOAD_ELEVATED_LAG = 0.1
+LOAD_ELEVATED_PENDING = 100
+LOAD_OVERLOADED_LAG = 0.5
+LOAD_OVERLOADED_PENDING = 500
+LOAD_CHECK_INTERVAL = 0.5  # Seconds between event loop lag measurements
+LOAD_MAX_DEFER = 10 * 60  # Deferred work runs anyway after this many seconds
+LOAD_BUSY_REPLY_COOLDOWN = 30  # Seconds between "busy" replies to the same user
+
+# Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics. With WORKERS > 1
+# the front process uses METRICS_PORT and worker N uses METRICS_PORT + 1 + N.
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9101
+
+# SQL tracing (switchable at runtime with /sqltrace): per-statement timings, statements
+# slower than SQL_TRACE_THRESHOLD seconds are logged with their EXPLAIN QUERY PLAN
+SQL_TRACE_ENABLED = False
+SQL_TRACE_THRESHOLD = 0.05
+SQL_TRACE_MAX_STATEMENTS = 500  # Distinct normalized statements tracked
+SQL_TRACE_EXPLAIN_INTERVAL = 300  # Seconds before the plan of the same statement is captured again
+
+# Logging: records go through a queue to a writer thread (logging_setup.py), as JSON
+# lines with the update id, user id, handler and latency, or as text
+LOG_FORMAT_JSON = "json"
+LOG_FORMAT_TEXT = "text"
+LOG_FORMAT = LOG_FORMAT_JSON
+LOG_LEVEL = "INFO"
+LOG_FILE = None  # None writes to stderr
+LOG_QUEUE_SIZE = 10000  # Records beyond this are dropped rather than blocking the event loop
+# Identical warnings and errors (same logger, message and arguments): at most
+# LOG_RATE_LIMIT_BURST per LOG_RATE_LIMIT_INTERVAL seconds
+LOG_RATE_LIMIT_INTERVAL = 60
+LOG_RATE_LIMIT_BURST = 10
+
+# Sampling profiler (/profile [seconds] [wall|cpu])
+PROFILE_INTERVAL = 0.01  # Seconds between stack samples
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 60
+
+# Event loop watchdog: callbacks blocking the loop longer than WATCHDOG_THRESHOLD
+# seconds are logged with their stack (each call site at most once per WATCHDOG_LOG_INTERVAL)
+WATCHDOG_ENABLED = True
+WATCHDOG_THRESHOLD = 0.1
+WATCHDOG_INTERVAL = 0.05  # Seconds between heartbeats of the loop
+WATCHDOG_LOG_INTERVAL = 60
+
+# FSM storage
+FSM_FLUSH_INTERVAL = 0.5  # Seconds between batched writes of changed states
+FSM_FLUSH_MAX_FAILURES = 5  # Failed writes in a row before the flusher gives up until the next change
+FSM_STATE_TTL = 24 * 60 * 60  # Seconds of inactivity after which a dialog state is dropped
+
+# Scheduled jobs
+DAILY_REPORT_CRON = "0 9 * * *"  # minute hour day month weekday (0 = Sunday, as in crontab), local time
+JOB_HISTORY_KEEP = 100  # Runs kept per job
+
+# Online database backups (backup.py): BACKUP_KEEP verified snapshots in BACKUP_DIR,
+# copied BACKUP_PAGES_PER_STEP pages at a time with BACKUP_STEP_SLEEP seconds between steps
+BACKUP_ENABLED = True
+BACKUP_CRON = "0 3 * * *"
+BACKUP_DIR = BASE_DIR / "backups"
+BACKUP_KEEP = 7
+BACKUP_PAGES_PER_STEP = 256  # 1 MB with the default 4 KB pages
+BACKUP_STEP_SLEEP = 0.05
+
+# Cold storage (archive.py): reviewed posts and answered feedback older than ARCHIVE_AFTER_DAYS
+# move to ARCHIVE_DATABASE_PATH, ARCHIVE_BATCH_SIZE rows per transaction with ARCHIVE_BATCH_PAUSE
+# seconds between batches. Archived posts still show in /post and in the author's history
+ARCHIVE_ENABLED = True
+ARCHIVE_CRON = "0 2 * * *"
+ARCHIVE_DATABASE_PATH = BASE_DIR / "archive.db"
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_BATCH_PAUSE = 0.1
+
+# Moderation flag kinds
+FLAG_DUPLICATE_IMAGE = "duplicate_image"
+FLAG_SIMILAR_IMAGE = "similar_image"
+FLAG_SIMILAR_TEXT = "similar_text"
+FLAG_BLOCKLIST = "blocklist"
@@ -1,15 +1,23 @@
+import os
 import sqlite3
+import time
 from contextlib import contextmanager
 from datetime import datetime
 from typing import List, Dict, Optional
-from config import DATABASE_PATH
+from config import DATABASE_PATH, PUBLISH_CHANNEL_ID, ARCHIVE_DATABASE_PATH
+from hash_index import to_signed, to_unsigned
+from metrics import TimedConnection, instrument_methods
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Laplace-smoothed approval rate, recalculated after every moderation outcome
+REPUTATION_FORMULA = "(approved_posts + 1.0) / (approved_posts + rejected_posts + 2.0)"
+
 @contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
+    # Statements are timed for metrics and the SQL tracer, which can be switched on at runtime
+    conn = sqlite3.connect(DATABASE_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -25,6 +33,8 @@ class Database:
 def init_db():
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # WAL lets worker processes read while another one writes (persistent setting)
+        cursor.execute("PRAGMA journal_mode=WAL")
         
         # Users table
         cursor.execute("""
@@ -75,21 +85,224 @@ def init_db():
         )
         """)
         
+        # Moderation flags (duplicates etc.) attached to posts or feedback
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS moderation_flags (
+            flag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            target_type TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            related_id INTEGER,
+            detail TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+        # Perceptual hashes of post images (signed 64-bit)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            post_id INTEGER PRIMARY KEY,
+            phash INTEGER NOT NULL,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        )
+        """)
+
+        # SimHash of post texts and feedback messages (signed 64-bit)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS text_hashes (
+            source TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            simhash INTEGER NOT NULL,
+            PRIMARY KEY (source, item_id)
+        )
+        """)
+
+        # Approved posts waiting for publication to the channel
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS publication_queue (
+            post_id INTEGER PRIMARY KEY,
+            status TEXT DEFAULT 'queued',
+            enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            next_attempt_at TIMESTAMP,
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            published_at TIMESTAMP,
+            channel_message_id INTEGER,
+            FOREIGN KEY (post_id) REFERENCES posts (post_id)
+        )
+        """)
+
+        # History of scheduled job runs
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_name TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            duration REAL,
+            status TEXT NOT NULL,
+            error TEXT
+        )
+        """)
+
+        # FSM states and data (see fsm_storage.SQLiteStorage)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+        """)
+
+        # Cache invalidation events between worker processes (see cache_bus)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            origin INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """)
+
+        # Recently handled update ids, to skip redelivered updates (see update_log)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS processed_updates (
+            update_id INTEGER PRIMARY KEY,
+            processed_at REAL NOT NULL
+        )
+        """)
+
+        # Raw updates received in multi-process mode but not handled yet (see update_log)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS update_inbox (
+            update_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            received_at REAL NOT NULL
+        )
+        """)
+
+        # Sends that were still queued at shutdown, replayed on the next start (see outbound)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            method TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+
+        # Columns added after the initial schema
+        ensure_column(cursor, "posts", "image_unique_id", "TEXT")
+        ensure_column(cursor, "posts", "priority", "INTEGER DEFAULT 0")
+        # "<chat_id>:<message_id>" of the submitting message, guards against double inserts
+        ensure_column(cursor, "posts", "idempotency_key", "TEXT")
+        ensure_column(cursor, "feedback", "idempotency_key", "TEXT")
+        if ensure_column(cursor, "users", "reputation", "REAL DEFAULT 0.5"):
+            cursor.execute(f"UPDATE users SET reputation = {REPUTATION_FORMULA}")
+
+        # Indexes
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_posts_image_unique_id ON posts (image_unique_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_moderation_flags_target ON moderation_flags (target_type, target_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_posts_status_priority ON posts (status, priority DESC, created_at)"
+        )
+        # Other statuses are listed by date only, which the priority index can't serve
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_posts_status_created ON posts (status, created_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_publication_queue_status ON publication_queue (status, enqueued_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_publication_queue_published ON publication_queue (published_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_job_runs_job ON job_runs (job_name, run_id)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)"
+        )
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_idempotency_key ON posts (idempotency_key)"
+        )
+        cursor.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_feedback_idempotency_key ON feedback (idempotency_key)"
+        )
+        
         conn.commit()
 
+        # Columns added above must reach the archive too, it is read with SELECT * ... UNION ALL
+        if os.path.exists(ARCHIVE_DATABASE_PATH):
+            attach_archive(conn)
+            sync_archive_schema(conn)
+
+
+# Tables moved to the archive database (archive.py) and their id columns
+ARCHIVED_TABLES = {'posts': 'post_id', 'feedback': 'feedback_id'}
+# Columns archived rows are looked up by
+ARCHIVE_INDEXES = {'posts': ['user_id', 'image_unique_id'], 'feedback': ['user_id']}
+
+
+def attach_archive(conn: sqlite3.Connection) -> bool:
+    """Attach the archive database as `archive`, False if it does not exist yet"""
+    if not os.path.exists(ARCHIVE_DATABASE_PATH):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (str(ARCHIVE_DATABASE_PATH),))
+    return True
+
+
+def sync_archive_schema(conn: sqlite3.Connection):
+    """Create the archive tables, or add columns added to the main ones since, in the same order"""
+    for table, id_column in ARCHIVED_TABLES.items():
+        columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA main.table_info({table})")]
+        existing = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+        if not existing:
+            definitions = ", ".join(
+                f"{name} {kind} PRIMARY KEY" if name == id_column else f"{name} {kind}" for name, kind in columns
+            )
+            conn.execute(f"CREATE TABLE archive.{table} ({definitions})")
+        else:
+            for name, kind in columns:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {kind}")
+        for column in ARCHIVE_INDEXES[table]:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_{column} ON {table} ({column})")
+    conn.commit()
+
+
+def ensure_column(cursor, table: str, column: str, definition: str):
+    """Add column to an existing table if it is missing"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row['name'] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return True
+    return False
+
 class Database:
     @staticmethod
-    def create_post(user_id: int, text: str, image_file_id: str):
-        """Create new post with transaction handling"""
+    def create_post(user_id: int, text: str, image_file_id: str, image_unique_id: str = None, priority: int = 0,
+                    idempotency_key: str = None):
+        """Create new post with transaction handling (returns existing post for a repeated idempotency key)"""
         with get_db_connection() as conn:
             try:
                 cursor = conn.cursor()
                 
                 # Insert post
                 cursor.execute(
-                    "INSERT INTO posts (user_id, text_content, image_file_id) VALUES (?, ?, ?)",
-                    (user_id, text, image_file_id)
+                    """INSERT INTO posts (user_id, text_content, image_file_id, image_unique_id, priority, idempotency_key)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(idempotency_key) DO NOTHING""",
+                    (user_id, text, image_file_id, image_unique_id, priority, idempotency_key)
                 )
+                if cursor.rowcount == 0:
+                    cursor.execute("SELECT post_id FROM posts WHERE idempotency_key = ?", (idempotency_key,))
+                    return cursor.fetchone()['post_id']
                 post_id = cursor.lastrowid
                 
                 # Update user stats
@@ -102,7 +315,7 @@ class Database:
                 return post_id
             except sqlite3.Error as e:
                 conn.rollback()
-                logger.error(f"Error creating post: {e}")
+                logger.error("Error creating post: %s", e)
                 raise
    
     @staticmethod
@@ -136,10 +349,20 @@ class Database:
 
     
     @staticmethod
-    def get_user_posts(user_id: int):
-        """Get all posts by user"""
+    def get_user_posts(user_id: int, include_archived: bool = True):
+        """Get all posts by user, archived ones included"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            if include_archived and attach_archive(conn):
+                # A post can be in both for a moment if archiving was interrupted
+                cursor.execute("""
+                    SELECT * FROM main.posts WHERE user_id = ?
+                    UNION ALL
+                    SELECT * FROM archive.posts
+                    WHERE user_id = ? AND post_id NOT IN (SELECT post_id FROM main.posts WHERE user_id = ?)
+                    ORDER BY created_at DESC
+                    """, (user_id, user_id, user_id))
+                return cursor.fetchall()
             cursor.execute("""
                 SELECT * FROM posts 
                 WHERE user_id = ?
@@ -217,16 +440,130 @@ class Database:
             return cursor.fetchone()
     @staticmethod
     def get_posts_by_status(status: str):
+        # Pending queue is served by priority (trusted submitters first)
+        order = "p.priority DESC, p.created_at" if status == 'pending' else "p.created_at"
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT p.*, u.username, u.telegram_id 
                 FROM posts p
                 JOIN users u ON p.user_id = u.internal_id
                 WHERE p.status = ?
-                ORDER BY p.created_at
+                ORDER BY {order}
                 """, (status,))
             return cursor.fetchall()
+
+    @staticmethod
+    def find_post_by_image(image_unique_id: str):
+        """
+        Get the earliest post with the same image (by Telegram file_unique_id).
+        The archive is only attached and searched when the bot database has none,
+        so a recent decision wins over an archived one.
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM posts
+                WHERE image_unique_id = ?
+                ORDER BY post_id
+                LIMIT 1
+                """, (image_unique_id,))
+            result = cursor.fetchone()
+            if result is None and attach_archive(conn):
+                cursor.execute("""
+                    SELECT * FROM archive.posts
+                    WHERE image_unique_id = ?
+                    ORDER BY post_id
+                    LIMIT 1
+                    """, (image_unique_id,))
+                result = cursor.fetchone()
+            return dict(result) if result else None
+
+    @staticmethod
+    def save_image_hash(post_id: int, phash: int):
+        """Store perceptual hash of post image"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO image_hashes (post_id, phash) VALUES (?, ?)",
+                (post_id, to_signed(phash))
+            )
+            conn.commit()
+
+    @staticmethod
+    def get_image_hashes():
+        """Get all (post_id, phash) pairs"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT post_id, phash FROM image_hashes")
+            return [(row['post_id'], to_unsigned(row['phash'])) for row in cursor.fetchall()]
+
+    @staticmethod
+    def save_text_hash(source: str, item_id: int, simhash: int):
+        """Store SimHash of post text or feedback message"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR REPLACE INTO text_hashes (source, item_id, simhash) VALUES (?, ?, ?)",
+                (source, item_id, to_signed(simhash))
+            )
+            conn.commit()
+
+    @staticmethod
+    def get_text_hashes():
+        """Get all (source, item_id, simhash) triples"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT source, item_id, simhash FROM text_hashes")
+            return [
+                (row['source'], row['item_id'], to_unsigned(row['simhash']))
+                for row in cursor.fetchall()
+            ]
+
+    # ======================
+    # Moderation Flags
+    # ======================
+
+    @staticmethod
+    def add_flag(target_type: str, target_id: int, kind: str, related_id: int = None, detail: str = None):
+        """Attach moderation flag to a post or feedback"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO moderation_flags (target_type, target_id, kind, related_id, detail)
+                VALUES (?, ?, ?, ?, ?)
+                """, (target_type, target_id, kind, related_id, detail))
+            conn.commit()
+            return cursor.lastrowid
+
+    @staticmethod
+    def get_flags(target_type: str, target_ids: List[int]) -> Dict[int, List[dict]]:
+        """Get moderation flags for several posts/feedback at once"""
+        if not target_ids:
+            return {}
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ", ".join("?" for _ in target_ids)
+            cursor.execute(f"""
+                SELECT * FROM moderation_flags
+                WHERE target_type = ? AND target_id IN ({placeholders})
+                ORDER BY flag_id
+                """, (target_type, *target_ids))
+            flags = {}
+            for row in cursor.fetchall():
+                flags.setdefault(row['target_id'], []).append(dict(row))
+            return flags
+
+    @staticmethod
+    def get_flag_links(target_type: str, kind: str):
+        """Get (target_id, related_id) pairs of flags of given kind"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT target_id, related_id FROM moderation_flags
+                WHERE target_type = ? AND kind = ? AND related_id IS NOT NULL
+                """, (target_type, kind))
+            return [(row['target_id'], row['related_id']) for row in cursor.fetchall()]
     # @staticmethod
     # def update_post_status(post_id: int, status: str, admin_id: int, rejection_reason: str = None):
     #     with get_db_connection() as conn:
@@ -284,23 +621,92 @@ class Database:
                     f"UPDATE users SET {column} = {column} + 1 WHERE internal_id = ?",
                     (post['user_id'],)
                 )
+                cursor.execute(
+                    f"UPDATE users SET reputation = {REPUTATION_FORMULA} WHERE internal_id = ?",
+                    (post['user_id'],)
+                )
+
+            # Approved posts go to the channel publication queue
+            if status == 'approved' and PUBLISH_CHANNEL_ID:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO publication_queue (post_id) VALUES (?)",
+                    (post_id,)
+                )
+            conn.commit()
+
+    @staticmethod
+    def link_duplicate_post(post_id: int, original: dict):
+        """
+        Give a resubmitted image the decision of its original. Unlike
+        update_post_status this is not a review: user counters and reputation
+        stay as they are and nothing is queued for publication.
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """UPDATE posts 
+                SET status = ?, 
+                    reviewed_at = datetime('now'), 
+                    reviewed_by = ?,
+                    rejection_reason = ?
+                WHERE post_id = ?""",
+                (original['status'], original['reviewed_by'], original['rejection_reason'], post_id)
+            )
+            conn.commit()
+
+    @staticmethod
+    def auto_approve_post(post_id: int):
+        """
+        Approve a post of a trusted submitter without a moderator. Only reviews
+        by admins count: user counters and reputation stay as they are, so
+        auto-approved posts cannot keep their author trusted on their own.
+        """
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """UPDATE posts 
+                SET status = 'approved', 
+                    reviewed_at = datetime('now'), 
+                    reviewed_by = NULL
+                WHERE post_id = ?""",
+                (post_id,)
+            )
+            if PUBLISH_CHANNEL_ID:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO publication_queue (post_id) VALUES (?)",
+                    (post_id,)
+                )
             conn.commit()
     # ======================
     # Feedback Methods
     # ======================
     
     @staticmethod
-    def create_feedback(user_id: int, message: str):
-        """Create new feedback"""
+    def create_feedback(user_id: int, message: str, idempotency_key: str = None):
+        """Create new feedback (returns existing feedback for a repeated idempotency key)"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO feedback (user_id, message) 
-                VALUES (?, ?)
-                """, (user_id, message))
+                INSERT INTO feedback (user_id, message, idempotency_key) 
+                VALUES (?, ?, ?)
+                ON CONFLICT(idempotency_key) DO NOTHING
+                """, (user_id, message, idempotency_key))
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT feedback_id FROM feedback WHERE idempotency_key = ?", (idempotency_key,))
+                return cursor.fetchone()['feedback_id']
             conn.commit()
             return cursor.lastrowid
 
+    @staticmethod
+    def find_by_idempotency_key(table: str, idempotency_key: str) -> Optional[int]:
+        """Id of the post/feedback created from the given message, if any"""
+        id_column = {'posts': 'post_id', 'feedback': 'feedback_id'}[table]
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT {id_column} FROM {table} WHERE idempotency_key = ?", (idempotency_key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
     @staticmethod
     def get_feedback(feedback_id: int):
         """Get feedback by ID"""
@@ -342,6 +748,223 @@ class Database:
                 """, (response, admin_id, feedback_id))
             conn.commit()
 
+    # ======================
+    # Publication Queue Methods
+    # ======================
+
+    @staticmethod
+    def get_next_publication():
+        """Get the oldest queued post that is due for publication"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT q.post_id, q.attempts, p.text_content, p.image_file_id
+                FROM publication_queue q
+                JOIN posts p ON q.post_id = p.post_id
+                WHERE q.status = 'queued'
+                  AND (q.next_attempt_at IS NULL OR q.next_attempt_at <= datetime('now'))
+                ORDER BY q.enqueued_at, q.post_id
+                LIMIT 1
+                """)
+            result = cursor.fetchone()
+            return dict(result) if result else None
+
+    @staticmethod
+    def mark_publication_sending(post_id: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE publication_queue SET status = 'sending', attempts = attempts + 1 WHERE post_id = ?",
+                (post_id,)
+            )
+            conn.commit()
+
+    @staticmethod
+    def mark_publication_published(post_id: int, channel_message_id: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE publication_queue
+                SET status = 'published',
+                    published_at = datetime('now'),
+                    channel_message_id = ?,
+                    last_error = NULL
+                WHERE post_id = ?
+                """, (channel_message_id, post_id))
+            conn.commit()
+
+    @staticmethod
+    def mark_publication_failed(post_id: int, error: str, retry_in: Optional[int] = None):
+        """Schedule retry in `retry_in` seconds, or give up if it is None"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if retry_in is None:
+                cursor.execute(
+                    "UPDATE publication_queue SET status = 'failed', last_error = ? WHERE post_id = ?",
+                    (error, post_id)
+                )
+            else:
+                cursor.execute("""
+                    UPDATE publication_queue
+                    SET status = 'queued',
+                        last_error = ?,
+                        next_attempt_at = datetime('now', ?)
+                    WHERE post_id = ?
+                    """, (error, f"+{int(retry_in)} seconds", post_id))
+            conn.commit()
+
+    @staticmethod
+    def requeue_interrupted_publications() -> int:
+        """Return posts left in 'sending' by a crash back to the queue"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE publication_queue SET status = 'queued' WHERE status = 'sending'")
+            conn.commit()
+            return cursor.rowcount
+
+    @staticmethod
+    def get_seconds_since_last_publication() -> Optional[float]:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT (julianday('now') - julianday(MAX(published_at))) * 86400 AS seconds
+                FROM publication_queue
+                """)
+            return cursor.fetchone()['seconds']
+
+    @staticmethod
+    def get_publication_stats() -> Dict[str, int]:
+        """Count queue entries by status"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) AS count FROM publication_queue GROUP BY status")
+            return {row['status']: row['count'] for row in cursor.fetchall()}
+
+    # ======================
+    # Scheduled Jobs Methods
+    # ======================
+
+    @staticmethod
+    def add_job_run(job_name: str, started_at: str, duration: float, status: str, error: str = None):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO job_runs (job_name, started_at, duration, status, error)
+                VALUES (?, ?, ?, ?, ?)
+                """, (job_name, started_at, duration, status, error))
+            conn.commit()
+
+    @staticmethod
+    def trim_job_runs(keep: int = 100) -> int:
+        """Keep only the latest `keep` runs of every job"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM job_runs
+                WHERE run_id IN (
+                    SELECT run_id FROM (
+                        SELECT run_id, ROW_NUMBER() OVER (
+                            PARTITION BY job_name ORDER BY run_id DESC
+                        ) AS position
+                        FROM job_runs
+                    )
+                    WHERE position > ?
+                )
+                """, (keep,))
+            conn.commit()
+            return cursor.rowcount
+
+    # ======================
+    # Outbox Methods
+    # ======================
+
+    @staticmethod
+    def add_outbox_message(method: str, payload: str, priority: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO outbox (method, payload, priority)
+                VALUES (?, ?, ?)
+                """, (method, payload, priority))
+            conn.commit()
+
+    @staticmethod
+    def get_outbox_messages(limit: int = 100) -> List[dict]:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM outbox
+                ORDER BY priority, message_id
+                LIMIT ?
+                """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def delete_outbox_message(message_id: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM outbox WHERE message_id = ?", (message_id,))
+            conn.commit()
+
+    # ======================
+    # Cache Events Methods
+    # ======================
+
+    @staticmethod
+    def add_cache_event(channel: str, payload: str, origin: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO cache_events (channel, payload, origin, created_at)
+                VALUES (?, ?, ?, ?)
+                """, (channel, payload, origin, time.time()))
+            conn.commit()
+
+    @staticmethod
+    def get_last_cache_event_id() -> int:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COALESCE(MAX(event_id), 0) FROM cache_events")
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def get_cache_events(after_id: int, limit: int = 1000) -> List[dict]:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT * FROM cache_events
+                WHERE event_id > ?
+                ORDER BY event_id
+                LIMIT ?
+                """, (after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def trim_cache_events(max_age: float) -> int:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM cache_events WHERE created_at < ?", (time.time() - max_age,))
+            conn.commit()
+            return cursor.rowcount
+
+    @staticmethod
+    def get_daily_report() -> Dict[str, int]:
+        """Moderation numbers for the daily admin report"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT
+                    (SELECT COUNT(*) FROM posts WHERE status = 'pending') AS pending_posts,
+                    (SELECT COUNT(*) FROM posts WHERE created_at >= datetime('now', '-1 day')) AS new_posts,
+                    (SELECT COUNT(*) FROM posts
+                     WHERE status = 'approved' AND reviewed_at >= datetime('now', '-1 day')) AS approved_posts,
+                    (SELECT COUNT(*) FROM posts
+                     WHERE status = 'rejected' AND reviewed_at >= datetime('now', '-1 day')) AS rejected_posts,
+                    (SELECT COUNT(*) FROM feedback WHERE admin_response IS NULL) AS pending_feedback,
+                    (SELECT COUNT(*) FROM users WHERE created_at >= datetime('now', '-1 day')) AS new_users
+                """)
+            return dict(cursor.fetchone())
+
     # ======================
     # Statistics Methods
     # ======================
@@ -403,22 +1026,28 @@ class Database:
 
     @staticmethod
     def get_post_with_details(post_id: int):
+        """Post with author and moderator names, looked up in the archive too ('archived' key)"""
         with get_db_connection() as conn:
             conn.row_factory = sqlite3.Row  # Ensure Row factory is set
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT 
-                    p.*,
-                    u.username as user_username,
-                    u.telegram_id as user_telegram_id,
-                    a.username as admin_username
-                FROM posts p
-                JOIN users u ON p.user_id = u.internal_id
-                LEFT JOIN users a ON p.reviewed_by = a.internal_id
-                WHERE p.post_id = ?
-            """, (post_id,))
-            result = cursor.fetchone()
-            return dict(result) if result else None
+            for schema in ("main", "archive"):
+                if schema == "archive" and not attach_archive(conn):
+                    break
+                cursor.execute(f"""
+                    SELECT 
+                        p.*,
+                        u.username as user_username,
+                        u.telegram_id as user_telegram_id,
+                        a.username as admin_username
+                    FROM {schema}.posts p
+                    JOIN main.users u ON p.user_id = u.internal_id
+                    LEFT JOIN main.users a ON p.reviewed_by = a.internal_id
+                    WHERE p.post_id = ?
+                """, (post_id,))
+                result = cursor.fetchone()
+                if result:
+                    return {**dict(result), 'archived': schema == "archive"}
+            return None
 
 
     @staticmethod
@@ -447,4 +1076,6 @@ class Database:
                 WHERE status = 'active'
                 ORDER BY internal_id
             """)
-            return cursor.fetchall()
\ No newline at end of file
+            return cursor.fetchall()
+
+instrument_methods(Database)
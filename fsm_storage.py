@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType, DefaultKeyBuilder
+
+from config import DATABASE_PATH, FSM_FLUSH_INTERVAL, FSM_FLUSH_MAX_FAILURES, FSM_STATE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class StateRecord:
+    __slots__ = ("state", "data", "updated_at", "size")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None,
+                 updated_at: float = 0.0, size: int = 0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        self.size = size  # Length of the JSON data as stored
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage persisted in SQLite (table fsm_states).
+
+    All records are kept in memory, so reads never touch the disk. Writes
+    update the cache immediately and are flushed to SQLite in batches every
+    FSM_FLUSH_INTERVAL seconds from a worker thread. Records untouched for
+    FSM_STATE_TTL seconds are evicted by evict_expired().
+    """
+
+    def __init__(self, path=DATABASE_PATH, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 ttl: float = FSM_STATE_TTL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self.records: Dict[str, StateRecord] = {}
+        self.dirty = set()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.write_lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def load(self):
+        """Load all non-expired records into memory"""
+        cutoff = time.time() - self.ttl
+        self.conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (cutoff,))
+        self.conn.commit()
+        for key, state, data, updated_at in self.conn.execute(
+            "SELECT key, state, data, updated_at FROM fsm_states"
+        ):
+            self.records[key] = StateRecord(state, json.loads(data) if data else {}, updated_at, len(data or ""))
+        logger.info("Loaded %s FSM records", len(self.records))
+
+    def _get(self, key: StorageKey) -> Optional[StateRecord]:
+        return self.records.get(self.key_builder.build(key))
+
+    def _touch(self, key: StorageKey) -> StateRecord:
+        string_key = self.key_builder.build(key)
+        record = self.records.get(string_key)
+        if record is None:
+            record = self.records[string_key] = StateRecord()
+        record.updated_at = time.time()
+        self.dirty.add(string_key)
+        self._ensure_flusher()
+        return record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._touch(key)
+        record.state = state.state if isinstance(state, State) else state
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = self._touch(key)
+        record.data = dict(data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    def _ensure_flusher(self):
+        if self.closed:
+            logger.warning("FSM state changed after the storage was closed, the change is not saved")
+            return
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        failures = 0
+        while self.dirty and not self.closed:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logger.error("Failed to flush FSM storage (%s in a row): %s", failures, e)
+                if failures >= FSM_FLUSH_MAX_FAILURES:
+                    # Records stay dirty, the next change or close() writes them
+                    logger.error("FSM flusher stopped, %s changed records not saved yet", len(self.dirty))
+                    return
+
+    def _take_dirty(self):
+        """Changed keys with their rows to upsert and delete, the keys are no longer dirty"""
+        keys, self.dirty = self.dirty, set()
+        upserts, deletes = [], []
+        for key in keys:
+            record = self.records.get(key)
+            if record is None or record.is_empty():
+                self.records.pop(key, None)
+                deletes.append((key,))
+                continue
+            data = json.dumps(record.data, ensure_ascii=False) if record.data else None
+            record.size = len(data or "")
+            upserts.append((key, record.state, data, record.updated_at))
+        return keys, upserts, deletes
+
+    async def flush(self):
+        """Write changed records to SQLite in one transaction"""
+        async with self.write_lock:
+            if not self.dirty or self.closed:
+                return
+            keys, upserts, deletes = self._take_dirty()
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes)
+            except Exception:
+                self.dirty |= keys  # Retry on next flush
+                raise
+
+    def _write(self, upserts, deletes):
+        with self.conn:
+            if upserts:
+                self.conn.executemany("""
+                    INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                    """, upserts)
+            if deletes:
+                self.conn.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+
+    async def evict_expired(self) -> int:
+        """Drop records untouched for longer than TTL (abandoned dialogs)"""
+        cutoff = time.time() - self.ttl
+        expired = [key for key, record in self.records.items() if record.updated_at < cutoff]
+        for key in expired:
+            del self.records[key]
+            self.dirty.discard(key)
+        async with self.write_lock:
+            if not self.closed:
+                await asyncio.to_thread(self._delete_expired, cutoff)
+        if expired:
+            logger.info("Evicted %s expired FSM records", len(expired))
+        return len(expired)
+
+    def _delete_expired(self, cutoff: float):
+        with self.conn:
+            self.conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (cutoff,))
+
+    def stats(self) -> Dict[str, int]:
+        """Live state count and the JSON size of cached data (as stored, not its memory footprint)"""
+        return {
+            'records': len(self.records),
+            'states': sum(1 for record in self.records.values() if record.state),
+            'dirty': len(self.dirty),
+            'serialized_bytes': sum(record.size for record in self.records.values()),
+        }
+
+    async def close(self) -> None:
+        """Write out all changes and close the connection; later calls do nothing"""
+        if self.closed:
+            return
+        self.closed = True
+        # Holding the lock, no write is in progress: the flusher is sleeping or waiting for the lock
+        async with self.write_lock:
+            if self.flush_task:
+                self.flush_task.cancel()
+            keys, upserts, deletes = self._take_dirty()
+            try:
+                self._write(upserts, deletes)
+            except Exception as e:
+                logger.error("Failed to save %s FSM records on close: %s", len(keys), e)
+            self.conn.close()
@@ -7,7 +7,8 @@ from aiogram.types import (
     KeyboardButton,
     ReplyKeyboardRemove,
     InlineKeyboardMarkup,
-    InlineKeyboardButton
+    InlineKeyboardButton,
+    BufferedInputFile
 )
 from aiogram.filters import Command  # Add this import
 from aiogram.fsm.context import FSMContext
@@ -25,9 +26,27 @@ from keyboards import (
     get_cancel_Notify_keyboard,
     get_main_keyboard
 )
-from config import ADMIN_IDS
+from config import ADMIN_IDS, PUBLISH_CHANNEL_ID, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
 import logging
-from utils import format_datetime
+import os
+from datetime import datetime
+from utils import format_datetime, format_flags
+import text_hash
+import cache_bus
+from scheduler import JobScheduler
+from middlewares import OrderedConcurrencyMiddleware
+from load_manager import load
+from loop_watchdog import watchdog
+from sql_trace import tracer
+import profiler
+from outbound import (
+    send_later,
+    send_priority,
+    get_outbound_scheduler,
+    SendCheckpointed,
+    PRIORITY_MODERATION,
+    PRIORITY_BROADCAST
+)
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -54,6 +73,8 @@ async def send_post_details(message: Message, post_id: int):
             response += f"📅 <b>Модерация:</b> {format_datetime(post['reviewed_at'])}\n"
         if post['admin_username']:
             response += f"👨‍💻 <b>Модератор:</b> @{post['admin_username']}\n"
+        if post['archived']:
+            response += "🗄 <b>Из архива</b>\n"
         if post['rejection_reason']:
             response += f"📝 <b>Причина отказа:</b> {post['rejection_reason']}\n"
 
@@ -70,7 +91,7 @@ async def send_post_details(message: Message, post_id: int):
                     parse_mode="HTML"
                 )
             except Exception as e:
-                logger.error(f"Error sending photo: {e}")
+                logger.error("Error sending photo: %s", e)
                 await message.answer(
                     "🖼 <b>Изображение:</b> (не удалось отправить)\n\n" + response,
                     parse_mode="HTML"
@@ -82,7 +103,7 @@ async def send_post_details(message: Message, post_id: int):
             )
 
     except Exception as e:
-        logger.error(f"Error in send_post_details: {e}")
+        logger.error("Error in send_post_details: %s", e)
         await message.answer("Произошла ошибка при загрузке поста.")
 
 @router.message(F.text.regexp(r'^/post \d+$'))
@@ -115,10 +136,15 @@ async def handle_post_view_request(message: Message):
         
         if post.get('reviewed_at'):
             response += f"📅 Дата модерации: {post.get('reviewed_at')}\n"
+        if post.get('archived'):
+            response += "🗄 Из архива\n"
         if post.get('admin_username'):
             response += f"👨‍💻 Модератор: @{post.get('admin_username')}\n"
         if post.get('rejection_reason') and post.get('status') == 'rejected':
             response += f"📝 Причина отклонения: {post.get('rejection_reason')}\n"
+        flags = Database.get_flags('post', [post['post_id']]).get(post['post_id'])
+        if flags:
+            response += format_flags(flags) + "\n"
             
         if post.get('image_file_id'):
             await message.answer_photo(
@@ -138,7 +164,7 @@ async def handle_post_view_request(message: Message):
     except ValueError:
         await message.answer("Неверный формат. Используйте: /post ID")
     except Exception as e:
-        logger.error(f"Error in handle_post_view_request: {e}")
+        logger.error("Error in handle_post_view_request: %s", e)
         await message.answer("Произошла ошибка при просмотре поста")
 
 
@@ -175,7 +201,7 @@ async def show_pending_posts(message: Message, bot: Bot):
         await message.answer("Для просмотра профиля отправителя поста введите /user ID", reply_markup=get_admin_keyboard())
 
     except Exception as e:
-        logger.error(f"Error showing pending posts: {e}")
+        logger.error("Error showing pending posts: %s", e)
         await message.answer("❌ Ошибка при загрузке постов.")
 
 
@@ -197,7 +223,7 @@ async def admin_panel(message: Message):
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in admin_panel: {e}")
+        logger.error("Error in admin_panel: %s", e)
         await message.answer("❌ Ошибка доступа к админ-панели")
 
 # ======================
@@ -239,7 +265,7 @@ async def show_users_list(message: Message):
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in show_users_list: {e}")
+        logger.error("Error in show_users_list: %s", e)
         await message.answer("❌ Ошибка загрузки пользователей")
 
 @router.message(Command("user"))
@@ -277,7 +303,8 @@ async def show_user_profile(message: Message):
             f"📊 Статистика:\n"
             f"📤 Отправлено: {user['submitted_posts']}\n"
             f"✅ Одобрено: {user['approved_posts']}\n"
-            f"❌ Отклонено: {user['rejected_posts']}"
+            f"❌ Отклонено: {user['rejected_posts']}\n"
+            f"⭐ Репутация: {user['reputation']:.2f}"
         )
         
         await message.answer(
@@ -290,7 +317,7 @@ async def show_user_profile(message: Message):
     except ValueError:
         await message.answer("❌ Неверный ID. Введите число")
     except Exception as e:
-        logger.error(f"Error in show_user_profile: {e}")
+        logger.error("Error in show_user_profile: %s", e)
         await message.answer("❌ Ошибка загрузки профиля")
 
 @router.callback_query(F.data.startswith("block_user:"))
@@ -305,7 +332,7 @@ async def block_user(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_cancel_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in block_user: {e}")
+        logger.error("Error in block_user: %s", e)
         await callback.answer("❌ Ошибка блокировки")
 
 @router.message(UserManagement.waiting_for_block_reason)
@@ -329,19 +356,20 @@ async def process_block_reason(message: Message, state: FSMContext, bot: Bot):
         user = Database.get_user_by_id(data['user_id'])
         if user:
             try:
-                await bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=f"❌ Вы были заблокированы!\nПричина: {message.text}"
-                )
+                with send_priority(PRIORITY_MODERATION):
+                    await bot.send_message(
+                        chat_id=user['telegram_id'],
+                        text=f"❌ Вы были заблокированы!\nПричина: {message.text}"
+                    )
             except Exception as e:
-                logger.error(f"Failed to notify user: {e}")
+                logger.error("Failed to notify user: %s", e)
         
         await message.answer(
             "✅ Пользователь заблокирован",
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in process_block_reason: {e}")
+        logger.error("Error in process_block_reason: %s", e)
         await message.answer("❌ Ошибка блокировки")
 
 @router.callback_query(F.data.startswith("unblock_user:"))
@@ -356,7 +384,7 @@ async def unblock_user(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_cancel_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in unblock_user: {e}")
+        logger.error("Error in unblock_user: %s", e)
         await callback.answer("❌ Ошибка разблокировки")
 
 @router.message(UserManagement.waiting_for_unblock_reason)
@@ -380,19 +408,20 @@ async def process_unblock_reason(message: Message, state: FSMContext, bot: Bot):
         user = Database.get_user_by_id(data['user_id'])
         if user:
             try:
-                await bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=f"✅ Вы были разблокированы!\nПричина: {message.text}"
-                )
+                with send_priority(PRIORITY_MODERATION):
+                    await bot.send_message(
+                        chat_id=user['telegram_id'],
+                        text=f"✅ Вы были разблокированы!\nПричина: {message.text}"
+                    )
             except Exception as e:
-                logger.error(f"Failed to notify user: {e}")
+                logger.error("Failed to notify user: %s", e)
         
         await message.answer(
             "✅ Пользователь разблокирован",
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in process_unblock_reason: {e}")
+        logger.error("Error in process_unblock_reason: %s", e)
         await message.answer("❌ Ошибка разблокировки")
 
 # ======================
@@ -411,6 +440,7 @@ async def show_pending_posts(message: Message, bot: Bot):
         if not user or user['role'] != 'admin':
             await message.answer("❌ У вас нет доступа к командам администрации")
             return
+        flags = Database.get_flags('post', [post['post_id'] for post in posts])
         for post in posts:
             caption = (
                 f"🆔 ID поста: {post['post_id']}\n"
@@ -418,6 +448,8 @@ async def show_pending_posts(message: Message, bot: Bot):
                 f"📅 Дата: {format_datetime(post['created_at'])}\n"
                 f"📝 Текст: {post['text_content'] or 'отсутствует'}"
             )
+            if post['post_id'] in flags:
+                caption += "\n\n" + format_flags(flags[post['post_id']])
 
             if post['image_file_id']:
                 await bot.send_photo(
@@ -432,7 +464,7 @@ async def show_pending_posts(message: Message, bot: Bot):
                     reply_markup=get_post_actions_keyboard(post['post_id'])
                 )
     except Exception as e:
-        logger.error(f"Error showing pending posts: {e}")
+        logger.error("Error showing pending posts: %s", e)
         await message.answer("❌ Ошибка при загрузке постов.")
 
 @router.message(F.text == "✅ Одобренные посты")
@@ -477,7 +509,7 @@ async def show_posts_by_status(message: Message, status: str):
             reply_markup=ReplyKeyboardRemove()
         )
     except Exception as e:
-        logger.error(f"Error showing {status} posts: {e}")
+        logger.error("Error showing %s posts: %s", status, e)
         await message.answer("❌ Ошибка при загрузке постов")
 
 @router.callback_query(F.data.startswith("approve_post:"))
@@ -509,7 +541,7 @@ async def approve_post(callback: CallbackQuery, bot: Bot):
         else:
             logger.warning("callback.message is None")
     except Exception as e:
-        logger.error(f"Error approving post: {e}")
+        logger.error("Error approving post: %s", e)
         await callback.answer("❌ Ошибка при одобрении поста")
 
 
@@ -556,7 +588,7 @@ async def complete_reject_post(message: Message, state: FSMContext, bot: Bot):
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error rejecting post: {e}")
+        logger.error("Error rejecting post: %s", e)
         await message.answer("❌ Ошибка при отклонении поста")
         
 @router.message(UserManagement.waiting_for_rejection_reason)
@@ -590,7 +622,7 @@ async def process_rejection(message: Message, state: FSMContext, bot: Bot):
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error rejecting post: {e}")
+        logger.error("Error rejecting post: %s", e)
         await message.answer("❌ Ошибка при отклонении поста")
 
 # Notification Utility
@@ -625,13 +657,14 @@ async def notify_post_status(user_id: int, post_id: int, status: str, bot: Bot,
         if status == 'rejected':
             message += f"📝 Причина: {reason or post.get('rejection_reason', 'не указана')}\n"
 
-        await bot.send_message(
-            chat_id=user['telegram_id'],
-            text=message,
-            parse_mode="Markdown"
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=user['telegram_id'],
+                text=message,
+                parse_mode="Markdown"
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user about post status: {e}")
+        logger.error("Failed to notify user about post status: %s", e)
 
 # ======================
 # FEEDBACK MANAGEMENT
@@ -651,6 +684,7 @@ async def show_pending_feedback(message: Message):
             await message.answer("ℹ️ Нет новых сообщений")
             return
         
+        flags = Database.get_flags('feedback', [feedback['feedback_id'] for feedback in feedback_list])
         for feedback in feedback_list:
             response = (
                 f"📩 Сообщение #{feedback['feedback_id']}\n\n"
@@ -658,13 +692,15 @@ async def show_pending_feedback(message: Message):
                 f"📅 Дата: {format_datetime(feedback['created_at'])}\n\n"
                 f"📝 Текст:\n{feedback['message']}"
             )
+            if feedback['feedback_id'] in flags:
+                response += "\n\n" + format_flags(flags[feedback['feedback_id']])
             
             await message.answer(
                 response,
                 reply_markup=get_feedback_response_keyboard(feedback['feedback_id'])
             )
     except Exception as e:
-        logger.error(f"Error in show_pending_feedback: {e}")
+        logger.error("Error in show_pending_feedback: %s", e)
         await message.answer("❌ Ошибка загрузки сообщений")
 
 @router.callback_query(F.data.startswith("respond_feedback:"))
@@ -679,7 +715,7 @@ async def respond_to_feedback(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_cancel_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in respond_to_feedback: {e}")
+        logger.error("Error in respond_to_feedback: %s", e)
         await callback.answer("❌ Ошибка ответа")
 
 @router.message(Feedback.waiting_for_response)
@@ -708,9 +744,325 @@ async def process_feedback_response(message: Message, state: FSMContext, bot: Bo
             reply_markup=get_admin_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in process_feedback_response: {e}")
+        logger.error("Error in process_feedback_response: %s", e)
         await message.answer("❌ Ошибка отправки ответа")
 
+# ======================
+# PUBLICATION QUEUE
+# ======================
+
+@router.message(Command("queue"))
+async def show_publication_queue(message: Message):
+    """Show channel publication queue status"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        if not PUBLISH_CHANNEL_ID:
+            await message.answer("ℹ️ Публикация в канал не настроена (PUBLISH_CHANNEL_ID)")
+            return
+
+        stats = Database.get_publication_stats()
+        seconds = Database.get_seconds_since_last_publication()
+        last_published = f"{int(seconds // 60)} мин. назад" if seconds is not None else "ещё не было"
+        await message.answer(
+            f"📰 Очередь публикации:\n\n"
+            f"⏳ В очереди: {stats.get('queued', 0) + stats.get('sending', 0)}\n"
+            f"✅ Опубликовано: {stats.get('published', 0)}\n"
+            f"❌ Ошибки: {stats.get('failed', 0)}\n"
+            f"🕒 Последняя публикация: {last_published}"
+        )
+    except Exception as e:
+        logger.error("Error in show_publication_queue: %s", e)
+        await message.answer("❌ Ошибка загрузки очереди")
+
+# ======================
+# SCHEDULED JOBS
+# ======================
+
+@router.message(Command("jobs"))
+async def show_jobs(message: Message, scheduler: JobScheduler):
+    """Show scheduled jobs with their last run"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        jobs = scheduler.get_jobs()
+        if not jobs:
+            await message.answer("ℹ️ Нет запланированных задач")
+            return
+
+        status_emoji = {'ok': '✅', 'error': '❌', 'timeout': '⏱', 'skipped': '⏭', 'cancelled': '⛔'}
+        response = "🗓 Фоновые задачи:\n\n"
+        for job in jobs:
+            response += f"{'🔄' if job.running else status_emoji.get(job.last_status, '⏳')} {job.name} ({job.trigger})\n"
+            if job.last_run_at:
+                response += (
+                    f"   Последний запуск: {job.last_run_at:%d.%m %H:%M:%S}, "
+                    f"{job.last_duration:.2f} с, {job.last_status}\n"
+                )
+            if job.last_error:
+                response += f"   Ошибка: {job.last_error[:200]}\n"
+            if job.next_run_at:
+                response += f"   Следующий: {job.next_run_at:%d.%m %H:%M:%S}\n"
+
+        await message.answer(response, parse_mode=None)
+    except Exception as e:
+        logger.error("Error in show_jobs: %s", e)
+        await message.answer("❌ Ошибка загрузки задач")
+
+@router.message(Command("load"))
+async def show_load(message: Message, bot: Bot, concurrency: OrderedConcurrencyMiddleware):
+    """Show update processing load and queue wait times"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        stats = concurrency.stats()
+        load_stats = load.stats()
+        thresholds = load_stats['thresholds']
+        response = (
+            "⚙️ Обработка обновлений:\n\n"
+            f"📈 Нагрузка: {load_stats['level']} ({load_stats['level_for']:.0f} с)\n"
+            f"🐢 Задержка цикла: {load_stats['lag'] * 1000:.0f} мс (макс. {load_stats['max_lag'] * 1000:.0f} мс)\n"
+            f"📥 В обработке: {load_stats['pending']}\n"
+            f"▶️ Обрабатывается: {stats['active']} из {concurrency.limit}\n"
+            f"⏳ В очереди: {stats['queued']} (пользователей: {stats['keys']})\n"
+            f"📏 Макс. очередь одного пользователя: {stats['max_depth']}\n"
+            f"✅ Обработано: {stats['handled']}\n"
+            f"⏱ Ожидание: среднее {stats['wait_avg'] * 1000:.1f} мс, "
+            f"p95 {stats['wait_p95'] * 1000:.1f} мс, макс. {stats['wait_max'] * 1000:.1f} мс\n\n"
+            "Пороги (задержка / в обработке):\n"
+        )
+        for level, threshold in thresholds.items():
+            response += f"   {level}: {threshold['lag'] * 1000:.0f} мс / {threshold['pending']}\n"
+        if load_stats['shed']:
+            response += "🚫 Отклонено: " + ", ".join(f"{kind} {count}" for kind, count in load_stats['shed'].items()) + "\n"
+        if load_stats['deferred']:
+            response += "⏸ Отложено: " + ", ".join(f"{kind} {count}" for kind, count in load_stats['deferred'].items()) + "\n"
+
+        blocks = watchdog.top(5)
+        if blocks:
+            response += f"\n🧱 Блокировки цикла дольше {watchdog.threshold * 1000:.0f} мс:\n"
+            for block in blocks:
+                response += (
+                    f"   {block.handler} / {block.db_method}: {block.count} раз, "
+                    f"всего {block.total * 1000:.0f} мс, макс. {block.max * 1000:.0f} мс\n"
+                    f"      {block.site}\n"
+                )
+
+        outbound = get_outbound_scheduler(bot)
+        if outbound:
+            response += f"\n📤 Исходящие ({outbound.rate:g}/с):\n"
+            for name, stats in outbound.stats().items():
+                response += (
+                    f"   {name}: в очереди {stats['queued']}, отправлено {stats['sent']}, "
+                    f"повторов {stats['retries']}, ожидание {stats['wait_avg'] * 1000:.0f} / "
+                    f"{stats['wait_max'] * 1000:.0f} мс\n"
+                )
+
+        await message.answer(response, parse_mode=None)
+    except Exception as e:
+        logger.error("Error in show_load: %s", e)
+        await message.answer("❌ Ошибка загрузки статистики")
+
+# ======================
+# DUPLICATE CLUSTERS
+# ======================
+
+@router.message(Command("clusters"))
+async def show_duplicate_clusters(message: Message):
+    """Show groups of near-duplicate post texts or feedback messages"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        args = message.text.split()
+        source = 'feedback' if len(args) > 1 and args[1] == 'feedback' else 'post'
+        clusters = text_hash.get_clusters(source)
+        if not clusters:
+            await message.answer("ℹ️ Похожих текстов не найдено")
+            return
+
+        title = "сообщений" if source == 'feedback' else "постов"
+        response = f"🧬 Группы похожих {title}:\n\n"
+        for idx, items in enumerate(clusters[:20], 1):
+            response += f"{idx}. ({len(items)} шт.) " + ", ".join(f"#{item}" for item in items[:30]) + "\n"
+        response += "\nДля сообщений обратной связи: /clusters feedback"
+
+        await message.answer(response)
+    except Exception as e:
+        logger.error("Error in show_duplicate_clusters: %s", e)
+        await message.answer("❌ Ошибка загрузки групп")
+
+# ======================
+# SQL TRACING
+# ======================
+
+# In multi-process mode /sqltrace switches tracing in every worker
+cache_bus.subscribe("sql_trace", lambda payload: tracer.configure(**payload))
+
+@router.message(Command("sqltrace"))
+async def configure_sql_trace(message: Message):
+    """Switch SQL tracing: /sqltrace on [ms] | off | reset"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        args = message.text.split()
+        action = args[1] if len(args) > 1 else None
+        if action == 'on':
+            settings = {'enabled': True}
+            if len(args) > 2:
+                settings['threshold'] = int(args[2]) / 1000
+        elif action == 'off':
+            settings = {'enabled': False}
+        elif action == 'reset':
+            tracer.reset()
+            await message.answer("🗑 Статистика запросов очищена")
+            return
+        else:
+            await message.answer(
+                f"🔍 Трассировка SQL: {'включена' if tracer.enabled else 'выключена'}, "
+                f"порог {tracer.threshold * 1000:.0f} мс\n\n"
+                "Используйте: /sqltrace on [мс] | off | reset\n"
+                "Медленные запросы: /slowsql"
+            )
+            return
+
+        tracer.configure(**settings)
+        cache_bus.publish("sql_trace", settings)
+        await message.answer(
+            f"✅ Трассировка SQL {'включена' if tracer.enabled else 'выключена'}, "
+            f"порог {tracer.threshold * 1000:.0f} мс"
+        )
+    except ValueError:
+        await message.answer("❌ Порог указывается в миллисекундах: /sqltrace on 50")
+    except Exception as e:
+        logger.error("Error in configure_sql_trace: %s", e)
+        await message.answer("❌ Ошибка настройки трассировки")
+
+@router.message(Command("slowsql"))
+async def show_slow_queries(message: Message):
+    """Show statements with the largest total time since tracing was reset"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        args = message.text.split()
+        limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else 5
+        statements = tracer.top(min(limit, 20))
+        if not statements:
+            state = "" if tracer.enabled else " Трассировка выключена: /sqltrace on"
+            await message.answer(f"ℹ️ Нет данных о запросах.{state}")
+            return
+
+        response = (
+            f"🐢 Самые долгие запросы с {datetime.fromtimestamp(tracer.started_at):%d.%m %H:%M} "
+            f"(процесс {os.getpid()}, порог {tracer.threshold * 1000:.0f} мс):\n\n"
+        )
+        for idx, stats in enumerate(statements, 1):
+            response += (
+                f"{idx}. {stats.method}: всего {stats.total * 1000:.1f} мс, {stats.count} раз, "
+                f"среднее {stats.total / stats.count * 1000:.2f} мс, макс. {stats.max * 1000:.1f} мс, "
+                f"медленных {stats.slow}\n"
+                f"   {stats.statement[:300]}\n"
+            )
+            if stats.plan:
+                response += "".join(f"   {line}\n" for line in stats.plan[:8])
+            response += "\n"
+
+        await message.answer(response[:4000], parse_mode=None)
+    except Exception as e:
+        logger.error("Error in show_slow_queries: %s", e)
+        await message.answer("❌ Ошибка загрузки статистики запросов")
+
+# ======================
+# PROFILING
+# ======================
+
+@router.message(Command("profile"))
+async def start_profile(message: Message):
+    """Sample the bot process: /profile [seconds] [wall|cpu]"""
+    try:
+        user = Database.get_user(message.from_user.id)
+        if not user or user['role'] != 'admin':
+            await message.answer("❌ У вас нет доступа к командам администрации")
+            return
+
+        args = message.text.split()[1:]
+        seconds = PROFILE_DEFAULT_SECONDS
+        mode = profiler.PROFILE_WALL
+        for arg in args:
+            if arg.isdigit():
+                seconds = max(1, min(int(arg), PROFILE_MAX_SECONDS))
+            elif arg in (profiler.PROFILE_WALL, profiler.PROFILE_CPU):
+                mode = arg
+            else:
+                await message.answer(
+                    f"ℹ️ Используйте: /profile [секунды, до {PROFILE_MAX_SECONDS}] [wall|cpu]\n"
+                    "wall — реальное время цикла событий (включая блокирующие запросы к БД), "
+                    "cpu — процессорное время всех потоков"
+                )
+                return
+
+        if profiler.is_running():
+            await message.answer("⏳ Профилирование уже идёт")
+            return
+
+        await message.answer(f"⏱ Профилирование {seconds} с ({mode})...")
+        # The handler returns right away, so the admin's next updates are not held up
+        send_later(run_profile(message, seconds, mode), PRIORITY_MODERATION)
+    except Exception as e:
+        logger.error("Error in start_profile: %s", e)
+        await message.answer("❌ Ошибка запуска профилирования")
+
+async def run_profile(message: Message, seconds: int, mode: str):
+    """Collect the profile and send the report with a collapsed stack file"""
+    try:
+        profile = await profiler.profile_for(seconds, mode)
+        if profile is None:
+            await message.answer("⏳ Профилирование уже идёт")
+            return
+
+        response = (
+            f"📊 Профиль {mode}, {profile.duration:.1f} с, {profile.samples} выборок "
+            f"(процесс {os.getpid()}, затраты профилировщика "
+            f"{profile.overhead / profile.duration * 100:.1f}% CPU)\n"
+        )
+        if mode == profiler.PROFILE_WALL:
+            response += f"💤 Простой цикла событий: {profile.idle_share() * 100:.0f}%\n"
+        else:
+            response += f"🔥 Процессорное время: {profile.cpu_time:.2f} с\n"
+        response += "\nФункция: собственное / всего\n"
+        for name, own, total in profile.top(15):
+            response += f"{own * 100:5.1f}% / {total * 100:5.1f}%  {name}\n"
+        await message.answer(response[:4000], parse_mode=None)
+
+        document = BufferedInputFile(
+            profile.collapsed().encode(),
+            filename=f"profile-{mode}-{datetime.now():%Y%m%d-%H%M%S}.txt"
+        )
+        await message.answer_document(
+            document,
+            caption="Стеки в формате collapsed: flamegraph.pl или speedscope.app"
+        )
+    except Exception as e:
+        logger.error("Error in run_profile: %s", e)
+        await message.answer("❌ Ошибка профилирования")
+
 # ======================
 # NOTIFICATION FUNCTIONS
 # ======================
@@ -743,12 +1095,13 @@ async def notify_user_about_post(post_id: int, status: str, bot: Bot):
             if admin:
                 message += f"👨‍💻 Администратор: @{admin['username']}\n"
         
-        await bot.send_message(
-            chat_id=user['telegram_id'],
-            text=message
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=user['telegram_id'],
+                text=message
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user about post: {e}")
+        logger.error("Failed to notify user about post: %s", e)
 
 async def notify_user_about_feedback(feedback_id: int, response: str, bot: Bot):
     """Notify user about feedback response"""
@@ -757,12 +1110,13 @@ async def notify_user_about_feedback(feedback_id: int, response: str, bot: Bot):
         if not feedback:
             return
             
-        await bot.send_message(
-            chat_id=feedback['telegram_id'],
-            text=f"📩 Ответ от администрации:\n\n{response}"
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=feedback['telegram_id'],
+                text=f"📩 Ответ от администрации:\n\n{response}"
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user about feedback: {e}")
+        logger.error("Failed to notify user about feedback: %s", e)
 
 async def notify_post_status(user_id: int, post_id: int, status: str, bot: Bot, reason: str = None):
     """Notify user about their post status"""
@@ -784,12 +1138,13 @@ async def notify_post_status(user_id: int, post_id: int, status: str, bot: Bot,
         if status == 'rejected' and reason:
             message += f"📝 Причина: {reason}\n"
         
-        await bot.send_message(
-            chat_id=user['telegram_id'],
-            text=message
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=user['telegram_id'],
+                text=message
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user {user_id}: {e}")
+        logger.error("Failed to notify user %s: %s", user_id, e)
 
 
 @router.message(F.text == "📢 Массовая рассылка")
@@ -847,22 +1202,32 @@ async def confirm_mass_notification(message: Message, state: FSMContext, bot: Bo
     await state.clear()
     
     users = Database.get_all_users()
+    await message.answer(
+        f"⏳ Начинаю рассылку для {len(users)} пользователей...\n"
+        "Статистика придёт по завершении, бот остаётся доступен.",
+        reply_markup=get_admin_keyboard()
+    )
+    # Broadcast runs in background with the lowest send priority,
+    # so moderation and replies to users are not stuck behind it
+    send_later(run_mass_notification(message, data['content'], users, bot), PRIORITY_BROADCAST)
+
+async def run_mass_notification(message: Message, content: dict, users: list, bot: Bot):
+    """Send mass notification to all users and report delivery to the admin"""
     total_users = len(users)
     success_count = 0
     fail_count = 0
-    
-    await message.answer(f"⏳ Начинаю рассылку для {total_users} пользователей...")
+    deferred_count = 0
     
     for user in users:
         try:
             # Prefix text with "Массовая рассылка от администрации"
-            message_text = f"🚨📢 Массовая рассылка от администрации:\n\n{data['content']['text']}" if data['content']['text'] else "Массовая рассылка от администрации"
+            message_text = f"🚨📢 Массовая рассылка от администрации:\n\n{content['text']}" if content['text'] else "Массовая рассылка от администрации"
             
             # Check if image exists and send accordingly
-            if data['content']['image']:
+            if content['image']:
                 await bot.send_photo(
                     chat_id=user['telegram_id'],
-                    photo=data['content']['image'],
+                    photo=content['image'],
                     caption=message_text
                 )
             else:
@@ -871,24 +1236,28 @@ async def confirm_mass_notification(message: Message, state: FSMContext, bot: Bo
                     text=message_text
                 )
             success_count += 1
+        except SendCheckpointed:
+            # Bot is shutting down, the message is sent after restart
+            deferred_count += 1
         except Exception as e:
-            logger.error(f"Failed to send to {user['telegram_id']}: {e}")
+            # Without the chat id, so the same error for many users is rate-limited
+            logger.error("Failed to send mass notification: %s", e)
             fail_count += 1
             continue
     
     # Send statistics
+    deferred_line = f"⏳ Отложено до перезапуска: {deferred_count}\n" if deferred_count else ""
     stats_message = (
         "📊 Статистика рассылки:\n\n"
         f"👥 Всего пользователей: {total_users}\n"
         f"✅ Успешно отправлено: {success_count}\n"
         f"❌ Не удалось отправить: {fail_count}\n"
+        f"{deferred_line}"
         f"📈 Процент доставки: {round((success_count/total_users)*100 if total_users > 0 else 0)}%"
     )
     
-    await message.answer(
-        stats_message,
-        reply_markup=get_admin_keyboard()
-    )
+    with send_priority(PRIORITY_MODERATION):
+        await message.answer(stats_message)
 
 @router.message(MassNotification.confirm_sending, F.text == "❌ Нет, отменить")
 async def cancel_mass_notification(message: Message, state: FSMContext):
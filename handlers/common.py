@@ -47,7 +47,7 @@ async def cmd_start(message: Message):
             parse_mode="Markdown"
         )
     except Exception as e:
-        logger.error(f"Error in cmd_start: {e}")
+        logger.error("Error in cmd_start: %s", e)
         await message.answer("❌ Произошла ошибка при запуске бота.")
 
 @router.message(Command("help"))
@@ -73,7 +73,7 @@ async def cmd_help(message: Message):
             reply_markup=ReplyKeyboardRemove()
         )
     except Exception as e:
-        logger.error(f"Error in cmd_help: {e}")
+        logger.error("Error in cmd_help: %s", e)
         await message.answer("❌ Не удалось показать справку.")
 
 @router.message(F.text == "🔙 Главное меню")
@@ -97,7 +97,7 @@ async def return_to_main_menu(message: Message, state: FSMContext):
             reply_markup=get_main_keyboard(is_admin)
         )
     except Exception as e:
-        logger.error(f"Error in return_to_main_menu: {e}")
+        logger.error("Error in return_to_main_menu: %s", e)
         await message.answer("Произошла ошибка при возврате в меню")
         
 @router.message(Command("admin"))
@@ -127,7 +127,7 @@ async def cmd_admin(message: Message):
             reply_markup=get_main_keyboard(True)
         )
     except Exception as e:
-        logger.error(f"Error in cmd_admin: {e}")
+        logger.error("Error in cmd_admin: %s", e)
         await message.answer("❌ Ошибка выполнения команды.")
 
 @router.message(Command("id"))
@@ -140,7 +140,7 @@ async def cmd_id(message: Message):
             reply_markup=ReplyKeyboardRemove()
         )
     except Exception as e:
-        logger.error(f"Error in cmd_id: {e}")
+        logger.error("Error in cmd_id: %s", e)
         await message.answer("❌ Не удалось получить ID.")
 
 # Error handler for unauthorized commands
@@ -155,4 +155,4 @@ async def handle_admin_unauthorized(message: Message):
                 reply_markup=get_main_keyboard(False)
             )
     except Exception as e:
-        logger.error(f"Error in handle_admin_unauthorized: {e}")
\ No newline at end of file
+        logger.error("Error in handle_admin_unauthorized: %s", e)
\ No newline at end of file
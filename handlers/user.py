@@ -7,14 +7,31 @@ from datetime import datetime
 
 from states import PostCreation, Feedback
 from database import Database
+import image_hash
+import text_hash
+from blocklist import blocklist
+import reputation
+from outbound import send_later, send_priority, PRIORITY_MODERATION
 from keyboards import (
     get_main_keyboard,
     get_cancel_keyboard,
     get_statistics_keyboard,
     get_cancelFeedback_keyboard
 )
-from config import ADMIN_IDS
-from utils import format_datetime
+from config import (
+    ADMIN_IDS,
+    POST_STATUS_PENDING,
+    POST_STATUS_APPROVED,
+    POST_STATUS_REJECTED,
+    DUPLICATE_IMAGE_ACTION,
+    DUPLICATE_ACTION_REJECT,
+    DUPLICATE_ACTION_LINK,
+    FLAG_DUPLICATE_IMAGE,
+    FLAG_BLOCKLIST,
+    BLOCKLIST_ACTION,
+    BLOCKLIST_ACTION_REJECT
+)
+from utils import format_datetime, get_idempotency_key
 from aiogram.utils.keyboard import InlineKeyboardBuilder  # Add this import
 
 router = Router()
@@ -68,7 +85,7 @@ async def start_post_creation(message: Message, state: FSMContext):
             reply_markup=get_cancel_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in start_post_creation: {e}")
+        logger.error("Error in start_post_creation: %s", e)
         await message.answer("❌ Произошла ошибка. Попробуйте позже.")
 
 
@@ -85,7 +102,7 @@ async def process_post_text(message: Message, state: FSMContext):
             reply_markup=ReplyKeyboardRemove()
         )
     except Exception as e:
-        logger.error(f"Error in process_post_text: {e}")
+        logger.error("Error in process_post_text: %s", e)
         await message.answer("❌ Ошибка обработки текста.")
         await state.clear()
 
@@ -94,6 +111,15 @@ async def process_post_text(message: Message, state: FSMContext):
 async def process_post_image(message: Message, state: FSMContext, bot: Bot):
     """Process post with image"""
     try:
+        # Redelivered update of an already accepted submission (reaches this
+        # handler only if the waiting_for_image state was saved, see DeduplicationMiddleware)
+        idempotency_key = get_idempotency_key(message)
+        existing_id = Database.find_by_idempotency_key('posts', idempotency_key)
+        if existing_id:
+            await state.clear()
+            await message.answer(f"✅ Пост #{existing_id} уже принят.")
+            return
+
         # Get data from state
         data = await state.get_data()
         text = data.get('text') if 'text' in data else None
@@ -110,25 +136,102 @@ async def process_post_image(message: Message, state: FSMContext, bot: Bot):
             await message.answer("❌ Вы заблокированы и не можете создавать посты.")
             return
 
+        # Check text against the blocklist
+        blocked_term = blocklist.find(text)
+
+        # Check for an already submitted copy of the same image
+        photo = message.photo[-1]
+        original = Database.find_post_by_image(photo.file_unique_id)
+        if original and DUPLICATE_IMAGE_ACTION == DUPLICATE_ACTION_REJECT:
+            await message.answer(
+                f"❌ Это изображение уже было предложено ранее (пост #{original['post_id']}).",
+                reply_markup=get_main_keyboard(user['role'] == 'admin')
+            )
+            return
+
         # Create post (using the highest resolution photo)
         post_id = Database.create_post(
             user_id=user['internal_id'],
             text=text,
-            image_file_id=message.photo[-1].file_id
+            image_file_id=photo.file_id,
+            image_unique_id=photo.file_unique_id,
+            priority=reputation.get_priority(user),
+            idempotency_key=idempotency_key
         )
+
+        if blocked_term and BLOCKLIST_ACTION == BLOCKLIST_ACTION_REJECT:
+            Database.update_post_status(
+                post_id=post_id,
+                status=POST_STATUS_REJECTED,
+                admin_id=None,
+                rejection_reason=f"Запрещённое слово: {blocked_term}"
+            )
+            await message.answer(
+                f"❌ Пост #{post_id} отклонен автоматически: содержит запрещённое слово «{blocked_term}».",
+                reply_markup=get_main_keyboard(user['role'] == 'admin')
+            )
+            return
+
+        flags_note = ""
+        if blocked_term:
+            Database.add_flag(target_type='post', target_id=post_id, kind=FLAG_BLOCKLIST, detail=blocked_term)
+            flags_note += f"⚠️ Запрещённое слово: {blocked_term}\n"
+        similar_text = text_hash.check_text('post', post_id, text)
+        if similar_text:
+            flags_note += f"⚠️ Похожий текст у поста #{similar_text[0]}\n"
+
+        if original:
+            Database.add_flag(
+                target_type='post',
+                target_id=post_id,
+                kind=FLAG_DUPLICATE_IMAGE,
+                related_id=original['post_id']
+            )
+
+            # Reuse the existing decision instead of asking moderators again
+            if DUPLICATE_IMAGE_ACTION == DUPLICATE_ACTION_LINK and original['status'] != POST_STATUS_PENDING:
+                Database.link_duplicate_post(post_id, original)
+                status_text = "одобрен ✅" if original['status'] == POST_STATUS_APPROVED else "отклонен ❌"
+                await message.answer(
+                    f"ℹ️ Это изображение уже рассматривалось (пост #{original['post_id']}).\n"
+                    f"Ваш пост #{post_id} {status_text}",
+                    reply_markup=get_main_keyboard(user['role'] == 'admin')
+                )
+                return
+
+            flags_note += f"⚠️ Дубликат изображения поста #{original['post_id']}\n"
+
+        # Trusted submitters skip the moderation queue
+        auto_approve = reputation.should_auto_approve(user, flagged=bool(flags_note))
+        if not original:
+            # Look for resized/recompressed copies using the smallest photo size
+            if auto_approve:
+                # Only after the check: its flag would come too late for a post that skipped moderation
+                similar = await image_hash.check_post_image(bot, post_id, message.photo[0].file_id)
+                if similar is None or similar:
+                    auto_approve = False
+                if similar:
+                    flags_note += f"⚠️ Похожее изображение у поста #{similar[0][0]}\n"
+            else:
+                image_hash.schedule_post_image(bot, post_id, message.photo[0].file_id)
+
+        if auto_approve:
+            Database.auto_approve_post(post_id)
+            await message.answer(
+                f"✅ Ваш пост #{post_id} одобрен автоматически. Спасибо за качественные публикации!",
+                reply_markup=get_main_keyboard(user['role'] == 'admin')
+            )
+            return
         
         # Notify admins
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=f"📨 Новый пост на модерацию!\n"
-                         f"ID: {post_id}\n"
-                         f"От: @{user['username'] or user['full_name']}\n"
-                         f"Текст: {text[:100] if text else 'Нет текста'}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id}: {e}")
+        send_later(notify_admins(
+            f"📨 Новый пост на модерацию!\n"
+            f"ID: {post_id}\n"
+            f"От: @{user['username'] or user['full_name']}\n"
+            f"{flags_note}"
+            f"Текст: {text[:100] if text else 'Нет текста'}",
+            bot
+        ), PRIORITY_MODERATION)
 
         await message.answer(
             "✅ Ваш пост успешно отправлен на модерацию!",
@@ -138,7 +241,7 @@ async def process_post_image(message: Message, state: FSMContext, bot: Bot):
     except ValueError as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
     except Exception as e:
-        logger.error(f"Error in process_post_image: {e}")
+        logger.error("Error in process_post_image: %s", e)
         await message.answer("❌ Произошла ошибка при создании поста.")
         await state.clear()
             
@@ -183,7 +286,7 @@ async def start_feedback(message: Message, state: FSMContext):
             reply_markup=get_cancelFeedback_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in start_feedback: {e}")
+        logger.error("Error in start_feedback: %s", e)
         await message.answer("⚠️ Произошла ошибка. Попробуйте позже.")
 
 
@@ -192,26 +295,44 @@ async def start_feedback(message: Message, state: FSMContext):
 async def process_feedback_message(message: Message, state: FSMContext, bot: Bot):
     """Process user feedback and notify admins"""
     try:
+        idempotency_key = get_idempotency_key(message)
+        if Database.find_by_idempotency_key('feedback', idempotency_key):
+            await state.clear()
+            await message.answer("✅ Ваше сообщение уже отправлено администрации.")
+            return
+
         await state.clear()
         user = Database.get_user(message.from_user.id)
+
+        blocked_term = blocklist.find(message.text)
+        if blocked_term and BLOCKLIST_ACTION == BLOCKLIST_ACTION_REJECT:
+            await message.answer(
+                f"❌ Сообщение не отправлено: содержит запрещённое слово «{blocked_term}».",
+                reply_markup=get_main_keyboard(user['role'] == 'admin')
+            )
+            return
+
         feedback_id = Database.create_feedback(
             user_id=user['internal_id'],
-            message=message.text
+            message=message.text,
+            idempotency_key=idempotency_key
         )
+        similar_text = text_hash.check_text('feedback', feedback_id, message.text)
+        flags_note = f"⚠️ Похоже на сообщение #{similar_text[0]}\n" if similar_text else ""
+        if blocked_term:
+            Database.add_flag(target_type='feedback', target_id=feedback_id, kind=FLAG_BLOCKLIST, detail=blocked_term)
+            flags_note += f"⚠️ Запрещённое слово: {blocked_term}\n"
         
         # Notify all admins
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=f"📩 Новое сообщение от пользователя!\n\n"
-                         f"🆔 ID: {feedback_id}\n"
-                         f"👤 От: @{user['username'] or user['full_name']}\n"
-                         f"📅 Время: {format_datetime(datetime.now())}\n\n"
-                         f"📝 Сообщение:\n{message.text[:300]}..."
-                )
-            except Exception as e:
-                logger.error(f"Failed to notify admin {admin_id}: {e}")
+        send_later(notify_admins(
+            f"📩 Новое сообщение от пользователя!\n\n"
+            f"🆔 ID: {feedback_id}\n"
+            f"👤 От: @{user['username'] or user['full_name']}\n"
+            f"📅 Время: {format_datetime(datetime.now())}\n"
+            f"{flags_note}\n"
+            f"📝 Сообщение:\n{message.text[:300]}...",
+            bot
+        ), PRIORITY_MODERATION)
 
         await message.answer(
             "✅ Ваше сообщение отправлено администрации!\n\n"
@@ -219,7 +340,7 @@ async def process_feedback_message(message: Message, state: FSMContext, bot: Bot
             reply_markup=get_main_keyboard(user['role'] == 'admin')
         )
     except Exception as e:
-        logger.error(f"Error in process_feedback_message: {e}")
+        logger.error("Error in process_feedback_message: %s", e)
         await message.answer("⚠️ Ошибка при отправке сообщения. Попробуйте снова.")
         await state.clear()
 
@@ -262,7 +383,7 @@ async def show_user_posts(message: Message):
 
         await message.answer(response)
     except Exception as e:
-        logger.error(f"Error in show_user_posts: {e}")
+        logger.error("Error in show_user_posts: %s", e)
         await message.answer("❌ Ошибка при загрузке истории постов.")
 # ======================
 # STATISTICS
@@ -277,7 +398,7 @@ async def show_statistics_menu(message: Message):
             reply_markup=get_statistics_keyboard()
         )
     except Exception as e:
-        logger.error(f"Error in show_statistics_menu: {e}")
+        logger.error("Error in show_statistics_menu: %s", e)
         await message.answer("⚠️ Ошибка при загрузке статистики.")
 
 @router.callback_query(F.data == "top_approved")
@@ -295,7 +416,7 @@ async def show_top_approved_posts(callback: CallbackQuery):
 
         await callback.message.edit_text(response)
     except Exception as e:
-        logger.error(f"Error in show_top_approved_posts: {e}")
+        logger.error("Error in show_top_approved_posts: %s", e)
         await callback.answer("⚠️ Ошибка при загрузке статистики")
 
 @router.callback_query(F.data == "top_rejected")
@@ -313,12 +434,20 @@ async def show_top_rejected_posts(callback: CallbackQuery):
 
         await callback.message.edit_text(response)
     except Exception as e:
-        logger.error(f"Error in show_top_rejected_posts: {e}")
+        logger.error("Error in show_top_rejected_posts: %s", e)
         await callback.answer("⚠️ Ошибка при загрузке статистики")
 
 # ======================
 # NOTIFICATION SYSTEM
 # ======================
+async def notify_admins(text: str, bot: Bot):
+    """Send notification to all admins"""
+    for admin_id in ADMIN_IDS:
+        try:
+            await bot.send_message(chat_id=admin_id, text=text)
+        except Exception as e:
+            logger.error("Failed to notify admin %s: %s", admin_id, e)
+
 async def notify_post_status(user_id: int, post_id: int, status: str, bot: Bot, reason: str = None):
     """Notify user about post status change"""
     try:
@@ -350,12 +479,13 @@ async def notify_post_status(user_id: int, post_id: int, status: str, bot: Bot,
         if status == 'rejected' and reason:
             message += f"📝 Причина: {reason}\n"
 
-        await bot.send_message(
-            chat_id=user['telegram_id'],
-            text=message
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=user['telegram_id'],
+                text=message
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user {user_id}: {e}")
+        logger.error("Failed to notify user %s: %s", user_id, e)
         
 async def notify_feedback_response(feedback_id: int, response_text: str, bot: Bot):
     """Notify user about admin response to feedback"""
@@ -364,9 +494,10 @@ async def notify_feedback_response(feedback_id: int, response_text: str, bot: Bo
         if not feedback:
             return
 
-        await bot.send_message(
-            chat_id=feedback['telegram_id'],
-            text=f"📩 Ответ от администрации:\n\n{response_text}"
-        )
+        with send_priority(PRIORITY_MODERATION):
+            await bot.send_message(
+                chat_id=feedback['telegram_id'],
+                text=f"📩 Ответ от администрации:\n\n{response_text}"
+            )
     except Exception as e:
-        logger.error(f"Failed to notify user about feedback response: {e}")
\ No newline at end of file
+        logger.error("Failed to notify user about feedback response: %s", e)
\ No newline at end of file
@@ -0,0 +1,96 @@
+from itertools import combinations
+from typing import Dict, Iterable, List, Tuple
+
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def to_signed(value: int) -> int:
+    """Convert unsigned 64-bit hash to the signed form SQLite can store"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    """Convert hash read from SQLite back to unsigned 64-bit form"""
+    return value & HASH_MASK
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+
+class HashIndex:
+    """
+    Multi-index hashing over 64-bit hashes for Hamming-distance search.
+
+    Every hash is split into `chunks` substrings, each kept in its own dict.
+    Two hashes within distance `d` must agree on at least one chunk up to
+    d // chunks bits, so a query only probes those neighbouring buckets
+    instead of scanning all stored hashes.
+    """
+
+    def __init__(self, chunks: int = 4):
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(chunks)]
+        self.hashes: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _split(self, value: int) -> List[int]:
+        return [
+            (value >> (i * self.chunk_bits)) & self.chunk_mask
+            for i in range(self.chunks)
+        ]
+
+    def add(self, item_id: int, value: int):
+        """Add hash for item (replaces previous hash of the same item)"""
+        if item_id in self.hashes:
+            self.remove(item_id)
+        self.hashes[item_id] = value
+        for table, part in zip(self.tables, self._split(value)):
+            table.setdefault(part, []).append(item_id)
+
+    def add_many(self, items: Iterable[Tuple[int, int]]):
+        for item_id, value in items:
+            self.add(item_id, value)
+
+    def remove(self, item_id: int):
+        value = self.hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, part in zip(self.tables, self._split(value)):
+            bucket = table.get(part)
+            if bucket:
+                bucket.remove(item_id)
+                if not bucket:
+                    del table[part]
+
+    def _neighbours(self, part: int, radius: int):
+        yield part
+        for r in range(1, radius + 1):
+            for bits in combinations(range(self.chunk_bits), r):
+                flipped = part
+                for bit in bits:
+                    flipped ^= 1 << bit
+                yield flipped
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return (item_id, distance) pairs within max_distance, closest first"""
+        radius = max_distance // self.chunks
+        seen = set()
+        matches = []
+        for table, part in zip(self.tables, self._split(value)):
+            for key in self._neighbours(part, radius):
+                for item_id in table.get(key, ()):
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                    distance = hamming(value, self.hashes[item_id])
+                    if distance <= max_distance:
+                        matches.append((item_id, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
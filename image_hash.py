@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Optional
+
+from aiogram import Bot
+
+from config import PHASH_ENABLED, PHASH_MAX_DISTANCE, PHASH_WORKERS, FLAG_SIMILAR_IMAGE
+from database import Database
+import cache_bus
+from load_manager import load
+from hash_index import HashIndex
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, near-duplicate search is disabled without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+index = HashIndex()
+_executor = None
+_tasks = set()
+
+
+def is_enabled() -> bool:
+    return PHASH_ENABLED and Image is not None
+
+
+def compute_dhash(data: bytes, size: int = 8) -> int:
+    """Compute 64-bit difference hash of an image (runs in a worker process)"""
+    image = Image.open(BytesIO(data)).convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def load_index():
+    """Load all stored image hashes into memory"""
+    if PHASH_ENABLED and Image is None:
+        logger.warning("PHASH_ENABLED is set but Pillow is not installed, near-duplicate search is off")
+    if not is_enabled():
+        return
+    index.add_many(Database.get_image_hashes())
+    logger.info("Loaded %s image hashes", len(index))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PHASH_WORKERS)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _on_image_hash(event: dict):
+    """Add hash indexed by another worker process"""
+    if is_enabled():
+        index.add(event['post_id'], event['value'])
+
+
+cache_bus.subscribe("image_hash", _on_image_hash)
+
+
+async def index_post_image(bot: Bot, post_id: int, file_id: str, defer: bool = True) -> Optional[list]:
+    """Hash post image, flag near duplicates and add it to the index; returns the near duplicates (None on failure)"""
+    try:
+        if defer:
+            await load.wait_normal("image_hash")
+        buffer = await bot.download(file_id)
+        loop = asyncio.get_running_loop()
+        phash = await loop.run_in_executor(_get_executor(), compute_dhash, buffer.getvalue())
+
+        matches = [match for match in index.search(phash, PHASH_MAX_DISTANCE) if match[0] != post_id]
+        Database.save_image_hash(post_id, phash)
+        index.add(post_id, phash)
+        cache_bus.publish("image_hash", {'post_id': post_id, 'value': phash})
+
+        if matches:
+            similar_id, distance = matches[0]
+            Database.add_flag(
+                target_type='post',
+                target_id=post_id,
+                kind=FLAG_SIMILAR_IMAGE,
+                related_id=similar_id,
+                detail=f"отличие {distance} бит"
+            )
+        return matches
+    except Exception as e:
+        logger.error("Failed to index image of post %s: %s", post_id, e)
+        return None
+
+
+async def check_post_image(bot: Bot, post_id: int, file_id: str) -> Optional[list]:
+    """Index the image right away, for posts that may skip moderation only if it has no near duplicates"""
+    if not is_enabled():
+        return []
+    return await index_post_image(bot, post_id, file_id, defer=False)
+
+
+def schedule_post_image(bot: Bot, post_id: int, file_id: str):
+    """Run image indexing in background so submission is not delayed"""
+    if not is_enabled():
+        return
+    task = asyncio.create_task(index_post_image(bot, post_id, file_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
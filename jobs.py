@@ -0,0 +1,110 @@
+import logging
+
+from aiogram import Bot
+
+from config import (
+    ADMIN_IDS,
+    PUBLISH_CHANNEL_ID,
+    PUBLISH_CHECK_INTERVAL,
+    DAILY_REPORT_CRON,
+    JOB_HISTORY_KEEP,
+    WORKERS,
+    CACHE_EVENT_KEEP,
+    BACKUP_ENABLED,
+    BACKUP_CRON,
+    ARCHIVE_ENABLED,
+    ARCHIVE_CRON
+)
+from archive import archive_old_rows
+from backup import create_backup
+from database import Database
+from fsm_storage import SQLiteStorage
+from publisher import Publisher
+from outbound import send_priority, PRIORITY_DIGEST
+from scheduler import JobScheduler
+
+logger = logging.getLogger(__name__)
+
+
+async def send_daily_report(bot: Bot):
+    """Send moderation summary for the last 24 hours to admins"""
+    stats = Database.get_daily_report()
+    text = (
+        "📊 Отчёт за сутки:\n\n"
+        f"📥 Новых постов: {stats['new_posts']}\n"
+        f"✅ Одобрено: {stats['approved_posts']}\n"
+        f"❌ Отклонено: {stats['rejected_posts']}\n"
+        f"⏳ Ожидают модерации: {stats['pending_posts']}\n"
+        f"📩 Сообщений без ответа: {stats['pending_feedback']}\n"
+        f"👥 Новых пользователей: {stats['new_users']}"
+    )
+    for admin_id in ADMIN_IDS:
+        try:
+            with send_priority(PRIORITY_DIGEST):
+                await bot.send_message(chat_id=admin_id, text=text)
+        except Exception as e:
+            logger.error("Failed to send daily report to %s: %s", admin_id, e)
+
+
+def trim_job_history():
+    removed = Database.trim_job_runs(keep=JOB_HISTORY_KEEP)
+    if removed:
+        logger.info("Removed %s old job runs", removed)
+
+
+def trim_cache_events():
+    removed = Database.trim_cache_events(max_age=CACHE_EVENT_KEEP)
+    if removed:
+        logger.info("Removed %s old cache events", removed)
+
+
+async def evict_fsm_states(storage: SQLiteStorage):
+    await storage.evict_expired()
+    stats = storage.stats()
+    logger.info(
+        "FSM storage: %s active states, %s records, %.1f KB of serialized data",
+        stats['states'], stats['records'], stats['serialized_bytes'] / 1024
+    )
+
+
+def register_jobs(scheduler: JobScheduler, bot: Bot):
+    """Register periodic maintenance and reporting jobs (run in one process only)"""
+    if PUBLISH_CHANNEL_ID:
+        publisher = Publisher(bot)
+        publisher.resume()
+        scheduler.add_interval_job(
+            "publish_posts", publisher.publish_next, PUBLISH_CHECK_INTERVAL,
+            timeout=120, run_at_start=True, deferrable=True
+        )
+
+    scheduler.add_cron_job(
+        "daily_report", lambda: send_daily_report(bot), DAILY_REPORT_CRON,
+        jitter=30, timeout=300, deferrable=True
+    )
+    scheduler.add_cron_job(
+        "trim_job_history", trim_job_history, "30 4 * * *",
+        jitter=60, timeout=60, run_in_executor=True, deferrable=True
+    )
+    if WORKERS > 1:
+        scheduler.add_interval_job(
+            "trim_cache_events", trim_cache_events, 10 * 60,
+            jitter=60, timeout=60, run_in_executor=True, deferrable=True
+        )
+    if BACKUP_ENABLED:
+        scheduler.add_cron_job(
+            "backup_database", create_backup, BACKUP_CRON,
+            jitter=60, timeout=60 * 60, run_in_executor=True, deferrable=True
+        )
+    if ARCHIVE_ENABLED:
+        scheduler.add_cron_job(
+            "archive_old_rows", archive_old_rows, ARCHIVE_CRON,
+            jitter=60, timeout=60 * 60, run_in_executor=True, deferrable=True
+        )
+
+
+def register_worker_jobs(scheduler: JobScheduler, storage: SQLiteStorage):
+    """Register jobs for process-local state of every process handling updates"""
+    scheduler.add_interval_job(
+        "evict_fsm_states", lambda: evict_fsm_states(storage), 60 * 60,
+        jitter=60, timeout=120
+    )
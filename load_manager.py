@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+from aiogram.types import Update, User
+
+from config import (
+    ADMIN_IDS,
+    LOAD_ELEVATED_LAG,
+    LOAD_ELEVATED_PENDING,
+    LOAD_OVERLOADED_LAG,
+    LOAD_OVERLOADED_PENDING,
+    LOAD_CHECK_INTERVAL,
+    LOAD_MAX_DEFER,
+    LOAD_BUSY_REPLY_COOLDOWN
+)
+
+logger = logging.getLogger(__name__)
+
+LOAD_NORMAL = "normal"
+LOAD_ELEVATED = "elevated"
+LOAD_OVERLOADED = "overloaded"
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+# Read-only user actions that can be refused under load (see handlers/user.py, common.py)
+LOW_PRIORITY_TEXTS = {"📊 Статистика", "📜 История моих постов"}
+LOW_PRIORITY_COMMANDS = {"/help", "/id"}
+LOW_PRIORITY_CALLBACKS = {"top_approved", "top_rejected"}
+
+
+def get_update_priority(update: Update, user: Optional[User]) -> str:
+    if user and user.id in ADMIN_IDS:
+        return PRIORITY_HIGH
+    if update.message and update.message.text:
+        text = update.message.text
+        if text in LOW_PRIORITY_TEXTS or text.split(maxsplit=1)[0] in LOW_PRIORITY_COMMANDS:
+            return PRIORITY_LOW
+    if update.callback_query and update.callback_query.data in LOW_PRIORITY_CALLBACKS:
+        return PRIORITY_LOW
+    return PRIORITY_NORMAL
+
+
+class LoadManager:
+    """
+    Tracks event loop lag and updates in processing and turns them into a load
+    level. Lag is measured as the oversleep of a periodic asyncio.sleep and
+    smoothed with an exponential moving average.
+    """
+
+    def __init__(self, check_interval: float = LOAD_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.pending = 0
+        self.level = LOAD_NORMAL
+        self.level_since = time.monotonic()
+        self.shed = Counter()
+        self.deferred = Counter()
+        self.busy_replied: Dict[int, float] = {}
+        self.monitor_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.monitor_task is None or self.monitor_task.done():
+            self.monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self.monitor_task:
+            self.monitor_task.cancel()
+            await asyncio.gather(self.monitor_task, return_exceptions=True)
+            self.monitor_task = None
+
+    async def _monitor(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.check_interval)
+            lag = max(time.monotonic() - started - self.check_interval, 0.0)
+            self.lag = 0.7 * self.lag + 0.3 * lag
+            self.max_lag = max(self.max_lag, lag)
+            self._update_level()
+
+    def _update_level(self):
+        if self.lag >= LOAD_OVERLOADED_LAG or self.pending >= LOAD_OVERLOADED_PENDING:
+            level = LOAD_OVERLOADED
+        elif self.lag >= LOAD_ELEVATED_LAG or self.pending >= LOAD_ELEVATED_PENDING:
+            level = LOAD_ELEVATED
+        else:
+            level = LOAD_NORMAL
+        if level != self.level:
+            logger.warning(
+                "Load level %s -> %s (loop lag %.0f ms, %s pending updates)",
+                self.level, level, self.lag * 1000, self.pending
+            )
+            self.level = level
+            self.level_since = time.monotonic()
+
+    def update_started(self):
+        self.pending += 1
+        if self.pending == LOAD_ELEVATED_PENDING or self.pending == LOAD_OVERLOADED_PENDING:
+            self._update_level()
+
+    def update_finished(self):
+        self.pending -= 1
+
+    def should_shed(self, priority: str) -> bool:
+        return priority == PRIORITY_LOW and self.level == LOAD_OVERLOADED
+
+    def record_shed(self, kind: str):
+        self.shed[kind] += 1
+
+    def should_reply_busy(self, user_id: int) -> bool:
+        """Rate-limit "busy" replies so shedding does not produce its own flood"""
+        now = time.monotonic()
+        if len(self.busy_replied) > 10000:
+            self.busy_replied = {
+                key: at for key, at in self.busy_replied.items() if now - at < LOAD_BUSY_REPLY_COOLDOWN
+            }
+        if now - self.busy_replied.get(user_id, 0.0) < LOAD_BUSY_REPLY_COOLDOWN:
+            return False
+        self.busy_replied[user_id] = now
+        return True
+
+    async def wait_normal(self, kind: str, max_wait: float = LOAD_MAX_DEFER):
+        """Defer non-essential work while load is above normal (at most max_wait)"""
+        if self.level == LOAD_NORMAL:
+            return
+        self.deferred[kind] += 1
+        deadline = time.monotonic() + max_wait
+        while self.level != LOAD_NORMAL and time.monotonic() < deadline:
+            await asyncio.sleep(1)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until no update is being handled, False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.pending > 0:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'level': self.level,
+            'level_for': time.monotonic() - self.level_since,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'pending': self.pending,
+            'shed': dict(self.shed),
+            'deferred': dict(self.deferred),
+            'thresholds': {
+                LOAD_ELEVATED: {'lag': LOAD_ELEVATED_LAG, 'pending': LOAD_ELEVATED_PENDING},
+                LOAD_OVERLOADED: {'lag': LOAD_OVERLOADED_LAG, 'pending': LOAD_OVERLOADED_PENDING},
+            },
+        }
+
+
+load = LoadManager()
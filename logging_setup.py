@@ -0,0 +1,264 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject, Update
+
+from config import (
+    LOG_LEVEL,
+    LOG_FORMAT,
+    LOG_FORMAT_JSON,
+    LOG_FILE,
+    LOG_QUEUE_SIZE,
+    LOG_RATE_LIMIT_INTERVAL,
+    LOG_RATE_LIMIT_BURST
+)
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_FIELDS = ("update_id", "user_id", "handler", "latency_ms")
+
+
+class UpdateContext:
+    __slots__ = ("update_id", "user_id", "handler", "started")
+
+    def __init__(self, update_id: int, user_id: Optional[int]):
+        self.update_id = update_id
+        self.user_id = user_id
+        self.handler: Optional[str] = None
+        self.started = time.perf_counter()
+
+
+_context: ContextVar[Optional[UpdateContext]] = ContextVar("log_context", default=None)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the update being handled to the record (runs in the calling thread, where the context is known)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _context.get()
+        if context is None:
+            record.update_id = record.user_id = record.handler = record.latency_ms = None
+        else:
+            record.update_id = context.update_id
+            record.user_id = context.user_id
+            record.handler = context.handler
+            record.latency_ms = round((time.perf_counter() - context.started) * 1000, 1)
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` identical warnings and errors (same logger,
+    message and arguments) in every `interval` seconds, so an error repeating
+    for thousands of updates does not flood the log while different errors
+    from the same place still get through. The first record of the next
+    window carries the number of suppressed ones.
+    """
+
+    def __init__(self, interval: float = LOG_RATE_LIMIT_INTERVAL, burst: int = LOG_RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.sites: Dict[tuple, list] = {}  # (logger, msg, args) -> [window start, passed, suppressed]
+        self.unreported = 0  # Suppressed records of expired windows dropped from `sites`
+        self.pruned = 0.0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.suppressed = 0
+        if record.levelno < logging.WARNING:
+            return True
+        # Arguments may be unhashable (dicts, lists), their repr identifies the message
+        key = (record.name, str(record.msg), repr(record.args))
+        with self.lock:
+            if record.created - self.pruned >= self.interval:
+                self._prune(record.created)
+            state = self.sites.get(key)
+            if state is None or record.created - state[0] >= self.interval:
+                record.suppressed = state[2] if state else 0
+                self.sites[key] = [record.created, 1, 0]
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+    def _prune(self, now: float):
+        """Forget messages whose window is over, so distinct messages do not pile up"""
+        # Ones with suppressed records are kept a window longer, for the next record to report them
+        expired = [
+            key for key, state in self.sites.items()
+            if now - state[0] >= self.interval * (2 if state[2] else 1)
+        ]
+        for key in expired:
+            self.unreported += self.sites.pop(key)[2]
+        self.pruned = now
+
+    def pending_suppressed(self) -> int:
+        """Suppressed records not reported yet"""
+        with self.lock:
+            return self.unreported + sum(state[2] for state in self.sites.values())
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if getattr(record, "suppressed", 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Classic text lines with the update context appended"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        if getattr(record, "update_id", None) is not None:
+            text += (
+                f" [update {record.update_id}, user {record.user_id}, "
+                f"handler {record.handler}, {record.latency_ms} ms]"
+            )
+        if getattr(record, "suppressed", 0):
+            text += f" ({record.suppressed} similar messages suppressed)"
+        return text
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the writer thread as they are: the message is only
+    formatted there (logging.handlers.QueueHandler formats in the calling
+    thread). Never blocks: records are dropped when `max_size` are waiting.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, max_size: int = LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # SimpleQueue is unbounded but much cheaper to put into than queue.Queue
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(record)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[LogQueueHandler] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, path: Optional[str] = LOG_FILE,
+                  queue_size: int = LOG_QUEUE_SIZE):
+    """Route all logging of this process through a queue to a background writer thread"""
+    global _listener, _queue_handler, _rate_limit
+    target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)
+    target.setFormatter(JsonFormatter() if log_format == LOG_FORMAT_JSON else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = LogQueueHandler(log_queue, queue_size)
+    # Rate limiting first, so suppressed records skip the rest
+    _rate_limit = RateLimitFilter()
+    _queue_handler.addFilter(_rate_limit)
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [_queue_handler]
+    root.setLevel(level)
+    # One line per update, replaced by our "Update handled" record with the context fields
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Write out queued records and log synchronously from now on"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    target = _listener.handlers[0]
+    for log_filter in _queue_handler.filters:
+        target.addFilter(log_filter)
+    logging.getLogger().handlers[:] = [target]
+    _listener = None
+    if _queue_handler.dropped:
+        logger.warning("%s log records dropped, the log queue was full", _queue_handler.dropped)
+    suppressed = _rate_limit.pending_suppressed()
+    if suppressed:
+        logger.warning("%s repeated warnings and errors suppressed since their last report", suppressed)
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Outer update middleware: records logged while an update is handled carry its id and user"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        token = _context.set(UpdateContext(event.update_id, user.id if user else None))
+        try:
+            return await handler(event, data)
+        finally:
+            logger.info("Update %s handled", event.update_id)
+            _context.reset(token)
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Inner middleware adding the handler name to the update context"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        context = _context.get()
+        if context is not None:
+            callback = data["handler"].callback
+            context.handler = getattr(callback, "__name__", type(callback).__name__)
+        return await handler(event, data)
+
+
+def install_log_context(dp: Dispatcher):
+    """Register the context middlewares; call before the other outer update middlewares"""
+    dp.update.outer_middleware(UpdateContextMiddleware())
+    middleware = HandlerContextMiddleware()
+    for name, observer in dp.observers.items():
+        if name != "update":
+            observer.middleware(middleware)
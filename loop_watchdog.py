@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from config import BASE_DIR, WATCHDOG_THRESHOLD, WATCHDOG_INTERVAL, WATCHDOG_LOG_INTERVAL
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = str(BASE_DIR.resolve())
+HANDLERS_DIR = str((BASE_DIR / "handlers").resolve())
+DATABASE_FILE = str((BASE_DIR / "database.py").resolve())
+
+
+class BlockSite:
+    """Blocks of the event loop caught at one place in the code"""
+    __slots__ = ("handler", "db_method", "site", "count", "total", "max", "last_logged", "suppressed")
+
+    def __init__(self, handler: str, db_method: str, site: str):
+        self.handler = handler
+        self.db_method = db_method
+        self.site = site
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_logged = 0.0
+        self.suppressed = 0
+
+
+def attribute(frame) -> Tuple[str, str, str]:
+    """(handler, Database method, call site) of a captured event loop stack"""
+    handler = db_method = site = None
+    while frame is not None:
+        code = frame.f_code
+        path = code.co_filename
+        if path.startswith(PROJECT_DIR):
+            if site is None and not path.endswith("metrics.py"):
+                site = f"{path[len(PROJECT_DIR) + 1:]}:{frame.f_lineno} {code.co_name}"
+            if db_method is None and path == DATABASE_FILE and code.co_qualname.startswith("Database."):
+                db_method = code.co_name
+            if path.startswith(HANDLERS_DIR):
+                handler = code.co_name  # Keep the outermost: the registered handler
+        frame = frame.f_back
+    return handler or "-", db_method or "-", site or "-"
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that block the event loop. A heartbeat task ticks every
+    `interval` seconds; a watchdog thread notices when a tick is more than
+    `threshold` seconds late, captures the loop thread's stack at that moment
+    and, once the loop is back, records how long it was blocked. Blocks are
+    counted per call site and attributed to the handler and Database method
+    on the stack; each site is logged at most once per WATCHDOG_LOG_INTERVAL.
+    """
+
+    def __init__(self, threshold: float = WATCHDOG_THRESHOLD, interval: float = WATCHDOG_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.beat = time.monotonic()
+        self.sites: Dict[Tuple[str, str, str], BlockSite] = {}
+        self.lock = threading.Lock()
+        self.loop_thread: Optional[int] = None
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        if self.heartbeat_task is not None:
+            return
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.stop_event.clear()
+        self.heartbeat_task = asyncio.create_task(self._heartbeat())
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        if self.heartbeat_task is None:
+            return
+        self.stop_event.set()
+        self.heartbeat_task.cancel()
+        await asyncio.gather(self.heartbeat_task, return_exceptions=True)
+        self.heartbeat_task = None
+        self.thread.join()
+
+    async def _heartbeat(self):
+        while True:
+            self.beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        blocked_beat = None
+        captured = None
+        while not self.stop_event.wait(self.interval / 2):
+            beat = self.beat
+            if captured and beat != blocked_beat:
+                # Loop is running again: the block lasted until this beat
+                self._record(*captured, duration=beat - blocked_beat - self.interval)
+                captured = None
+            if captured is None and time.monotonic() - beat - self.interval > self.threshold:
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    blocked_beat = beat
+                    captured = (attribute(frame), "".join(traceback.format_stack(frame)))
+
+    def _record(self, key: Tuple[str, str, str], stack: str, duration: float):
+        handler, db_method, site = key
+        metrics.loop_block_duration.observe(duration, handler, db_method)
+        metrics.loop_blocks.inc(site)
+        now = time.monotonic()
+        with self.lock:
+            block = self.sites.get(key)
+            if block is None:
+                block = self.sites[key] = BlockSite(handler, db_method, site)
+            block.count += 1
+            block.total += duration
+            block.max = max(block.max, duration)
+            if now - block.last_logged < WATCHDOG_LOG_INTERVAL:
+                block.suppressed += 1
+                return
+            suppressed, block.suppressed = block.suppressed, 0
+            block.last_logged = now
+        repeated = f" ({suppressed} more since the last report)" if suppressed else ""
+        logger.warning(
+            "Event loop blocked for %.0f ms in handler %s, Database method %s, at %s%s\n%s",
+            duration * 1000, handler, db_method, site, repeated, stack
+        )
+
+    def top(self, limit: int = 10) -> List[BlockSite]:
+        """Call sites with the largest total blocked time"""
+        with self.lock:
+            sites = list(self.sites.values())
+        return sorted(sites, key=lambda block: block.total, reverse=True)[:limit]
+
+
+watchdog = LoopWatchdog()
@@ -1,107 +1,149 @@
 import asyncio
+import logging
+import signal
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.client.default import DefaultBotProperties
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
-from config import BOT_TOKEN
+from config import (
+    WORKERS,
+    MAX_PENDING_UPDATES,
+    RUN_MODE,
+    RUN_MODE_WEBHOOK,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    SHUTDOWN_TIMEOUT,
+    METRICS_ENABLED,
+    WATCHDOG_ENABLED
+)
 from database import init_db
-from handlers import common, user, admin
+from fsm_storage import SQLiteStorage
+from bot_setup import create_bot, create_dispatcher, load_caches, register_metrics, announce_startup
+import image_hash
+import metrics
+from scheduler import JobScheduler
+from jobs import register_jobs, register_worker_jobs
+from workers import run_front
+from load_manager import load
+from logging_setup import setup_logging, stop_logging
+from loop_watchdog import watchdog
+from outbound import send_later, replay_outbox, PRIORITY_INTERACTIVE
+from shutdown import drain
+from update_log import ProcessedUpdates
+
+logger = logging.getLogger(__name__)
+
+async def start_webhook(dp: Dispatcher, bot: Bot) -> web.AppRunner:
+    """Serve updates from Telegram webhook with aiohttp"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    # Emits dispatcher startup/shutdown together with the web app
+    setup_application(app, dp, bot=bot)
+
+    # On cleanup requests being received get SHUTDOWN_TIMEOUT seconds to complete
+    runner = web.AppRunner(app, shutdown_timeout=SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    return runner
 
 async def main():
     # Initialize database
     init_db()
-    
-    # Initialize bot with default properties
-    bot = Bot(
-        token=BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    
-    # Include routers
-    dp.include_router(common.router)
-    dp.include_router(user.router)
-    dp.include_router(admin.router)
-    
-    # Start polling
-    await dp.start_polling(bot)
+    bot = create_bot()
+    if WORKERS > 1:
+        # This process only receives updates, worker processes handle them
+        await run_front(bot)
+        return
 
-if __name__ == "__main__":
-    asyncio.run(main())
-    
-async def main():
+    load_caches()
+    storage = SQLiteStorage()
+    storage.load()
+    processed_updates = ProcessedUpdates()
+    processed_updates.load()
+    scheduler = JobScheduler()
+    dp = create_dispatcher(storage=storage, processed_updates=processed_updates, scheduler=scheduler)
+
+    # Periodic jobs (channel publishing, reports, cleanup)
+    register_jobs(scheduler, bot)
+    register_worker_jobs(scheduler, storage)
+    scheduler.start()
+    load.start()
+    if WATCHDOG_ENABLED:
+        watchdog.start()
+    metrics_runner = None
+    if METRICS_ENABLED:
+        register_metrics(bot, dp, storage)
+        metrics_runner = await metrics.start_server()
+    # Messages that were not sent before the last shutdown
+    send_later(replay_outbox(bot), PRIORITY_INTERACTIVE)
+    await announce_startup(bot)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    # Receive updates until SIGINT/SIGTERM
+    runner = None
+    polling = None
     try:
-        # Validate token first
-        if not BOT_TOKEN:
-            raise ValueError("BOT_TOKEN is not set in config.py")
-        
-        # Initialize database
-        init_db()
-        logger.info("Database initialized successfully")
-        
-        # Initialize bot with default properties
-        bot = Bot(
-            token=BOT_TOKEN,
-            default=DefaultBotProperties(
-                parse_mode=ParseMode.HTML,
-                link_preview_is_disabled=True
-            )
-        )
-        
-        # Create storage and dispatcher
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
-        
-        # Register middlewares
-        dp.update.middleware(AdminProtectionMiddleware())
-        
-        # Include routers
-        dp.include_router(common.router)
-        dp.include_router(user.router)
-        dp.include_router(admin.router)
-        
-        # Set bot commands
-        await set_default_commands(bot)
-        
-        # Notify admins about bot start
-        await notify_admins(bot, "🤖 Бот успешно запущен!")
-        
-        # Start polling
-        logger.info("Starting bot polling...")
-        await dp.start_polling(bot)
-        
-    except TokenValidationError:
-        logger.error("Invalid bot token provided")
-    except Exception as e:
-        logger.critical(f"Fatal error: {str(e)}", exc_info=True)
+        if RUN_MODE == RUN_MODE_WEBHOOK:
+            runner = await start_webhook(dp, bot)
+            await stop_event.wait()
+        else:
+            polling = asyncio.create_task(dp.start_polling(
+                bot,
+                allowed_updates=dp.resolve_used_update_types(),
+                tasks_concurrency_limit=MAX_PENDING_UPDATES,
+                handle_signals=False,
+                close_bot_session=False
+            ))
+            stopped = asyncio.create_task(stop_event.wait())
+            await asyncio.wait([polling, stopped], return_when=asyncio.FIRST_COMPLETED)
+            stopped.cancel()
     finally:
-        await bot.session.close() if 'bot' in locals() else None
+        logger.info("Stopping bot")
+        # Stop receiving updates first, then let the received ones finish
+        if polling:
+            if not polling.done():
+                await dp.stop_polling()
+            await asyncio.gather(polling, return_exceptions=True)
+        if runner:
+            # Webhook stays registered: Telegram keeps updates until the next start
+            await runner.cleanup()
+        await scheduler.stop(SHUTDOWN_TIMEOUT)
+        await drain(bot)
+        await watchdog.stop()
+        await load.stop()
+        await storage.close()
+        await processed_updates.close()
+        image_hash.shutdown()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
         logger.info("Bot stopped")
 
-async def set_default_commands(bot: Bot):
-    """Set default bot commands"""
-    from aiogram.types import BotCommand
-    commands = [
-        BotCommand(command="start", description="Начать работу с ботом"),
-        BotCommand(command="help", description="Помощь и инструкции"),
-        BotCommand(command="profile", description="Просмотр профиля (для админов)")
-    ]
-    await bot.set_my_commands(commands)
-
-async def notify_admins(bot: Bot, message: str):
-    """Send notification to all admins"""
-    for admin_id in ADMIN_IDS:
-        try:
-            await bot.send_message(admin_id, message)
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {str(e)}")
-
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Bot stopped by keyboard interrupt")
-    except Exception as e:
-        logger.critical(f"Unexpected error: {str(e)}", exc_info=True)
\ No newline at end of file
+    finally:
+        stop_logging()
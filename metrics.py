@@ -0,0 +1,320 @@
+import bisect
+import logging
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from config import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+from sql_trace import tracer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+API_BUCKETS = LATENCY_BUCKETS + (30, 60)  # getUpdates long polling takes up to 30s
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """Base of the metric types, every instance is added to the registry"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[tuple, Any] = {}
+        # Database methods also run in executor threads
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def set_total(self, value: float, *labels: str):
+        """Mirror a counter kept by another component"""
+        with self.lock:
+            self.values[labels] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                # Count per bucket (last one is +Inf), then the sum
+                state = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            items = [(labels, list(state)) for labels, state in self.values.items()]
+        for labels, state in items:
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                yield f"{self.name}_bucket", {**base, 'le': _format_value(bound)}, cumulative
+            yield f"{self.name}_count", base, cumulative
+            yield f"{self.name}_sum", base, state[-1]
+
+
+_metrics: List[Metric] = []
+_collectors: List[Callable[[], None]] = []
+
+
+def register_collector(collector: Callable[[], None]):
+    """Function called before every scrape, typically to set gauges"""
+    _collectors.append(collector)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            logger.error("Metrics collector %s failed: %s", collector.__name__, e)
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Hot path metrics
+handler_duration = Histogram(
+    "bot_handler_duration_seconds", "Handler execution time", ("handler", "status")
+)
+db_query_duration = Histogram(
+    "bot_db_query_duration_seconds",
+    "Time of one SQL statement (execute only, fetching rows is not included) by Database method",
+    ("method",), DB_BUCKETS
+)
+db_method_calls = Counter(
+    "bot_db_method_calls_total", "Database method calls", ("method",)
+)
+api_request_duration = Histogram(
+    "bot_api_request_duration_seconds",
+    "Telegram Bot API call time by method and outcome (ok, retry_after, error)",
+    ("method", "status"), API_BUCKETS
+)
+
+# Filled by collectors at scrape time
+event_loop_lag = Gauge("bot_event_loop_lag_seconds", "Smoothed event loop lag")
+updates_pending = Gauge("bot_updates_pending", "Updates received and not handled yet")
+load_level = Gauge("bot_load_level", "Load level: 0 normal, 1 elevated, 2 overloaded")
+updates_shed = Counter("bot_updates_shed_total", "Updates refused under load", ("kind",))
+work_deferred = Counter("bot_work_deferred_total", "Background work postponed under load", ("kind",))
+concurrency_active = Gauge("bot_concurrency_active", "Handlers holding a concurrency slot")
+concurrency_queued = Gauge("bot_concurrency_queued", "Updates waiting for their user's turn or a slot")
+outbound_queued = Gauge("bot_outbound_queued", "Sends waiting for a rate limit slot", ("priority",))
+outbound_sent = Counter("bot_outbound_sent_total", "Rate limited sends completed", ("priority",))
+outbound_retries = Counter("bot_outbound_retries_total", "Sends retried after flood control", ("priority",))
+fsm_states = Gauge("bot_fsm_states", "Users in a dialog state")
+fsm_records = Gauge("bot_fsm_records", "FSM records cached in memory")
+
+# Filled by the loop watchdog
+loop_block_duration = Histogram(
+    "bot_loop_block_duration_seconds", "Event loop blocks longer than WATCHDOG_THRESHOLD",
+    ("handler", "db_method")
+)
+loop_blocks = Counter("bot_loop_blocks_total", "Event loop blocks by call site", ("site",))
+
+# Filled by the backup job
+backup_last_success = Gauge("bot_backup_last_success_timestamp_seconds", "Time of the last verified backup")
+backup_size = Gauge("bot_backup_size_bytes", "Size of the last backup")
+backup_duration = Gauge("bot_backup_duration_seconds", "Time the last backup took, including verification")
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing every handler call"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = data["handler"].callback
+        name = getattr(callback, "__name__", type(callback).__name__)
+        status = "error"
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            status = "ok"
+            return result
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name, status)
+
+
+def install_handler_metrics(dp: Dispatcher):
+    """Time handlers of all event types (inner middlewares apply to included routers too)"""
+    middleware = HandlerMetricsMiddleware()
+    for name, observer in dp.observers.items():
+        if name != "update":
+            observer.middleware(middleware)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Session middleware timing Bot API calls. Registered after OutboundScheduler,
+    so it measures the request itself, not the wait for a send slot; every
+    flood control retry is counted as a separate call.
+    """
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ):
+        status = "error"
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+            status = "ok"
+            return result
+        except TelegramRetryAfter:
+            status = "retry_after"
+            raise
+        finally:
+            api_request_duration.observe(time.perf_counter() - started, type(method).__name__, status)
+
+
+_db_method: ContextVar[str] = ContextVar("db_method", default="other")
+
+
+def _observe_query(conn: sqlite3.Connection, sql: str, parameters, elapsed: float):
+    method = _db_method.get()
+    if METRICS_ENABLED:
+        db_query_duration.observe(elapsed, method)
+    if tracer.enabled:
+        tracer.record(conn, sql, parameters, elapsed, method)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Reports every statement to the metrics and the SQL tracer (see sql_trace.py)"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _observe_query(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _observe_query(self.connection, sql, None, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection factory for sqlite3.connect() that times every statement"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _track_method(name: str, func: Callable) -> Callable:
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        db_method_calls.inc(name)
+        token = _db_method.set(name)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _db_method.reset(token)
+    return wrapper
+
+
+def instrument_methods(cls: type):
+    """Count calls of the class's static methods and attribute their queries to them"""
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, staticmethod):
+            setattr(cls, name, staticmethod(_track_method(name, attr.__func__)))
+
+
+async def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Serve /metrics, None if the port can not be bound (the bot keeps running)"""
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError as e:
+        logger.error("Metrics server can not listen on %s:%s: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logger.info("Metrics available at http://%s:%s/metrics", host, port)
+    return runner
@@ -1,8 +1,19 @@
+import asyncio
+import logging
+import time
+from collections import deque
 from aiogram import BaseMiddleware
-from aiogram.types import Message
-from typing import Callable, Dict, Any, Awaitable
+from aiogram.types import Message, TelegramObject, Update
+from typing import Callable, Dict, Any, Awaitable, Hashable
 
+from config import MAX_CONCURRENT_UPDATES
 from database import Database
+from load_manager import LoadManager, get_update_priority, PRIORITY_HIGH
+from update_log import ProcessedUpdates
+
+logger = logging.getLogger(__name__)
+
+BUSY_TEXT = "⏳ Бот сейчас перегружен, попробуйте чуть позже."
 
 class UserMiddleware(BaseMiddleware):
     async def __call__(
@@ -16,4 +27,161 @@ class UserMiddleware(BaseMiddleware):
             await event.answer("Извините, вы были заблокированы в боте.")
             return
         
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
+
+class _KeyQueue:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0  # Updates of this key waiting or running
+
+
+class OrderedConcurrencyMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: updates with the same (chat, user) key are handled
+    one at a time in arrival order, different keys run in parallel, at most
+    `limit` handlers at once. A key's queue is dropped as soon as it is empty,
+    so memory only depends on the number of updates in flight. aiogram's FSM
+    middleware is registered after this one, so the state is read under the
+    key lock.
+    """
+
+    def __init__(self, limit: int = MAX_CONCURRENT_UPDATES, samples: int = 1000):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.queues: Dict[Hashable, _KeyQueue] = {}
+        self.active = 0
+        self.max_depth = 0
+        self.handled = 0
+        self.wait_times = deque(maxlen=samples)
+
+    @staticmethod
+    def get_key(data: Dict[str, Any]) -> Hashable:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        return (chat.id if chat else None, user.id if user else None)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        key = self.get_key(data)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = _KeyQueue()
+        queue.depth += 1
+        self.max_depth = max(self.max_depth, queue.depth)
+        received = time.monotonic()
+        try:
+            # Key lock first: waiting updates of a busy user do not hold global slots
+            async with queue.lock:
+                if data.get("update_priority") == PRIORITY_HIGH:
+                    # Admins bypass the global limit, so the panel stays usable under load
+                    return await self._handle(handler, event, data, received)
+                async with self.semaphore:
+                    return await self._handle(handler, event, data, received)
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                del self.queues[key]
+
+    async def _handle(self, handler, event, data, received: float) -> Any:
+        self.wait_times.append(time.monotonic() - received)
+        self.active += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.active -= 1
+            self.handled += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Current load and wait times of the last handled updates (seconds)"""
+        waits = sorted(self.wait_times)
+        return {
+            'active': self.active,
+            'queued': sum(queue.depth for queue in self.queues.values()) - self.active,
+            'keys': len(self.queues),
+            'max_depth': self.max_depth,
+            'handled': self.handled,
+            'wait_avg': sum(waits) / len(waits) if waits else 0.0,
+            'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            'wait_max': waits[-1] if waits else 0.0,
+        }
+
+
+class LoadSheddingMiddleware(BaseMiddleware):
+    """
+    Outer update middleware in front of OrderedConcurrencyMiddleware: counts
+    updates in processing for the load manager, marks their priority and
+    answers low-priority actions with a short "busy" reply when overloaded.
+    """
+
+    def __init__(self, load: LoadManager):
+        self.load = load
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get("event_from_user")
+        priority = get_update_priority(event, user)
+        if self.load.should_shed(priority):
+            self.load.record_shed(event.event_type)
+            await self._reply_busy(event, user)
+            return None
+
+        data["update_priority"] = priority
+        self.load.update_started()
+        try:
+            return await handler(event, data)
+        finally:
+            self.load.update_finished()
+
+    async def _reply_busy(self, event: Update, user):
+        try:
+            if event.callback_query:
+                # Callback queries have to be answered anyway, this costs nothing extra
+                await event.callback_query.answer(BUSY_TEXT)
+            elif event.message and user and self.load.should_reply_busy(user.id):
+                await event.message.answer(BUSY_TEXT)
+        except Exception as e:
+            logger.warning("Failed to send busy reply: %s", e)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    First outer update middleware: skips updates that were already handled
+    (Telegram redelivers them when the process dies before confirming the
+    polling offset or answering the webhook) and records handled ones.
+
+    Handled ids are saved in batches, so an update handled just before a
+    crash can still be redelivered. Post and feedback submissions check
+    their idempotency key (chat id and message id) for that case, but only
+    once the update reaches their handler: if the FSM state that routes it
+    there was not saved either, the redelivered message matches no handler
+    and is dropped without a reply. Nothing is created twice either way.
+    """
+
+    def __init__(self, processed: ProcessedUpdates):
+        self.processed = processed
+        self.skipped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.processed.is_processed(event.update_id):
+            self.skipped += 1
+            logger.info("Skipping already processed update %s", event.update_id)
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            self.processed.mark(event.update_id)
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Coroutine, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, methods
+from aiogram.client.default import Default
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import (
+    OUTBOUND_RATE_LIMIT_ENABLED,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_BURST,
+    OUTBOUND_CHAT_INTERVAL,
+    OUTBOUND_GROUP_INTERVAL,
+    OUTBOUND_CHAT_BURST,
+    OUTBOUND_MAX_RETRIES
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = 0  # Replies to the user who is talking to the bot
+PRIORITY_MODERATION = 1  # Moderation notifications to users and admins
+PRIORITY_DIGEST = 2  # Reports and channel publishing
+PRIORITY_BROADCAST = 3  # Mass notifications
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_MODERATION: "moderation",
+    PRIORITY_DIGEST: "digest",
+    PRIORITY_BROADCAST: "broadcast",
+}
+
+# Methods that post into a chat and count towards Telegram flood limits
+RATE_LIMITED_PREFIXES = ("Send", "Copy", "Forward", "Edit")
+
+# Waiters inspected per priority class when the first ones are held by per-chat pacing
+SCAN_LIMIT = 50
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+
+class SendCheckpointed(Exception):
+    """Send was saved to the outbox during shutdown instead of being sent"""
+
+
+@contextmanager
+def send_priority(priority: int):
+    """Send everything inside the block with the given priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("chat_id", "future", "enqueued_at")
+
+    def __init__(self, chat_id: Any, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class PriorityStats:
+    __slots__ = ("sent", "retries", "wait_total", "wait_max")
+
+    def __init__(self):
+        self.sent = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Session middleware every Bot API call goes through. Calls that post into a
+    chat wait for a slot: a global token bucket (`rate` per second, `burst`
+    at once) and a per-chat bucket (one message per `chat_interval` seconds in
+    private chats, `group_interval` in groups and channels, up to `chat_burst`
+    in a row). Free slots go to the most urgent priority class first, FIFO
+    within a class. On flood control (retry_after) all sends pause and the
+    call is retried.
+
+    On shutdown start_checkpointing() saves queued and new sends to the
+    outbox table instead (they fail with SendCheckpointed); replay_outbox()
+    sends them after the restart.
+    """
+
+    def __init__(self, rate: float = OUTBOUND_GLOBAL_RATE, burst: int = OUTBOUND_BURST,
+                 chat_interval: float = OUTBOUND_CHAT_INTERVAL,
+                 group_interval: float = OUTBOUND_GROUP_INTERVAL,
+                 chat_burst: int = OUTBOUND_CHAT_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES,
+                 enabled: bool = OUTBOUND_RATE_LIMIT_ENABLED):
+        self.rate = rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.enabled = enabled
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.chat_tokens: Dict[Any, Tuple[float, float]] = {}  # chat_id -> (tokens, updated_at)
+        self.queues: List[Deque[_Waiter]] = [deque() for _ in PRIORITY_NAMES]
+        self.stats_by_priority = {priority: PriorityStats() for priority in PRIORITY_NAMES}
+        self.wakeup: Optional[asyncio.Event] = None
+        self.dispatcher_task: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.checkpointing = False
+        self.checkpointed = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not type(method).__name__.startswith(RATE_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        stats = self.stats_by_priority[priority]
+        attempt = 0
+        while True:
+            if self.checkpointing:
+                self._checkpoint(method, priority)
+            if self.enabled:
+                try:
+                    waited = await self._acquire(priority, chat_id)
+                except SendCheckpointed:
+                    self._checkpoint(method, priority)
+                stats.wait_total += waited
+                stats.wait_max = max(stats.wait_max, waited)
+            self.in_flight += 1
+            try:
+                result = await make_request(bot, method)
+                stats.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                attempt += 1
+                stats.retries += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                logger.warning(
+                    "Flood control on %s to %s, pausing sends for %ss (attempt %s)",
+                    type(method).__name__, chat_id, e.retry_after, attempt
+                )
+                if attempt > self.max_retries or not self.enabled:
+                    raise
+            finally:
+                self.in_flight -= 1
+
+    def _checkpoint(self, method: TelegramMethod, priority: int):
+        """Save the send to the outbox and abort it"""
+        # Fields left to bot defaults (parse_mode etc.) are resolved again on replay
+        defaults = {name for name, value in method if isinstance(value, Default)}
+        Database.add_outbox_message(
+            type(method).__name__,
+            method.model_dump_json(exclude=defaults, exclude_none=True),
+            priority
+        )
+        self.checkpointed += 1
+        raise SendCheckpointed()
+
+    def start_checkpointing(self):
+        """Stop sending: queued and all further sends go to the outbox"""
+        self.checkpointing = True
+        for queue in self.queues:
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.future.done():
+                    waiter.future.set_exception(SendCheckpointed())
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until nothing is queued or being sent, False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.queued() or self.in_flight:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def _interval(self, chat_id: Any) -> float:
+        # Positive ids are private chats, groups/channels are negative or @username
+        if isinstance(chat_id, int) and chat_id > 0:
+            return self.chat_interval
+        return self.group_interval
+
+    async def _acquire(self, priority: int, chat_id: Any) -> float:
+        """Wait for a send slot, returns seconds waited"""
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.dispatcher_task is None or self.dispatcher_task.done():
+            self.dispatcher_task = asyncio.create_task(self._dispatch())
+
+        waiter = _Waiter(chat_id, asyncio.get_running_loop().create_future())
+        self.queues[priority].append(waiter)
+        self.wakeup.set()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self.queues[priority]:
+                self.queues[priority].remove(waiter)
+            raise
+        return time.monotonic() - waiter.enqueued_at
+
+    def _chat_tokens(self, chat_id: Any, now: float) -> float:
+        tokens, updated_at = self.chat_tokens.get(chat_id, (self.chat_burst, now))
+        return min(self.chat_burst, tokens + (now - updated_at) / self._interval(chat_id))
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    def _pick(self, now: float):
+        """Most urgent waiter whose chat may receive a message now, else earliest ready time"""
+        earliest = None
+        for queue in self.queues:
+            blocked = set()
+            for position, waiter in enumerate(queue):
+                if position >= SCAN_LIMIT:
+                    break
+                if waiter.chat_id in blocked:
+                    continue
+                tokens = self._chat_tokens(waiter.chat_id, now)
+                if tokens >= 1:
+                    del queue[position]
+                    return waiter, None
+                blocked.add(waiter.chat_id)
+                ready_at = now + (1 - tokens) * self._interval(waiter.chat_id)
+                earliest = ready_at if earliest is None else min(earliest, ready_at)
+        return None, earliest
+
+    async def _dispatch(self):
+        while True:
+            if not any(self.queues):
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if self.paused_until > now:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+
+            waiter, ready_at = self._pick(now)
+            if waiter is None:
+                # Every queued chat is paced: sleep until the first one is ready or a new send arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), max(ready_at - now, 0.001) if ready_at else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if waiter.future.done():  # Cancelled while waiting
+                continue
+            self.tokens -= 1
+            self.chat_tokens[waiter.chat_id] = (self._chat_tokens(waiter.chat_id, now) - 1, now)
+            waiter.future.set_result(None)
+            if len(self.chat_tokens) > 10000:
+                # Chats with a full bucket behave the same as unknown ones
+                self.chat_tokens = {
+                    chat_id: state for chat_id, state in self.chat_tokens.items()
+                    if self._chat_tokens(chat_id, now) < self.chat_burst
+                }
+
+    def stats(self) -> Dict[str, dict]:
+        """Queue length, sent count, retries and wait times per priority class"""
+        result = {}
+        for priority, name in PRIORITY_NAMES.items():
+            stats = self.stats_by_priority[priority]
+            result[name] = {
+                'queued': len(self.queues[priority]),
+                'sent': stats.sent,
+                'retries': stats.retries,
+                'wait_avg': stats.wait_total / stats.sent if stats.sent else 0.0,
+                'wait_max': stats.wait_max,
+            }
+        return result
+
+
+def get_outbound_scheduler(bot: Bot) -> Optional[OutboundScheduler]:
+    for middleware in bot.session.middleware:
+        if isinstance(middleware, OutboundScheduler):
+            return middleware
+    return None
+
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def send_later(coro: Coroutine, priority: int) -> asyncio.Task:
+    """Run sending coroutine in background, so the caller does not wait for pacing"""
+    with send_priority(priority):
+        # The task copies the current context, including the priority
+        task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def wait_background(timeout: float) -> bool:
+    """Wait for send_later() tasks, False if some are still running after timeout"""
+    if not _background_tasks:
+        return True
+    _, pending = await asyncio.wait(list(_background_tasks), timeout=timeout)
+    return not pending
+
+
+def cancel_background() -> int:
+    tasks = [task for task in _background_tasks if not task.done()]
+    for task in tasks:
+        task.cancel()
+    return len(tasks)
+
+
+async def replay_outbox(bot: Bot):
+    """Send messages saved to the outbox on the previous shutdown"""
+    sent = failed = 0
+    while True:
+        rows = Database.get_outbox_messages(limit=100)
+        if not rows:
+            break
+        for row in rows:
+            # Delete first: if this send is interrupted again it is saved anew
+            Database.delete_outbox_message(row['message_id'])
+            try:
+                method = getattr(methods, row['method']).model_validate_json(row['payload'])
+                with send_priority(row['priority']):
+                    await bot(method)
+                sent += 1
+            except SendCheckpointed:
+                return
+            except Exception as e:
+                failed += 1
+                logger.error("Failed to send %s from outbox: %s", row['method'], e)
+    if sent or failed:
+        logger.info("Outbox replayed: %s sent, %s failed", sent, failed)
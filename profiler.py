@@ -0,0 +1,163 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from config import PROFILE_INTERVAL
+
+PROFILE_WALL = "wall"
+PROFILE_CPU = "cpu"
+
+# Leaf frames of an event loop waiting for I/O, reported as idle time
+IDLE_FRAMES = {"selectors.py:select", "selectors.py:poll"}
+
+
+def _frame_name(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+def _stack(frame) -> List[str]:
+    """Frame names from the outermost call to the innermost"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+class Profile:
+    """Sampled stacks with their weights: elapsed seconds in wall mode, CPU seconds in cpu mode"""
+
+    def __init__(self, mode: str, interval: float):
+        self.mode = mode
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self.cpu_time = 0.0  # Measured CPU time of the sampled threads
+        self.overhead = 0.0  # CPU time of the sampler itself
+
+    @property
+    def total(self) -> float:
+        return sum(self.stacks.values())
+
+    def idle_share(self) -> float:
+        total = self.total
+        idle = sum(weight for stack, weight in self.stacks.items() if stack.rsplit(";", 1)[-1] in IDLE_FRAMES)
+        return idle / total if total else 0.0
+
+    def collapsed(self) -> str:
+        """Collapsed stack format (flamegraph.pl, speedscope), weights in microseconds"""
+        lines = [f"{stack} {round(weight * 1e6)}" for stack, weight in self.stacks.most_common()]
+        return "\n".join(line for line in lines if not line.endswith(" 0")) + "\n"
+
+    def top(self, limit: int = 15) -> List[Tuple[str, float, float]]:
+        """(function, self share, total share) with the largest self time"""
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, weight in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += weight
+            for name in set(frames[1:]):  # First frame is the thread name
+                inclusive[name] += weight
+        total = self.total or 1
+        return [(name, weight / total, inclusive[name] / total) for name, weight in own.most_common(limit)]
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread records the stacks of running
+    threads every `interval` seconds. In wall mode only the thread that
+    started it (the event loop) is sampled, so time blocked in sqlite calls
+    shows up under the calling Database method. In cpu mode every thread is
+    sampled and weighted by the CPU time it used since the previous sample;
+    samples that caught a thread waiting for I/O are dropped, as that CPU
+    time belongs to the code that ran before it.
+
+    The sampler needs the GIL, so it would mostly catch the loop thread when
+    it releases the GIL (waiting in select). While profiling, the switch
+    interval is lowered to make the running thread hand the GIL over quickly,
+    and each wall sample is weighted by the time since the previous one.
+    """
+
+    def __init__(self, mode: str = PROFILE_WALL, interval: float = PROFILE_INTERVAL):
+        self.mode = mode
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.profile = Profile(mode, interval)
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.cpu_times: Dict[int, float] = {}
+        self.switch_interval = sys.getswitchinterval()
+
+    def start(self):
+        sys.setswitchinterval(min(self.switch_interval, self.interval / 10))
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> Profile:
+        self.stop_event.set()
+        self.thread.join()
+        sys.setswitchinterval(self.switch_interval)
+        return self.profile
+
+    @staticmethod
+    def _cpu_time(ident: int) -> Optional[float]:
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):
+            return None
+
+    def _run(self):
+        own = threading.get_ident()
+        own_cpu = time.thread_time()
+        started = previous = time.monotonic()
+        while not self.stop_event.wait(self.interval):
+            now = time.monotonic()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.mode == PROFILE_WALL and ident != self.target):
+                    continue
+                weight = now - previous
+                if self.mode == PROFILE_CPU:
+                    cpu_time = self._cpu_time(ident)
+                    if cpu_time is None:
+                        continue
+                    weight = cpu_time - self.cpu_times.get(ident, cpu_time)
+                    self.cpu_times[ident] = cpu_time
+                    self.profile.cpu_time += weight
+                    if weight <= 0 or _frame_name(frame) in IDLE_FRAMES:
+                        continue
+                stack = ";".join([names.get(ident, str(ident))] + _stack(frame))
+                self.profile.stacks[stack] += weight
+            self.profile.samples += 1
+            previous = now
+        self.profile.duration = time.monotonic() - started
+        self.profile.overhead = time.thread_time() - own_cpu
+
+
+_running = threading.Lock()
+
+
+def is_running() -> bool:
+    return _running.locked()
+
+
+async def profile_for(seconds: float, mode: str = PROFILE_WALL) -> Optional[Profile]:
+    """Sample this process for `seconds`, None if another profile is already running"""
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        profiler = SamplingProfiler(mode)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile = profiler.stop()
+        return profile
+    finally:
+        _running.release()
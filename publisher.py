@@ -0,0 +1,102 @@
+import logging
+from datetime import datetime, time as dt_time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest, TelegramForbiddenError
+
+from config import (
+    PUBLISH_CHANNEL_ID,
+    PUBLISH_TIME_SLOTS,
+    PUBLISH_MIN_INTERVAL,
+    PUBLISH_MAX_ATTEMPTS
+)
+from database import Database
+from outbound import send_priority, PRIORITY_DIGEST
+
+logger = logging.getLogger(__name__)
+
+CAPTION_LIMIT = 1024
+MESSAGE_LIMIT = 4096
+
+
+def in_time_slot(now: datetime = None) -> bool:
+    """Check whether current local time is inside one of the publishing slots"""
+    if not PUBLISH_TIME_SLOTS:
+        return True
+    current = (now or datetime.now()).time()
+    for start, end in PUBLISH_TIME_SLOTS:
+        start_time = dt_time.fromisoformat(start)
+        end_time = dt_time.fromisoformat(end)
+        if start_time <= end_time:
+            if start_time <= current < end_time:
+                return True
+        elif current >= start_time or current < end_time:  # Slot over midnight
+            return True
+    return False
+
+
+class Publisher:
+    """Publishes approved posts from the persistent queue to the channel"""
+
+    def __init__(self, bot: Bot, channel_id=PUBLISH_CHANNEL_ID):
+        self.bot = bot
+        self.channel_id = channel_id
+
+    def is_due(self) -> bool:
+        if not in_time_slot():
+            return False
+        seconds = Database.get_seconds_since_last_publication()
+        return seconds is None or seconds >= PUBLISH_MIN_INTERVAL
+
+    async def send(self, post: dict) -> int:
+        """Send post to the channel, returns channel message id"""
+        text = post['text_content'] or None
+        with send_priority(PRIORITY_DIGEST):
+            if post['image_file_id']:
+                message = await self.bot.send_photo(
+                    chat_id=self.channel_id,
+                    photo=post['image_file_id'],
+                    caption=text[:CAPTION_LIMIT] if text else None
+                )
+            else:
+                message = await self.bot.send_message(
+                    chat_id=self.channel_id,
+                    text=text[:MESSAGE_LIMIT]
+                )
+        return message.message_id
+
+    async def publish_next(self) -> bool:
+        """Publish one due post if slot and spacing allow; returns True if published"""
+        if not self.channel_id or not self.is_due():
+            return False
+        post = Database.get_next_publication()
+        if not post:
+            return False
+
+        Database.mark_publication_sending(post['post_id'])
+        try:
+            message_id = await self.send(post)
+        except TelegramRetryAfter as e:
+            logger.warning("Channel flood limit, retry post %s in %ss", post['post_id'], e.retry_after)
+            Database.mark_publication_failed(post['post_id'], str(e), retry_in=e.retry_after)
+            return False
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            logger.error("Post %s cannot be published: %s", post['post_id'], e)
+            Database.mark_publication_failed(post['post_id'], str(e))
+            return False
+        except Exception as e:
+            attempts = post['attempts'] + 1
+            retry_in = None if attempts >= PUBLISH_MAX_ATTEMPTS else 60 * 2 ** attempts
+            logger.error("Failed to publish post %s (attempt %s): %s", post['post_id'], attempts, e)
+            Database.mark_publication_failed(post['post_id'], str(e), retry_in=retry_in)
+            return False
+
+        Database.mark_publication_published(post['post_id'], message_id)
+        logger.info("Post %s published as message %s", post['post_id'], message_id)
+        return True
+
+    def resume(self):
+        """Requeue publications interrupted by a restart"""
+        interrupted = Database.requeue_interrupted_publications()
+        if interrupted:
+            logger.warning("Requeued %s publications interrupted by restart", interrupted)
@@ -0,0 +1,42 @@
+import random
+
+from config import (
+    REPUTATION_TRUSTED_ACTION,
+    REPUTATION_TRUSTED_MIN_APPROVED,
+    REPUTATION_TRUSTED_MIN_SCORE,
+    REPUTATION_SAMPLE_RATE,
+    REPUTATION_ACTION_AUTO_APPROVE,
+    REPUTATION_ACTION_SAMPLE,
+    REPUTATION_ACTION_PRIORITIZE
+)
+
+# Trusted users are placed above everyone else in the pending queue
+TRUSTED_PRIORITY_BONUS = 100
+
+
+def is_trusted(user: dict) -> bool:
+    """User with enough approvals by admins and a high approval rate"""
+    return (
+        user['approved_posts'] >= REPUTATION_TRUSTED_MIN_APPROVED
+        and (user.get('reputation') or 0) >= REPUTATION_TRUSTED_MIN_SCORE
+    )
+
+
+def get_priority(user: dict) -> int:
+    """Priority of user's post in the pending queue (higher is reviewed first)"""
+    priority = int((user.get('reputation') or 0) * 100)
+    if is_trusted(user) and REPUTATION_TRUSTED_ACTION == REPUTATION_ACTION_PRIORITIZE:
+        priority += TRUSTED_PRIORITY_BONUS
+    return priority
+
+
+def should_auto_approve(user: dict, flagged: bool = False) -> bool:
+    """Whether a new post can skip moderation; flagged posts always go to the queue"""
+    if flagged or not is_trusted(user):
+        return False
+    if REPUTATION_TRUSTED_ACTION == REPUTATION_ACTION_AUTO_APPROVE:
+        return True
+    if REPUTATION_TRUSTED_ACTION == REPUTATION_ACTION_SAMPLE:
+        # Keep reviewing a random share of trusted posts
+        return random.random() >= REPUTATION_SAMPLE_RATE
+    return False
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from database import Database
+from load_manager import load
+
+logger = logging.getLogger(__name__)
+
+
+class IntervalTrigger:
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_run(self, after: datetime) -> datetime:
+        return after + timedelta(seconds=self.seconds)
+
+    def __str__(self):
+        return f"every {self.seconds:g}s"
+
+
+class CronTrigger:
+    """
+    Cron trigger "minute hour day month weekday" in local time, as in crontab(5).
+    Fields support `*`, numbers, lists `1,15`, ranges `9-18` and steps `*/5`,
+    `9-18/2` or `5/10` (5, 15, 25, ... up to the end of the range).
+    Weekday is 0-7 with 0 and 7 = Sunday. When both day and weekday are
+    restricted (not `*`), a day matching either of them fires.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        ]
+        # Cron weekdays (0 = Sunday) as datetime.weekday() values (0 = Monday)
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.days_restricted = not fields[2].startswith("*")
+        self.weekdays_restricted = not fields[4].startswith("*")
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            stepped = "/" in part
+            if stepped:
+                part, step_text = part.split("/")
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Cron step must be positive: {field!r}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-"))
+            else:
+                start = int(part)
+                # "5/10" steps from 5 to the end of the range, a plain "5" is just 5
+                end = high if stepped else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron value out of range {low}-{high}: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, candidate: datetime) -> bool:
+        day = candidate.day in self.days
+        weekday = candidate.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day or weekday
+        return day and weekday
+
+    def next_run(self, after: datetime) -> datetime:
+        candidate = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+
+class Job:
+    def __init__(self, name: str, func: Callable, trigger, jitter: float = 0,
+                 timeout: Optional[float] = None, run_in_executor: bool = False,
+                 run_at_start: bool = False, deferrable: bool = False):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.timeout = timeout
+        self.run_in_executor = run_in_executor
+        self.run_at_start = run_at_start
+        self.deferrable = deferrable  # Postponed while the bot is under load
+        self.running = False
+        self.next_run_at: Optional[datetime] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_status: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+
+class JobScheduler:
+    """
+    In-process scheduler: every job runs in its own supervised asyncio task.
+    A run is skipped if the previous one is still in progress, async jobs are
+    cancelled after their timeout, and sync jobs with run_in_executor=True are
+    executed in a thread/process pool. Every run is recorded in job_runs.
+    """
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self.executor = executor
+        self.jobs: Dict[str, Job] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.stopping = False
+
+    def add_interval_job(self, name: str, func: Callable, seconds: float, **kwargs) -> Job:
+        return self.add_job(Job(name, func, IntervalTrigger(seconds), **kwargs))
+
+    def add_cron_job(self, name: str, func: Callable, expression: str, **kwargs) -> Job:
+        return self.add_job(Job(name, func, CronTrigger(expression), **kwargs))
+
+    def add_job(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Job {job.name!r} is already registered")
+        self.jobs[job.name] = job
+        if self.tasks:  # Already started
+            self._start_job(job)
+        return job
+
+    def start(self):
+        self.stopping = False
+        for job in self.jobs.values():
+            self._start_job(job)
+        logger.info("Scheduler started with %s jobs", len(self.jobs))
+
+    async def stop(self, timeout: float = 0):
+        """Stop job loops, runs in progress get `timeout` seconds to finish"""
+        self.stopping = True
+        deadline = time.monotonic() + timeout
+        while any(job.running for job in self.jobs.values()) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    def _start_job(self, job: Job):
+        task = asyncio.create_task(self._job_loop(job), name=f"job:{job.name}")
+        task.add_done_callback(lambda finished, job=job: self._on_loop_done(job, finished))
+        self.tasks[job.name] = task
+
+    def _on_loop_done(self, job: Job, task: asyncio.Task):
+        # Supervisor: restart job loop if it died for any reason other than shutdown
+        if self.stopping or task.cancelled():
+            return
+        logger.error("Job loop %s stopped unexpectedly: %s, restarting", job.name, task.exception())
+        self._start_job(job)
+
+    async def _job_loop(self, job: Job):
+        first = True
+        while True:
+            now = datetime.now()
+            job.next_run_at = now if first and job.run_at_start else job.trigger.next_run(now)
+            first = False
+            delay = (job.next_run_at - now).total_seconds()
+            if job.jitter:
+                delay += random.uniform(0, job.jitter)
+            await asyncio.sleep(max(delay, 0))
+            if job.deferrable:
+                await load.wait_normal(f"job:{job.name}")
+            if self.stopping:
+                return
+            await self.run_job(job)
+
+    async def run_job(self, job: Job):
+        """Run job once, recording the outcome"""
+        if job.running:
+            logger.warning("Job %s is still running, skipping this run", job.name)
+            self._record(job, datetime.now(), 0.0, "skipped", None)
+            return
+
+        job.running = True
+        started_at = datetime.now()
+        started = time.monotonic()
+        status, error = "ok", None
+        executor_future = None
+        try:
+            if job.run_in_executor:
+                loop = asyncio.get_running_loop()
+                executor_future = loop.run_in_executor(self.executor, job.func)
+                # Job stays "running" until the worker really finishes, even after timeout
+                executor_future.add_done_callback(lambda _: setattr(job, "running", False))
+                await asyncio.wait_for(asyncio.shield(executor_future), job.timeout)
+            else:
+                await asyncio.wait_for(job.func(), job.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"exceeded {job.timeout}s"
+            logger.error("Job %s timed out after %ss", job.name, job.timeout)
+        except asyncio.CancelledError:
+            status, error = "cancelled", None
+            raise
+        except Exception as e:
+            status, error = "error", str(e)
+            logger.error("Job %s failed: %s", job.name, e, exc_info=True)
+        finally:
+            if executor_future is None:
+                job.running = False
+            self._record(job, started_at, time.monotonic() - started, status, error)
+
+    def _record(self, job: Job, started_at: datetime, duration: float, status: str, error: Optional[str]):
+        job.runs += 1
+        job.last_run_at = started_at
+        job.last_duration = duration
+        job.last_status = status
+        job.last_error = error
+        try:
+            Database.add_job_run(job.name, started_at.strftime("%Y-%m-%d %H:%M:%S"), duration, status, error)
+        except Exception as e:
+            logger.error("Failed to save run of job %s: %s", job.name, e)
+
+    def get_jobs(self) -> List[Job]:
+        return sorted(self.jobs.values(), key=lambda job: job.name)
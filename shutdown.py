@@ -0,0 +1,45 @@
+import logging
+import time
+
+from aiogram import Bot
+
+from config import SHUTDOWN_TIMEOUT, SHUTDOWN_GRACE
+from load_manager import load
+from outbound import get_outbound_scheduler, wait_background, cancel_background
+
+logger = logging.getLogger(__name__)
+
+
+async def drain(bot: Bot, timeout: float = SHUTDOWN_TIMEOUT):
+    """
+    Let in-flight work finish after updates stopped coming in: handlers first,
+    then queued sends and background send_later() tasks. Whatever is still
+    waiting for a send slot after `timeout` is saved to the outbox and sent
+    after the restart.
+    """
+    deadline = time.monotonic() + timeout
+    pending = load.pending
+    if not await load.wait_idle(timeout):
+        logger.warning("%s handlers still running after %ss", load.pending, timeout)
+
+    outbound = get_outbound_scheduler(bot)
+    queued = outbound.queued() if outbound else 0
+    if queued:
+        logger.info("Sending %s queued messages before shutdown", queued)
+    remaining = max(deadline - time.monotonic(), 0)
+    idle = await wait_background(remaining)
+    if outbound:
+        idle = await outbound.wait_idle(max(deadline - time.monotonic(), 0)) and idle
+
+    checkpointed = cancelled = 0
+    if not idle:
+        if outbound:
+            outbound.start_checkpointing()
+            # Let the aborted senders (mass notification etc.) save the rest and finish
+            await wait_background(SHUTDOWN_GRACE)
+            checkpointed = outbound.checkpointed
+        cancelled = cancel_background()
+    logger.info(
+        "Shutdown drain: %s handlers awaited, %s messages saved to outbox, %s background tasks cancelled",
+        pending, checkpointed, cancelled
+    )
@@ -0,0 +1,128 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config import (
+    SQL_TRACE_ENABLED,
+    SQL_TRACE_THRESHOLD,
+    SQL_TRACE_MAX_STATEMENTS,
+    SQL_TRACE_EXPLAIN_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql: str) -> str:
+    """Statement with literals replaced by ? and whitespace collapsed, so variants group together"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+class StatementStats:
+    __slots__ = ("statement", "method", "count", "total", "max", "slow", "plan", "explained_at")
+
+    def __init__(self, statement: str, method: str):
+        self.statement = statement
+        self.method = method
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.plan: Optional[List[str]] = None
+        self.explained_at = 0.0
+
+
+class SQLTracer:
+    """
+    Opt-in per-statement timing of Database queries, fed by metrics.TimedCursor.
+    Statements are grouped by their normalized text; those slower than
+    `threshold` seconds are logged with their EXPLAIN QUERY PLAN (captured at
+    most once per SQL_TRACE_EXPLAIN_INTERVAL per statement). Can be switched
+    on and off at runtime.
+    """
+
+    def __init__(self, enabled: bool = SQL_TRACE_ENABLED, threshold: float = SQL_TRACE_THRESHOLD,
+                 max_statements: int = SQL_TRACE_MAX_STATEMENTS):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_statements = max_statements
+        self.statements: Dict[str, StatementStats] = {}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def configure(self, enabled: Optional[bool] = None, threshold: Optional[float] = None):
+        if enabled is not None:
+            self.enabled = enabled
+        if threshold is not None:
+            self.threshold = threshold
+        logger.info("SQL tracing %s, slow threshold %.0f ms", 'on' if self.enabled else 'off', self.threshold * 1000)
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.started_at = time.time()
+
+    def record(self, conn: sqlite3.Connection, sql: str, parameters, elapsed: float, method: str):
+        statement = normalize(sql)
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= self.max_statements:
+                    return
+                stats = self.statements[statement] = StatementStats(statement, method)
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            if elapsed < self.threshold:
+                return
+            stats.slow += 1
+            now = time.monotonic()
+            explain = now - stats.explained_at >= SQL_TRACE_EXPLAIN_INTERVAL or stats.plan is None
+            if explain:
+                stats.explained_at = now
+
+        if explain:
+            stats.plan = self.explain(conn, sql, parameters)
+        logger.warning(
+            "Slow query %.1f ms in %s: %s\n%s",
+            elapsed * 1000, method, statement, "\n".join(stats.plan or ["(no plan)"])
+        )
+
+    @staticmethod
+    def explain(conn: sqlite3.Connection, sql: str, parameters) -> Optional[List[str]]:
+        """EXPLAIN QUERY PLAN lines, indented by depth like the sqlite3 shell"""
+        if parameters is None:  # executemany
+            return None
+        try:
+            # Plain cursor, so the EXPLAIN itself is not traced
+            rows = conn.cursor(sqlite3.Cursor).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            return [f"(plan unavailable: {e})"]
+        depth = {0: 0}
+        lines = []
+        for row in rows:
+            node_id, parent_id, detail = row[0], row[1], row[-1]
+            depth[node_id] = depth.get(parent_id, 0) + 1
+            lines.append("  " * depth[node_id] + detail)
+        return lines
+
+    def top(self, limit: int = 10) -> List[StatementStats]:
+        """Statements with the largest total time"""
+        with self.lock:
+            statements = list(self.statements.values())
+        return sorted(statements, key=lambda stats: stats.total, reverse=True)[:limit]
+
+
+tracer = SQLTracer()
@@ -0,0 +1,407 @@
+"""
+Local Telegram Bot API emulator for load and rate limit testing.
+
+Serves the Bot API methods the bot uses at /bot<token>/<method>, with
+configurable latency, injected flood control (429 retry_after) errors, chats
+that blocked the bot (403) and enforcement of the global and per-chat send
+limits. Every call is recorded; the control API under /emulator/ returns the
+recorded calls and delivery/pacing statistics, injects incoming updates for
+getUpdates and changes the settings at runtime.
+
+Point the bot at it with TELEGRAM_API_URL = "http://127.0.0.1:8081" in config.py.
+
+Usage: python telegram_emulator.py [--port 8081] [--latency 0.05] [--retry-after-share 0.01] [--blocked-share 0.02]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Methods that post into a chat and count towards the send limits
+SEND_METHODS = {"sendmessage", "sendphoto", "senddocument", "copymessage", "forwardmessage"}
+EDIT_METHODS = {"editmessagetext", "editmessagereplymarkup"}
+
+BOT_USER = {"id": 1000000001, "is_bot": True, "first_name": "Emulated bot", "username": "emulated_bot"}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def wait(self) -> float:
+        """Seconds until a token is available, 0 if there is one"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class EmulatorSettings:
+    """Behaviour of the emulator, all fields can be changed at runtime (POST /emulator/config)"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 retry_after_share: float = 0.0, retry_after: int = 5,
+                 blocked_share: float = 0.0, blocked_chats: List[int] = (),
+                 global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: int = 3,
+                 group_rate: float = 20 / 60, enforce_limits: bool = True, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.retry_after_share = retry_after_share  # Share of sends answered with an injected 429
+        self.retry_after = retry_after
+        self.blocked_share = blocked_share  # Share of private chats that blocked the bot
+        self.blocked_chats = set(blocked_chats)
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.enforce_limits = enforce_limits
+        self.seed = seed
+
+    def update(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            if not hasattr(self, key):
+                raise KeyError(key)
+            setattr(self, key, set(value) if key == "blocked_chats" else value)
+
+    def as_dict(self) -> Dict[str, Any]:
+        values = dict(vars(self))
+        values['blocked_chats'] = sorted(self.blocked_chats)
+        return values
+
+
+class TelegramEmulator:
+    """
+    In-process emulator state and aiohttp application. Can be started from a
+    benchmark or test with start() as well as from the command line.
+    """
+
+    def __init__(self, settings: Optional[EmulatorSettings] = None):
+        self.settings = settings or EmulatorSettings()
+        self.rng = random.Random(self.settings.seed)
+        self.started_at = time.monotonic()
+        self.calls: List[Dict[str, Any]] = []
+        self.updates: Deque[Dict[str, Any]] = deque()
+        self.update_ids = itertools.count(1)
+        self.updates_event = asyncio.Event()
+        self.message_ids: Dict[int, int] = defaultdict(int)
+        self.global_bucket = TokenBucket(self.settings.global_rate, self.settings.global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+    # ----- Bot API -----
+
+    def is_blocked(self, chat_id: int) -> bool:
+        if chat_id in self.settings.blocked_chats:
+            return True
+        if chat_id <= 0 or not self.settings.blocked_share:
+            return False
+        # Stable per chat for a given seed
+        return random.Random(f"{self.settings.seed}:{chat_id}").random() < self.settings.blocked_share
+
+    def check_limits(self, chat_id: int) -> float:
+        """Seconds to wait if the send exceeds the global or per-chat limit, 0 if allowed"""
+        settings = self.settings
+        if self.global_bucket.rate != settings.global_rate:
+            self.global_bucket = TokenBucket(settings.global_rate, settings.global_rate)
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            rate = settings.chat_rate if chat_id > 0 else settings.group_rate
+            bucket = self.chat_buckets[chat_id] = TokenBucket(rate, settings.chat_burst)
+        # A refused send uses up no tokens
+        wait = max(bucket.wait(), self.global_bucket.wait())
+        if not wait:
+            bucket.tokens -= 1
+            self.global_bucket.tokens -= 1
+        return wait
+
+    def make_message(self, chat_id: int, params: Dict[str, Any], method: str) -> Dict[str, Any]:
+        self.message_ids[chat_id] += 1
+        message = {
+            'message_id': params.get('message_id') or self.message_ids[chat_id],
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': "private" if chat_id > 0 else "supergroup"},
+            'from': BOT_USER,
+        }
+        if method == "sendphoto":
+            photo_id = params['photo'] if isinstance(params.get('photo'), str) else f"photo{message['message_id']}"
+            message['photo'] = [{'file_id': photo_id, 'file_unique_id': photo_id[-16:], 'width': 1280, 'height': 1280}]
+            if params.get('caption'):
+                message['caption'] = params['caption']
+        elif method == "senddocument":
+            message['document'] = {'file_id': f"document{message['message_id']}", 'file_unique_id': f"d{message['message_id']}"}
+        else:
+            message['text'] = params.get('text') or ""
+        markup = params.get('reply_markup')
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message['reply_markup'] = markup
+        return message
+
+    async def get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get('offset') or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self.updates_event.clear()
+            try:
+                await asyncio.wait_for(self.updates_event.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return list(itertools.islice(self.updates, limit))
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Bot API response for one call"""
+        settings = self.settings
+        if method == "getupdates":
+            return {'ok': True, 'result': await self.get_updates(params)}
+
+        if settings.latency or settings.jitter:
+            await asyncio.sleep(settings.latency + self.rng.random() * settings.jitter)
+
+        chat_id = params.get('chat_id')
+        chat_id = int(chat_id) if chat_id is not None and str(chat_id).lstrip("-").isdigit() else chat_id
+        if method in SEND_METHODS or method in EDIT_METHODS:
+            if isinstance(chat_id, int) and self.is_blocked(chat_id):
+                return error(403, "Forbidden: bot was blocked by the user")
+        if method in SEND_METHODS and isinstance(chat_id, int):
+            if settings.retry_after_share and self.rng.random() < settings.retry_after_share:
+                return retry_after(settings.retry_after)
+            if settings.enforce_limits:
+                wait = self.check_limits(chat_id)
+                if wait:
+                    return retry_after(math.ceil(wait))
+
+        if method in SEND_METHODS:
+            return {'ok': True, 'result': self.make_message(chat_id, params, method)}
+        if method in EDIT_METHODS:
+            if params.get('inline_message_id'):
+                return {'ok': True, 'result': True}
+            return {'ok': True, 'result': self.make_message(chat_id, params, method)}
+        if method == "getme":
+            return {'ok': True, 'result': {**BOT_USER, 'can_join_groups': True, 'can_read_all_group_messages': False,
+                                           'supports_inline_queries': False}}
+        if method in ("answercallbackquery", "setmycommands", "deletemycommands", "setwebhook", "deletewebhook"):
+            return {'ok': True, 'result': True}
+        return error(404, "Not Found: method not found")
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method'].lower()
+        params = await read_params(request)
+        started = time.monotonic()
+        response = await self.call(method, params)
+        self.record(method, params, response, started)
+        return web.json_response(response, status=200 if response['ok'] else response['error_code'])
+
+    def record(self, method: str, params: Dict[str, Any], response: Dict[str, Any], started: float):
+        if response['ok']:
+            status = "ok"
+        elif response['error_code'] == 429:
+            status = "retry_after"
+        elif response['error_code'] == 403:
+            status = "blocked"
+        else:
+            status = "error"
+        chat_id = params.get('chat_id')
+        self.calls.append({
+            'time': round(started - self.started_at, 6),
+            'duration': round(time.monotonic() - started, 6),
+            'method': method,
+            'chat_id': int(chat_id) if chat_id is not None and str(chat_id).lstrip("-").isdigit() else chat_id,
+            'status': status,
+            'text': params.get('text') or params.get('caption'),
+        })
+
+    # ----- Control API -----
+
+    def add_update(self, update: Dict[str, Any]) -> int:
+        update = dict(update)
+        update['update_id'] = next(self.update_ids)
+        self.updates.append(update)
+        self.updates_event.set()
+        return update['update_id']
+
+    def find_calls(self, method: str = None, chat_id: int = None, status: str = None) -> List[Dict[str, Any]]:
+        return [
+            call for call in self.calls
+            if (method is None or call['method'] == method.lower())
+            and (chat_id is None or call['chat_id'] == chat_id)
+            and (status is None or call['status'] == status)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        """Counts by method and outcome, delivery per chat and the observed pacing of successful sends"""
+        by_method: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        delivered: Dict[Any, List[float]] = defaultdict(list)
+        for call in self.calls:
+            by_method[call['method']][call['status']] += 1
+            if call['method'] in SEND_METHODS and call['status'] == "ok":
+                delivered[call['chat_id']].append(call['time'])
+
+        times = sorted(itertools.chain.from_iterable(delivered.values()))
+        # Most sends within any one second window
+        peak, first = 0, 0
+        for last, moment in enumerate(times):
+            while moment - times[first] >= 1.0:
+                first += 1
+            peak = max(peak, last - first + 1)
+        intervals = [b - a for chat_times in delivered.values() for a, b in zip(chat_times, chat_times[1:])]
+        return {
+            'calls': len(self.calls),
+            'by_method': {method: dict(statuses) for method, statuses in by_method.items()},
+            'delivered': len(times),
+            'chats': len(delivered),
+            'delivered_per_chat_max': max((len(chat_times) for chat_times in delivered.values()), default=0),
+            'send_rate': len(times) / (times[-1] - times[0]) if len(times) > 1 and times[-1] > times[0] else None,
+            'peak_sends_per_second': peak,
+            'min_chat_interval': min(intervals) if intervals else None,
+        }
+
+    def reset(self):
+        self.calls = []
+        self.started_at = time.monotonic()
+        self.chat_buckets = {}
+        self.global_bucket = TokenBucket(self.settings.global_rate, self.settings.global_rate)
+
+    async def handle_calls(self, request: web.Request) -> web.Response:
+        query = request.query
+        chat_id = int(query['chat_id']) if 'chat_id' in query else None
+        return web.json_response(self.find_calls(query.get('method'), chat_id, query.get('status')))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def handle_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response({'ok': True})
+
+    async def handle_config(self, request: web.Request) -> web.Response:
+        if request.method == "POST":
+            try:
+                self.settings.update(await request.json())
+            except (KeyError, ValueError) as e:
+                return web.json_response({'ok': False, 'description': f"Invalid setting: {e}"}, status=400)
+        return web.json_response(self.settings.as_dict())
+
+    async def handle_updates(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        updates = payload if isinstance(payload, list) else [payload]
+        return web.json_response({'ok': True, 'update_ids': [self.add_update(update) for update in updates]})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/emulator/calls", self.handle_calls)
+        app.router.add_get("/emulator/stats", self.handle_stats)
+        app.router.add_post("/emulator/reset", self.handle_reset)
+        app.router.add_route("*", "/emulator/config", self.handle_config)
+        app.router.add_post("/emulator/updates", self.handle_updates)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> web.AppRunner:
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host=host, port=port).start()
+        logger.info("Telegram Bot API emulator listening on http://%s:%s", host, port)
+        return runner
+
+
+def error(code: int, description: str) -> Dict[str, Any]:
+    return {'ok': False, 'error_code': code, 'description': description}
+
+
+def retry_after(seconds: int) -> Dict[str, Any]:
+    seconds = max(int(seconds), 1)
+    return {
+        'ok': False,
+        'error_code': 429,
+        'description': f"Too Many Requests: retry after {seconds}",
+        'parameters': {'retry_after': seconds},
+    }
+
+
+async def read_params(request: web.Request) -> Dict[str, Any]:
+    """Method parameters from a query string, form (aiogram sends multipart) or JSON body"""
+    params: Dict[str, Any] = dict(request.query)
+    if request.content_type == "application/json":
+        params.update(await request.json())
+        return params
+    if request.can_read_body:
+        form = await request.post()
+        for key, value in form.items():
+            if isinstance(value, web.FileField):
+                params[key] = value.filename
+                continue
+            # Complex values (reply_markup, entities) are sent JSON encoded
+            if value[:1] in ("{", "["):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+    return params
+
+
+async def serve(host: str, port: int, settings: EmulatorSettings):
+    emulator = TelegramEmulator(settings)
+    runner = await emulator.start(host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Telegram Bot API emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--retry-after-share", type=float, default=0.0, help="share of sends answered with 429")
+    parser.add_argument("--retry-after", type=int, default=5, help="retry_after of injected 429 errors")
+    parser.add_argument("--blocked-share", type=float, default=0.0, help="share of private chats that blocked the bot")
+    parser.add_argument("--blocked-chats", default="", help="comma separated chat ids that blocked the bot")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="sends per second for all chats")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="sends per second to one private chat")
+    parser.add_argument("--chat-burst", type=int, default=3)
+    parser.add_argument("--group-rate", type=float, default=20 / 60, help="sends per second to one group")
+    parser.add_argument("--no-limits", action="store_true", help="do not enforce the send limits")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = EmulatorSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        retry_after_share=args.retry_after_share,
+        retry_after=args.retry_after,
+        blocked_share=args.blocked_share,
+        blocked_chats=[int(chat_id) for chat_id in args.blocked_chats.split(",") if chat_id],
+        global_rate=args.global_rate,
+        chat_rate=args.chat_rate,
+        chat_burst=args.chat_burst,
+        group_rate=args.group_rate,
+        enforce_limits=not args.no_limits,
+        seed=args.seed
+    )
+    try:
+        asyncio.run(serve(args.host, args.port, settings))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
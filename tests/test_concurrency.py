@@ -0,0 +1,73 @@
+"""
+Updates of the same user are handled one at a time and each one sees the FSM
+state the previous one has set.
+
+Routers are module level objects that can be attached to one dispatcher only,
+so the dispatcher is built once for the module.
+
+Usage: python -m unittest tests.test_concurrency
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Bot, Router
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Message
+
+import config
+config.METRICS_ENABLED = False
+
+from bot_setup import create_dispatcher
+
+USER_ID = 100000
+PROBE_STATE = "probe:done"
+
+
+def probe_update(update_id: int) -> dict:
+    user = {"id": USER_ID, "is_bot": False, "first_name": "User"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": USER_ID, "type": "private"},
+            "from": user,
+            "text": "/probe",
+        },
+    }
+
+
+class SameUserStateTest(unittest.IsolatedAsyncioTestCase):
+    async def test_second_update_sees_state_of_first(self):
+        seen = []
+        router = Router()
+
+        @router.message(Command("probe"))
+        async def probe(message: Message, state: FSMContext, raw_state: str = None):
+            seen.append(raw_state)
+            # Yield to the loop, so the second update arrives while this one runs
+            await asyncio.sleep(0.05)
+            await state.set_state(PROBE_STATE)
+
+        dp = create_dispatcher(storage=MemoryStorage())
+        dp.include_router(router)
+        bot = Bot(token="123456:test")
+        try:
+            await asyncio.gather(
+                dp.feed_raw_update(bot, probe_update(1)),
+                dp.feed_raw_update(bot, probe_update(2))
+            )
+        finally:
+            await bot.session.close()
+
+        self.assertEqual(seen, [None, PROBE_STATE])
+
+
+if __name__ == "__main__":
+    unittest.main()
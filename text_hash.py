@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config import TEXT_SIMHASH_MAX_DISTANCE, TEXT_SHINGLE_SIZE, TEXT_MIN_LENGTH, FLAG_SIMILAR_TEXT
+from database import Database
+import cache_bus
+from hash_index import HashIndex
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+
+# Separate index per source ('post' texts and 'feedback' messages)
+indexes: Dict[str, HashIndex] = {}
+
+
+def shingles(text: str, size: int = TEXT_SHINGLE_SIZE) -> set:
+    """Split text into normalized word shingles"""
+    tokens = WORD_RE.findall(text.lower())
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def simhash(text: str) -> int:
+    """Compute 64-bit SimHash of text"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for shingle in shingles(text)
+    ]
+    if not hashes:
+        return 0
+    half = len(hashes) / 2
+    value = 0
+    # Majority vote per bit, columns taken from binary strings for speed
+    for column in zip(*(format(h, "064b") for h in hashes)):
+        value = (value << 1) | (column.count("1") > half)
+    return value
+
+
+def get_index(source: str) -> HashIndex:
+    if source not in indexes:
+        indexes[source] = HashIndex()
+    return indexes[source]
+
+
+def load_indexes():
+    """Load stored text hashes into memory"""
+    for source, item_id, value in Database.get_text_hashes():
+        get_index(source).add(item_id, value)
+    logger.info("Loaded %s text hashes", sum(len(index) for index in indexes.values()))
+
+
+def _on_text_hash(event: dict):
+    """Add hash indexed by another worker process"""
+    get_index(event['source']).add(event['item_id'], event['value'])
+
+
+cache_bus.subscribe("text_hash", _on_text_hash)
+
+
+def check_text(source: str, item_id: int, text: str) -> Optional[Tuple[int, int]]:
+    """
+    Index text of a new post/feedback and flag it if a near-duplicate exists.
+    Returns (similar_item_id, distance) or None.
+    """
+    if not text or len(text.strip()) < TEXT_MIN_LENGTH:
+        return None
+    try:
+        value = simhash(text)
+        index = get_index(source)
+        matches = [match for match in index.search(value, TEXT_SIMHASH_MAX_DISTANCE) if match[0] != item_id]
+        Database.save_text_hash(source, item_id, value)
+        index.add(item_id, value)
+        cache_bus.publish("text_hash", {'source': source, 'item_id': item_id, 'value': value})
+
+        if not matches:
+            return None
+        similar_id, distance = matches[0]
+        Database.add_flag(
+            target_type=source,
+            target_id=item_id,
+            kind=FLAG_SIMILAR_TEXT,
+            related_id=similar_id,
+            detail=f"отличие {distance} бит"
+        )
+        return similar_id, distance
+    except Exception as e:
+        logger.error("Failed to check text of %s %s: %s", source, item_id, e)
+        return None
+
+
+def get_clusters(source: str, min_size: int = 2) -> List[List[int]]:
+    """Group items linked by similar-text flags into clusters, largest first"""
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for item_id, related_id in Database.get_flag_links(source, FLAG_SIMILAR_TEXT):
+        parent[find(item_id)] = find(related_id)
+
+    clusters = {}
+    for item in list(parent):
+        clusters.setdefault(find(item), []).append(item)
+    result = [sorted(items) for items in clusters.values() if len(items) >= min_size]
+    result.sort(key=lambda items: (-len(items), items[0]))
+    return result
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+from typing import List, Optional
+
+from config import DATABASE_PATH, PROCESSED_UPDATES_KEEP, PROCESSED_UPDATES_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Evicted ids are deleted from the table in batches of this size
+TRIM_BATCH = 500
+# Failed writes in a row before the flusher gives up until the next handled update
+MAX_FLUSH_FAILURES = 5
+
+
+class ProcessedUpdates:
+    """
+    Rolling log of the last `keep` handled update ids (table processed_updates).
+    Lookups hit an in-memory set. Handled ids are written in batches every
+    `flush_interval` seconds from a worker thread, like the FSM storage, and
+    ids pushed out of the window are deleted TRIM_BATCH at a time, so the
+    table never grows beyond keep + TRIM_BATCH rows.
+
+    An update handled less than `flush_interval` before a crash is not
+    recorded and is handled again when Telegram redelivers it.
+    """
+
+    def __init__(self, path=DATABASE_PATH, keep: int = PROCESSED_UPDATES_KEEP,
+                 flush_interval: float = PROCESSED_UPDATES_FLUSH_INTERVAL):
+        self.keep = keep
+        self.flush_interval = flush_interval
+        self.ids = set()
+        self.order = deque()
+        self.unsaved = []  # (update_id, processed_at) not written yet
+        self.evicted = []
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.write_lock = asyncio.Lock()
+        self.flush_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def load(self):
+        """Load the latest ids and drop older rows"""
+        rows = self.conn.execute(
+            "SELECT update_id, processed_at FROM processed_updates ORDER BY processed_at DESC LIMIT ?",
+            (self.keep,)
+        ).fetchall()
+        for update_id, _ in reversed(rows):
+            self.ids.add(update_id)
+            self.order.append(update_id)
+        if rows:
+            with self.conn:
+                self.conn.execute("DELETE FROM processed_updates WHERE processed_at < ?", (rows[-1][1],))
+        logger.info("Loaded %s processed update ids", len(self.ids))
+
+    def is_processed(self, update_id: int) -> bool:
+        return update_id in self.ids
+
+    def mark(self, update_id: int):
+        """Remember a handled update, it is written by the next flush"""
+        if update_id in self.ids:
+            return
+        self.ids.add(update_id)
+        self.order.append(update_id)
+        if len(self.order) > self.keep:
+            old_id = self.order.popleft()
+            self.ids.discard(old_id)
+            self.evicted.append((old_id,))
+        self.unsaved.append((update_id, time.time()))
+        self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self.closed:
+            logger.warning("Update handled after the processed update log was closed, it is not saved")
+            return
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        failures = 0
+        while self.unsaved and not self.closed:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                logger.error("Failed to save processed update ids (%s in a row): %s", failures, e)
+                if failures >= MAX_FLUSH_FAILURES:
+                    # Ids stay unsaved, the next handled update or close() writes them
+                    logger.error("Processed updates flusher stopped, %s ids not saved yet", len(self.unsaved))
+                    return
+
+    def _take_unsaved(self):
+        """Ids to insert and evicted ids to delete, both are no longer pending"""
+        rows, self.unsaved = self.unsaved, []
+        evicted = []
+        if len(self.evicted) >= TRIM_BATCH:
+            evicted, self.evicted = self.evicted, []
+        return rows, evicted
+
+    async def flush(self):
+        """Write handled ids to SQLite in one transaction"""
+        async with self.write_lock:
+            if not self.unsaved or self.closed:
+                return
+            rows, evicted = self._take_unsaved()
+            try:
+                await asyncio.to_thread(self._write, rows, evicted)
+            except Exception:
+                # Retry on next flush
+                self.unsaved[:0] = rows
+                self.evicted[:0] = evicted
+                raise
+
+    def _write(self, rows, evicted):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO processed_updates (update_id, processed_at) VALUES (?, ?)",
+                rows
+            )
+            if evicted:
+                self.conn.executemany("DELETE FROM processed_updates WHERE update_id = ?", evicted)
+
+    async def close(self):
+        """Write out pending ids and close the connection; later calls do nothing"""
+        if self.closed:
+            return
+        self.closed = True
+        # Holding the lock, no write is in progress: the flusher is sleeping or waiting for the lock
+        async with self.write_lock:
+            if self.flush_task:
+                self.flush_task.cancel()
+            rows, evicted = self._take_unsaved()
+            try:
+                self._write(rows, evicted)
+            except Exception as e:
+                logger.error("Failed to save %s processed update ids on close: %s", len(rows), e)
+            self.conn.close()
+
+
+class UpdateInbox:
+    """
+    Raw updates received by the front process of the multi-process mode
+    (table update_inbox). Updates are stored before the polling offset is
+    confirmed or the webhook request answered, and removed by trim() once a
+    worker has recorded them in processed_updates. Updates still queued in
+    memory when the front process dies are routed again on the next start;
+    workers skip the ones they had handled (DeduplicationMiddleware).
+    """
+
+    def __init__(self, path=DATABASE_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+    def add_many(self, updates: List[dict]):
+        """Store received updates in one transaction"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO update_inbox (update_id, data, received_at) VALUES (?, ?, ?)",
+                [(update['update_id'], json.dumps(update, ensure_ascii=False), now) for update in updates]
+            )
+
+    def pending(self) -> List[dict]:
+        """Stored updates not handled yet, oldest first"""
+        self.trim()
+        rows = self.conn.execute("SELECT data FROM update_inbox ORDER BY update_id").fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def trim(self) -> int:
+        """Remove updates that workers have handled"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "DELETE FROM update_inbox WHERE update_id IN (SELECT update_id FROM processed_updates)"
+            )
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
@@ -2,16 +2,46 @@
 from datetime import datetime
 from html import escape
 
+from config import FLAG_DUPLICATE_IMAGE, FLAG_SIMILAR_IMAGE, FLAG_SIMILAR_TEXT, FLAG_BLOCKLIST
+
 def escape_html(text: str) -> str:
     """Escape HTML special characters in text"""
     return escape(text) if text else ""
 
+def get_idempotency_key(message) -> str:
+    """Key of the message a post/feedback is created from (same for a redelivered update)"""
+    return f"{message.chat.id}:{message.message_id}"
+
 def format_datetime(dt_str: str) -> str:
-    """Format database datetime string to readable format"""
+    """Format database datetime string (or datetime) to readable format"""
     if not dt_str:
         return "Неизвестно"
+    if isinstance(dt_str, datetime):
+        return dt_str.strftime("%d.%m.%Y %H:%M")
     try:
         dt = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S")
         return dt.strftime("%d.%m.%Y %H:%M")
     except ValueError:
-        return dt_str
\ No newline at end of file
+        return dt_str
+
+def format_flags(flags: list) -> str:
+    """Format moderation flags for a moderation card"""
+    labels = {
+        FLAG_DUPLICATE_IMAGE: "Дубликат изображения",
+        FLAG_SIMILAR_IMAGE: "Похожее изображение",
+        FLAG_SIMILAR_TEXT: "Похожий текст",
+        FLAG_BLOCKLIST: "Запрещённое слово",
+    }
+    targets = {
+        'post': "пост",
+        'feedback': "сообщение",
+    }
+    lines = []
+    for flag in flags or []:
+        line = f"⚠️ {labels.get(flag['kind'], flag['kind'])}"
+        if flag.get('related_id'):
+            line += f" ({targets.get(flag.get('target_type'), 'пост')} #{flag['related_id']})"
+        if flag.get('detail'):
+            line += f": {flag['detail']}"
+        lines.append(line)
+    return "\n".join(lines)
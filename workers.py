@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+from queue import Empty
+from typing import Callable, List, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramRetryAfter
+
+from config import (
+    WORKERS,
+    MAX_PENDING_UPDATES,
+    RUN_MODE,
+    RUN_MODE_WEBHOOK,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    SHUTDOWN_TIMEOUT,
+    SHUTDOWN_GRACE,
+    METRICS_ENABLED,
+    METRICS_PORT,
+    WATCHDOG_ENABLED
+)
+from bot_setup import create_bot, create_dispatcher, load_caches, register_metrics, announce_startup
+import cache_bus
+import image_hash
+import metrics
+from fsm_storage import SQLiteStorage
+from load_manager import load
+from logging_setup import setup_logging, stop_logging
+from loop_watchdog import watchdog
+from outbound import send_later, replay_outbox, PRIORITY_INTERACTIVE
+from shutdown import drain
+from update_log import ProcessedUpdates, UpdateInbox
+from jobs import register_jobs, register_worker_jobs
+from scheduler import JobScheduler
+
+logger = logging.getLogger(__name__)
+
+POLLING_TIMEOUT = 30
+QUEUE_BATCH_SIZE = 100
+
+# Fields of an update event that identify the user it came from
+OWNER_FIELDS = ("from", "user", "chat", "voter_chat")
+
+
+def get_shard_key(update: dict) -> int:
+    """Id of the user (or chat) the raw update belongs to, 0 if there is none"""
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        for field in OWNER_FIELDS:
+            owner = event.get(field)
+            if isinstance(owner, dict) and "id" in owner:
+                return owner["id"]
+    return 0
+
+
+class UpdateWorker:
+    """
+    Handles updates of one shard, each in its own task. Per-user order and the
+    parallelism limit are enforced by OrderedConcurrencyMiddleware.
+    """
+
+    def __init__(self, bot: Bot, dp, max_pending: int = MAX_PENDING_UPDATES):
+        self.bot = bot
+        self.dp = dp
+        self.pending = asyncio.Semaphore(max_pending)
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def run(self, queue):
+        """Handle updates from the queue until the None sentinel"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, self._get_batch, queue)
+            for update in batch:
+                if update is None:
+                    if self.tasks:
+                        await asyncio.wait(self.tasks, timeout=SHUTDOWN_TIMEOUT)
+                    return
+                await self.pending.acquire()
+                self.submit(update)
+
+    @staticmethod
+    def _get_batch(queue) -> List[Optional[dict]]:
+        batch = [queue.get()]
+        while len(batch) < QUEUE_BATCH_SIZE and batch[-1] is not None:
+            try:
+                batch.append(queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def submit(self, update: dict):
+        task = asyncio.create_task(self._process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self.pending.release()
+
+    async def _process(self, update: dict):
+        try:
+            await self.dp.feed_raw_update(self.bot, update)
+        except Exception as e:
+            logger.error("Failed to handle update %s: %s", update.get('update_id'), e, exc_info=True)
+
+
+async def _worker_main(number: int, queue, ready, session_factory: Optional[Callable[[], BaseSession]]):
+    # Remember the current cache event before loading, so nothing is missed in between
+    cache_bus.poll()
+    load_caches()
+
+    bot = create_bot(session=session_factory()) if session_factory else create_bot()
+    storage = SQLiteStorage()
+    storage.load()
+    processed_updates = ProcessedUpdates()
+    processed_updates.load()
+    scheduler = JobScheduler()
+    dp = create_dispatcher(storage=storage, processed_updates=processed_updates, scheduler=scheduler)
+    register_worker_jobs(scheduler, storage)
+    scheduler.start()
+    load.start()
+    if WATCHDOG_ENABLED:
+        watchdog.start()
+    listener = asyncio.create_task(cache_bus.listen())
+    metrics_runner = None
+    if METRICS_ENABLED:
+        register_metrics(bot, dp, storage)
+        metrics_runner = await metrics.start_server(port=METRICS_PORT + 1 + number)
+
+    ready.set()
+    logger.info("Worker %s started", number)
+    try:
+        await UpdateWorker(bot, dp).run(queue)
+    finally:
+        listener.cancel()
+        await scheduler.stop(SHUTDOWN_TIMEOUT)
+        await drain(bot)
+        await watchdog.stop()
+        await load.stop()
+        await storage.close()
+        await processed_updates.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        image_hash.shutdown()
+        logger.info("Worker %s stopped", number)
+
+
+def run_worker(number: int, queue, ready, session_factory: Optional[Callable[[], BaseSession]] = None):
+    """Entry point of a worker process"""
+    # Shutdown is driven by the front process through the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_logging()
+    try:
+        asyncio.run(_worker_main(number, queue, ready, session_factory))
+    finally:
+        stop_logging()
+
+
+class WorkerPool:
+    """Worker processes, each with its own queue of raw updates"""
+
+    def __init__(self, count: int = WORKERS, target: Callable = run_worker, args: tuple = ()):
+        self.context = multiprocessing.get_context("spawn")
+        self.target = target
+        self.args = args
+        self.queues = [self.context.Queue() for _ in range(count)]
+        self.ready = [self.context.Event() for _ in range(count)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * count
+        self.stopping = False
+
+    def _spawn(self, number: int):
+        self.ready[number].clear()
+        process = self.context.Process(
+            target=self.target,
+            args=(number, self.queues[number], self.ready[number], *self.args),
+            name=f"worker-{number}"
+        )
+        process.start()
+        self.processes[number] = process
+
+    def start(self):
+        for number in range(len(self.queues)):
+            self._spawn(number)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return all(event.wait(timeout) for event in self.ready)
+
+    def route(self, update: dict):
+        """Queue raw update to the worker owning its user"""
+        self.queues[get_shard_key(update) % len(self.queues)].put(update)
+
+    def restart_dead(self):
+        """Restart crashed workers, their queued updates are kept"""
+        if self.stopping:
+            return
+        for number, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error("Worker %s exited with code %s, restarting", number, process.exitcode)
+                self._spawn(number)
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT * 3 + SHUTDOWN_GRACE + 10):
+        """Let workers finish queued updates and exit (blocking)"""
+        # Worker waits for its handlers, jobs and sends in turn, each up to SHUTDOWN_TIMEOUT
+        self.stopping = True
+        for queue in self.queues:
+            queue.put(None)
+        for number, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                logger.error("Worker %s did not stop in %ss, terminating", number, timeout)
+                process.terminate()
+                process.join()
+
+
+async def supervise(pool: WorkerPool, inbox: UpdateInbox, interval: float = 5):
+    while True:
+        await asyncio.sleep(interval)
+        pool.restart_dead()
+        try:
+            inbox.trim()
+        except Exception as e:
+            logger.error("Failed to trim update inbox: %s", e)
+
+
+async def poll_updates(bot: Bot, pool: WorkerPool, inbox: UpdateInbox, allowed_updates: List[str]):
+    """
+    Long polling that only hands raw updates over to the workers. The offset
+    is confirmed by the next getUpdates call, after the batch is stored in
+    the inbox.
+    """
+    offset = None
+    backoff = 1
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset,
+                timeout=POLLING_TIMEOUT,
+                allowed_updates=allowed_updates,
+                request_timeout=int(bot.session.timeout + POLLING_TIMEOUT)
+            )
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except Exception as e:
+            logger.error("Failed to get updates: %s, retrying in %ss", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+            continue
+        backoff = 1
+        if not updates:
+            continue
+        raw_updates = [update.model_dump(mode="json", exclude_none=True, by_alias=True) for update in updates]
+        inbox.add_many(raw_updates)
+        for update in raw_updates:
+            pool.route(update)
+        offset = updates[-1].update_id + 1
+
+
+async def start_webhook_server(bot: Bot, pool: WorkerPool, inbox: UpdateInbox,
+                               allowed_updates: List[str]) -> web.AppRunner:
+    """Webhook endpoint that only checks the secret and hands raw updates over to the workers"""
+    async def handle_update(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = await request.json()
+        # Telegram does not resend an answered update, so it is stored first
+        inbox.add_many([update])
+        pool.route(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT).start()
+    logger.info("Webhook server listening on %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=allowed_updates
+        )
+    return runner
+
+
+async def run_front(bot: Bot, count: int = WORKERS):
+    """
+    Receive updates in this process and handle them in `count` worker
+    processes until SIGINT/SIGTERM. Global jobs run here, once.
+    """
+    # Dispatcher is only built to know which update types the routers handle
+    allowed_updates = create_dispatcher().resolve_used_update_types()
+    loop = asyncio.get_running_loop()
+
+    pool = WorkerPool(count)
+    pool.start()
+    # Updates received before the last stop or crash that were never handled
+    inbox = UpdateInbox()
+    unhandled = inbox.pending()
+    for update in unhandled:
+        pool.route(update)
+    if unhandled:
+        logger.warning("Routing %s updates received but not handled before the last stop", len(unhandled))
+    if await loop.run_in_executor(None, pool.wait_ready, 60):
+        logger.info("%s workers are ready", count)
+    else:
+        logger.warning("Not all workers started in 60s, their updates stay queued")
+
+    scheduler = JobScheduler()
+    register_jobs(scheduler, bot)
+    scheduler.start()
+    supervisor = asyncio.create_task(supervise(pool, inbox))
+    metrics_runner = None
+    if METRICS_ENABLED:
+        register_metrics(bot)
+        metrics_runner = await metrics.start_server()
+    # Messages that were not sent before the last shutdown
+    send_later(replay_outbox(bot), PRIORITY_INTERACTIVE)
+    await announce_startup(bot)
+
+    stop_event = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    runner = None
+    poller = None
+    try:
+        if RUN_MODE == RUN_MODE_WEBHOOK:
+            runner = await start_webhook_server(bot, pool, inbox, allowed_updates)
+        else:
+            poller = asyncio.create_task(poll_updates(bot, pool, inbox, allowed_updates))
+        await stop_event.wait()
+    finally:
+        if poller:
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+        if runner:
+            await runner.cleanup()
+        supervisor.cancel()
+        await scheduler.stop(SHUTDOWN_TIMEOUT)
+        await loop.run_in_executor(None, pool.stop)
+        inbox.trim()
+        inbox.close()
+        await drain(bot)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        logger.info("Bot stopped")